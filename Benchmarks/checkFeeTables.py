@@ -0,0 +1,134 @@
+import argparse
+import os
+import random  # Seeded, so the same arguments always check the same documents
+import shutil
+import sys
+import tempfile
+
+from bs4 import BeautifulSoup
+
+import generateFixtures
+from runBenchmarks import default_fixtures, import_task, load_corpus, repository_root
+
+# Markup the fee table extraction of Task 2 must read the way BeautifulSoup reads the whole document. {fee} is
+# replaced with the shareholder fee tables of a fund
+malformed_cases = [
+    ("table tag in an attribute value", '<div title="<table>">{fee}</div>'),
+    ("table tag in a query string", '<a href="getdocument.asp?a=1&b=<table>">{fee}</a>'),
+    ("table tag in CDATA", '<p><![CDATA[<table><tr><td>Maximum]]></p>{fee}'),
+    ("table tag in a textarea", '<textarea><table><tr><td>Maximum</textarea>{fee}'),
+    ("table tags in comments", '<!-- <table> -->{fee}<!-- </table> -->'),
+    ("table tags in a script", '<script>var s = "<table><tr><td>Maximum";</script>{fee}<script>s = "</table>";</script>'),
+    ("table end tag in a style", '<style>/* </table> */</style>{fee}'),
+    ("unquoted attribute ending in a slash", '<table border=1/><tr><td>Maximum Sales Charge</td><td>5.75%</td></tr></table>{fee}'),
+    ("self-closing table", '<table/>{fee}'),
+    ("end tag of an element opened before the table", '<div><table><tr><td>Maximum Sales Charge</td></tr></div><p>After</p></table>{fee}'),
+    ("stray table end tag", '</table>{fee}</table>'),
+    ("stray table end tag inside a cell", '<table><tr><td>Maximum</td></tr><tr><td></table></td></tr></table>{fee}'),
+    ("nested tables", '<table><tr><td>{fee}</td></tr><tr><td>Maximum Account Fee</td></tr></table>'),
+    ("upper case tags", '<TABLE><TR><TD>Maximum Sales Charge</TD></TR></TABLE >{fee}'),
+    ("tag split over lines", '<table\n  class="fees"\n><tr><td>Maximum\nSales Charge</td></tr></table\n>{fee}'),
+    ("character references", '<table><tr><td>Max&#105;mum &amp; Minimum</td></tr><tr><td>&#x4d;aximum</td></tr></table>{fee}'),
+    ("text split by tags", '<table><tr><td>Max<b>imum</b></td><td>Max<!-- note -->imum</td></tr></table>{fee}'),
+    ("text split by a script", '<table><tr><td>Max<script>x</script>imum</td></tr></table>{fee}'),
+    ("text in CDATA", '<table><tr><td><![CDATA[Maximum]]></td></tr></table>{fee}'),
+    ("text in a template", '<table><tr><td><template>Maximum</template></td></tr></table>{fee}'),
+    ("greater-than sign in an attribute value", '<table><tr><td title="a>b">Max</td><td>imum</td></tr></table>{fee}'),
+    ("void elements and their end tags", '<br></br><table><tr><td>Maximum<br></td><td><img src="x"></img></td></tr></table>{fee}'),
+    ("whitespace in a pre", '<pre><table><tr><td>  Maximum  </td></tr></table></pre>{fee}'),
+    ("unclosed table", '{fee}<table><tr><td>Maximum Sales Charge'),
+]
+
+
+def baseline_tables(content):
+    # The extraction before the table spans: every table of the whole document parsed with BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    return [str(table) for table in soup.find_all('table') if 'Maximum' in table.text]
+
+
+def insert_case(html, template, rng):
+    """
+    Inserts the markup of a case between two tags of a document, or at its end for the cases leaving a table open.
+
+    Parameters:
+    - html (str): The document.
+    - template (str): The markup of the case, with {fee} in place of the fee tables.
+    - rng (random.Random): Chooses the position and the share classes of the fee tables.
+
+    Returns:
+    - str: The document with the markup inserted.
+    """
+    classes = generateFixtures.share_classes[:rng.randint(1, len(generateFixtures.share_classes))]
+    markup = template.replace('{fee}', generateFixtures.fee_table(classes, rng))
+    if template.startswith('{fee}<table>'):
+        return html + markup
+    positions = [index for index, character in enumerate(html) if character == '<']
+    position = rng.choice(positions) if positions else 0
+    return html[:position] + markup + html[position:]
+
+
+def check_fee_tables(fixtures=default_fixtures, variants=100, seed=0):
+    """
+    Compares the fee tables found by extract_all_relevant_tables with the tables of the whole document parsed with
+    BeautifulSoup, on the fixtures, on every malformed case inserted in every fixture and on fixtures with several
+    cases inserted at random.
+
+    Parameters:
+    - fixtures (str): Directory of the fixture corpus.
+    - variants (int): Number of documents with several random cases inserted.
+    - seed (int): Seed of the random positions and cases.
+
+    Returns:
+    - list: Description of every document whose tables differ.
+    """
+    corpus = load_corpus(fixtures)
+    previous_directory = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="fee-table-check-")
+    try:
+        # The Task 2 script reads its configuration and caches relative to the working directory
+        shutil.copy(os.path.join(repository_root, "Task2_Extract_ClassInfo_LoadType", "config.yaml"), workdir)
+        os.environ["PROSPECTUS_CACHE_DIR"] = os.path.join(workdir, ".prospectus_cache")
+        os.chdir(workdir)
+        task2 = import_task("Task2_Extract_ClassInfo_LoadType", "Task2_Extract_Class_LoadType")
+
+        rng = random.Random(seed)
+        documents = []
+        for rfid, document in corpus.items():
+            html = document["html"].decode("utf-8")
+            documents.append((rfid, html))
+            for name, template in malformed_cases:
+                documents.append((rfid + ", " + name, insert_case(html, template, rng)))
+        for index in range(variants):
+            rfid = rng.choice(sorted(corpus))
+            html = corpus[rfid]["html"].decode("utf-8")
+            names = []
+            for name, template in rng.sample(malformed_cases, 3):
+                html = insert_case(html, template, rng)
+                names.append(name)
+            documents.append((rfid + ", " + " + ".join(names), html))
+
+        mismatches = []
+        for description, html in documents:
+            content = html.encode("utf-8")
+            tables = [str(table) for table in task2.extract_all_relevant_tables(description, content) or []]
+            expected = baseline_tables(content)
+            if tables != expected:
+                mismatches.append("%s: %d tables instead of %d" % (description, len(tables), len(expected)))
+        print("Checked %d documents, %d mismatches" % (len(documents), len(mismatches)))
+        return mismatches
+    finally:
+        os.chdir(previous_directory)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the Task 2 fee table extraction against the whole-document parse.")
+    parser.add_argument("--fixtures", default=default_fixtures, help="directory of the fixture corpus")
+    parser.add_argument("--variants", type=int, default=100, help="documents with several random malformed cases")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    mismatches = check_fee_tables(args.fixtures, args.variants, args.seed)
+    for mismatch in mismatches:
+        print("  " + mismatch)
+    sys.exit(1 if mismatches else 0)
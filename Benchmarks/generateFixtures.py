@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import random  # Seeded, so the same arguments always produce the same corpus
+
+# Fixture corpus checked in next to this script
+fixtures_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Fixtures")
+
+# Documents of the checked-in corpus: (RFID, number of funds, approximate size in KB)
+default_corpus = [("9000001", 2, 100), ("9000002", 4, 200), ("9000003", 6, 400)]
+
+fund_families = ["Harbor Point", "Northbridge", "Cedar Ridge", "Atlas Capital", "Blue Heron", "Granite Peak"]
+fund_styles = ["High Yield Municipal Bond", "Short Duration Income", "Strategic Municipal Opportunities",
+               "Global Equity", "Small Cap Value", "Core Plus Bond", "Emerging Markets Debt", "Balanced Allocation",
+               "Large Cap Growth", "Inflation Protected Securities", "Ultra Short Bond", "Real Estate Income"]
+share_classes = ["Class A", "Class C", "Class I", "Class R6"]
+
+filler_sentences = [
+    "The value of your investment may fall, sometimes sharply, and you could lose money.",
+    "Interest rate risk is the risk that the value of the Fund&#8217;s portfolio will decline because of rising interest rates.",
+    "Credit risk is the risk that an issuer of a debt security may be unable to make interest payments and repay principal.",
+    "The Fund may invest in securities of issuers located in the same geographic region, which increases its exposure to local events.",
+    "Liquidity risk is the risk that the Fund may not be able to sell a holding in a timely manner at a desired price.",
+    "Market conditions can change rapidly and may adversely affect the prices of securities held by the Fund.",
+    "Investments in lower rated securities involve greater risk of default and price volatility than higher rated securities.",
+    "The sub-adviser uses a disciplined, research driven process to identify attractively valued securities.",
+    "Past performance (before and after taxes) is not necessarily an indication of how the Fund will perform in the future.",
+    "Portfolio holdings are reviewed regularly and may be sold when they no longer meet the investment criteria.",
+]
+
+field_sections = [
+    ("Purchase and Sale of Fund Shares",
+     ["The minimum initial investment for Class A and Class C shares is $1,000 and the minimum subsequent investment is $100.",
+      "You may purchase or redeem shares on any day the New York Stock Exchange is open, at the net asset value (NAV) next "
+      "calculated after your order is received in good order before 4:00 p.m. Eastern time."]),
+    ("Reinstatement Privilege",
+     ["If you redeem shares, you may reinvest all or part of the proceeds within 90 days in the same class of shares without a "
+      "sales charge. The Fund will reimburse any CDSC paid on the redemption by crediting your account."]),
+    ("Contingent Deferred Sales Charge Waivers",
+     ["The CDSC will be waived for redemptions following the death or disability of a shareholder, for required minimum "
+      "distributions from retirement plans after age 72, for distributions from 401(k) and SIMPLE IRA plans, and for "
+      "redemptions made under a Systematic Withdrawal Plan of up to 12% per year."]),
+    ("Systematic Withdrawal Plan",
+     ["You may arrange automatic periodic withdrawals of $50 or more on a monthly, quarterly or annual schedule."]),
+    ("Exchanging Shares by Telephone",
+     ["You may exchange shares of the Fund for shares of the same class of another fund by calling 1-800-555-0199. "
+      "Telephone redemption privileges are available unless you decline them."]),
+    ("Dividends, Distributions and Taxes",
+     ["The Fund declares dividends daily and pays them monthly. Capital gains, if any, are distributed annually. "
+      "Distributions are taxable as ordinary income or capital gains for federal income tax purposes unless you invest "
+      "through a tax-advantaged arrangement."]),
+    ("Frequent Purchases and Redemptions",
+     ["The Board has adopted policies designed to discourage frequent trading. The Fund limits shareholders to four round "
+      "trips (purchases into and redemptions out of the Fund) per year."]),
+    ("Fund Service Providers",
+     ["KPMG LLP, an independent registered public accounting firm, audits the Financial Highlights of the Fund. "
+      "State Street Bank and Trust Company serves as custodian and as administrator of the Fund."]),
+    ("Electronic Delivery",
+     ["Shareholders may elect to receive prospectuses and reports by electronic delivery at www.example-funds.com."]),
+    ("Purchases by Wire",
+     ["Wire purchases should be sent to the transfer agent, ABA routing number 011000028, DDA account 9905-xxx, FFC your account."]),
+]
+
+
+def paragraph(text, rng):
+    # Markup in the style of EDGAR filings: styled paragraphs wrapping a span
+    style = rng.choice(["margin:0pt 0pt 6pt", "margin-top:6pt;text-align:justify", "margin:0pt"])
+    return '<p style="' + style + '"><span style="font-family:Times New Roman;font-size:10pt">' + text + '</span></p>\n'
+
+
+def fee_table(classes, rng):
+    front = ["4.25%" if c == "Class A" else "None" for c in classes]
+    back = ["None" if c != "Class C" else "1.00%" for c in classes]
+    rows = [[""] + classes,
+            ["Maximum Sales Charge (Load) Imposed on Purchases (as a percentage of offering price)"] + front,
+            ["Maximum Deferred Sales Charge (Load) (as a percentage of the lesser of purchase price or redemption proceeds)"] + back,
+            ["Exchange Fee"] + ["None" for _ in classes]]
+    html = '<table style="width:100%;border-collapse:collapse">\n'
+    for row in rows:
+        html += "<tr>" + "".join('<td style="padding:2pt"><p>' + cell + "</p></td>" for cell in row) + "</tr>\n"
+    html += "</table>\n"
+    expenses = ["Management Fees", "Distribution and Service (12b-1) Fees", "Other Expenses", "Total Annual Fund Operating Expenses"]
+    html += '<table style="width:100%">\n'
+    for name in expenses:
+        html += "<tr><td>" + name + "</td>" + "".join("<td>%.2f%%</td>" % rng.uniform(0.05, 1.2) for _ in classes) + "</tr>\n"
+    html += "</table>\n"
+    return html
+
+
+def fund_section(fund, classes, filler_bytes, rng):
+    html = '<div style="page-break-before:always"><p style="font-weight:bold;font-size:14pt">' + fund + "</p></div>\n"
+    html += '<p style="font-weight:bold">Investment Objective</p>\n'
+    html += paragraph("The Fund seeks to provide a high level of current income exempt from regular federal income taxes.", rng)
+    html += '<p style="font-weight:bold">Fees and Expenses of the Fund</p>\n'
+    html += paragraph("This table describes the fees and expenses that you may pay if you buy, hold and sell shares of the Fund. "
+                      "You may qualify for sales charge discounts if you invest at least $100,000 in the fund family.", rng)
+    html += paragraph("Shareholder Fees (fees paid directly from your investment)", rng)
+    html += fee_table(classes, rng)
+    html += '<p style="font-weight:bold">Principal Investment Strategies</p>\n'
+    html += paragraph("Under normal market conditions, the Fund invests at least 80% of its net assets in municipal bonds. "
+                      "The Fund is non-diversified and may invest a larger portion of its assets in fewer issuers.", rng)
+    html += '<p style="font-weight:bold">Principal Risks</p>\n'
+    written = 0
+    while written < filler_bytes:
+        text = " ".join(rng.choice(filler_sentences) for _ in range(rng.randint(2, 6)))
+        block = '<div><div style="margin-left:12pt">' + paragraph(text, rng) + "</div></div>\n"
+        html += block
+        written += len(block)
+    return html
+
+
+def generate_document(rfid, fund_count, size_kb, seed=0):
+    """
+    Generates a synthetic prospectus with the structure the tasks rely on: a cover page listing the funds, and per
+    fund the investment objective, the shareholder fee table and the risk sections, followed by the shareholder
+    information sections containing the Task 3 fields.
+
+    Parameters:
+    - rfid (str): RFID of the document, also used to seed the generator.
+    - fund_count (int): Number of funds in the prospectus.
+    - size_kb (int): Approximate size of the document in kilobytes.
+    - seed (int): Extra seed, to generate different documents for the same RFID.
+
+    Returns:
+    - tuple: The HTML of the document and the list of its fund names.
+    """
+    rng = random.Random(str(rfid) + ":" + str(seed))
+    family = rng.choice(fund_families)
+    funds = [family + " " + style + " Fund" for style in rng.sample(fund_styles, fund_count)]
+    classes = share_classes[:rng.randint(2, len(share_classes))]
+
+    html = "<!DOCTYPE html>\n<html><head><title>Prospectus</title>\n"
+    html += "<style>p { margin: 0 } td { vertical-align: top }</style>\n"
+    html += '<script type="text/javascript">var documentId = "' + str(rfid) + '";</script>\n</head><body>\n'
+
+    # Cover page: fund names and tickers, as the fund-name prompt of Task 1 expects
+    html += '<div><p style="font-size:16pt">Prospectus&nbsp;&nbsp;August 1, 2023</p>\n<table>\n'
+    html += "<tr><td>Fund Name</td>" + "".join("<td>" + c + "</td>" for c in classes) + "</tr>\n"
+    for fund in funds:
+        tickers = ["".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(4)) + "X" for _ in classes]
+        html += "<tr><td>" + fund + "</td>" + "".join("<td>" + t + "</td>" for t in tickers) + "</tr>\n"
+    html += "</table>\n"
+    html += paragraph("The Securities and Exchange Commission has not approved or disapproved these securities or passed "
+                      "upon the adequacy of this prospectus. Any representation to the contrary is a criminal offense.", rng)
+    html += "</div>\n<!-- table of contents -->\n"
+
+    shared = "".join('<p style="font-weight:bold">' + title + "</p>\n" + "".join(paragraph(text, rng) for text in texts)
+                     for title, texts in field_sections)
+    filler_bytes = max(0, (size_kb * 1024 - len(html) - len(shared)) // fund_count)
+    for fund in funds:
+        html += fund_section(fund, classes, filler_bytes, rng)
+    html += shared
+    html += "</body></html>\n"
+    return html, funds
+
+
+def write_corpus(directory=fixtures_directory, corpus=None, seed=0):
+    """
+    Writes the documents of a corpus and a manifest.json listing their RFIDs, fund names and sizes.
+
+    Parameters:
+    - directory (str): Output directory.
+    - corpus (list): (RFID, number of funds, size in KB) of every document; the checked-in corpus by default.
+    - seed (int): Extra seed of the generator.
+
+    Returns:
+    - dict: The manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for rfid, fund_count, size_kb in (corpus or default_corpus):
+        html, funds = generate_document(rfid, fund_count, size_kb, seed)
+        with open(os.path.join(directory, rfid + ".html"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(html)
+        manifest[rfid] = {"funds": funds, "bytes": len(html.encode("utf-8"))}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8", newline="\n") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the synthetic prospectus corpus used by the benchmarks.")
+    parser.add_argument("--output", default=fixtures_directory, help="output directory (default: the checked-in fixtures)")
+    parser.add_argument("--documents", type=int, default=None, help="generate this many documents instead of the default corpus")
+    parser.add_argument("--size-kb", type=int, default=400, help="approximate size of every generated document")
+    parser.add_argument("--funds", type=int, default=4, help="number of funds per generated document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = None
+    if args.documents is not None:
+        corpus = [(str(9100000 + i), args.funds, args.size_kb) for i in range(args.documents)]
+    manifest = write_corpus(args.output, corpus, args.seed)
+    print("Wrote " + str(len(manifest)) + " documents to " + args.output)
@@ -0,0 +1,97 @@
+import copy
+
+
+class MemoryCollection:
+    """
+    In-memory stand-in for the few pymongo Collection methods the tasks read with, so the benchmarks do not depend
+    on a MongoDB server. Filters are matched on equality of top-level fields, or membership for $in.
+
+    Parameters:
+    - name (str): Full name of the collection, for messages.
+    """
+
+    def __init__(self, name):
+        self.full_name = name
+        self.name = name.split('.', 1)[-1]
+        self.documents = []
+
+    def _matches(self, document, filter):
+        for key, value in (filter or {}).items():
+            if isinstance(value, dict) and '$in' in value:
+                if document.get(key) not in value['$in']:
+                    return False
+            elif document.get(key) != value:
+                return False
+        return True
+
+    def _project(self, document, projection):
+        if not projection:
+            return copy.deepcopy(document)
+        included = [key for key, value in projection.items() if value and key != '_id']
+        if not included:
+            # Exclusion projection: every field but the excluded ones
+            return {key: copy.deepcopy(value) for key, value in document.items() if key not in projection}
+        return {key: copy.deepcopy(document[key]) for key in included if key in document}
+
+    def find(self, filter=None, projection=None):
+        return [self._project(document, projection) for document in self.documents if self._matches(document, filter)]
+
+    def find_one(self, filter=None, projection=None):
+        for document in self.documents:
+            if self._matches(document, filter):
+                return self._project(document, projection)
+        return None
+
+    def insert_many(self, documents):
+        self.documents.extend(copy.deepcopy(document) for document in documents)
+
+    def create_index(self, keys, **kwargs):
+        return None
+
+
+class MemoryClient:
+    """
+    In-memory stand-in for MongoClient: databases and collections are created on first access.
+    """
+
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, database):
+        return MemoryDatabase(self, database)
+
+    def __getattr__(self, database):
+        if database.startswith('_'):
+            raise AttributeError(database)
+        return self[database]
+
+    def collection(self, database, name):
+        key = database + '.' + name
+        if key not in self.databases:
+            self.databases[key] = MemoryCollection(key)
+        return self.databases[key]
+
+
+class MemoryDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, collection):
+        return self.client.collection(self.name, collection)
+
+
+def install(mongo_client_module):
+    """
+    Replaces the shared client of CommonHelpers.mongoClient with an in-memory client.
+
+    Parameters:
+    - mongo_client_module (module): The imported CommonHelpers.mongoClient module.
+
+    Returns:
+    - MemoryClient: The client every task now reads from and writes to.
+    """
+    client = MemoryClient()
+    mongo_client_module.get_client = lambda connection_string, **kwargs: client
+    mongo_client_module.get_collection = lambda connection_string, database, collection, **kwargs: client[database][collection]
+    return client
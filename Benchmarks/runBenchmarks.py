@@ -0,0 +1,575 @@
+import argparse
+import contextlib  # For silencing the progress output of the tasks while they are timed
+import datetime
+import gc
+import importlib
+import io
+import json
+import os
+import platform
+import random  # Seeded, for the synthetic paragraph lists
+import shutil
+import statistics
+import subprocess  # For recording the git revision that was measured
+import sys
+import tempfile
+import time
+import tracemalloc  # For the peak memory of every stage
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+repository_root = os.path.dirname(benchmarks_directory)
+default_fixtures = os.path.join(benchmarks_directory, "Fixtures")
+default_results = os.path.join(benchmarks_directory, "Results")
+
+# Placeholder MongoDB parameters written to the working directory; the in-memory client replaces the server
+mongo_parameters = ["mongodb://benchmark.invalid", "benchmark", "Task1_Benchmark", "Task3_Benchmark"]
+
+# Relative slowdown (or memory growth) reported as a regression by --compare
+default_threshold = 0.10
+
+sys.path.append(benchmarks_directory)
+sys.path.append(repository_root)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=repository_root,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_corpus(fixtures):
+    """
+    Reads the manifest and the documents of a fixture corpus.
+
+    Parameters:
+    - fixtures (str): Directory holding manifest.json and one <RFID>.html file per document.
+
+    Returns:
+    - dict: Maps every RFID to its 'funds', 'html' (bytes) and 'bytes'.
+    """
+    with open(os.path.join(fixtures, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    corpus = {}
+    for rfid in sorted(manifest):
+        with open(os.path.join(fixtures, rfid + ".html"), "rb") as f:
+            html = f.read()
+        corpus[rfid] = {"funds": manifest[rfid]["funds"], "html": html, "bytes": len(html)}
+    return corpus
+
+
+def prepare_environment(workdir, corpus):
+    """
+    Sets up an isolated working directory the task scripts can be imported from: placeholder MongoDB parameters,
+    the Task 2 configuration, the Task 1 prompt, a document cache seeded with the corpus and a local GPT stub server.
+
+    Parameters:
+    - workdir (str): Empty working directory.
+    - corpus (dict): The corpus returned by load_corpus.
+
+    Returns:
+    - dict: The in-memory MongoDB client and the stub server ('mongo', 'llm_server').
+    """
+    with open(os.path.join(workdir, "mongodbConnectionParameters.txt"), "w") as f:
+        f.write("\n".join(mongo_parameters))
+    shutil.copy(os.path.join(repository_root, "Task2_Extract_ClassInfo_LoadType", "config.yaml"), workdir)
+    os.makedirs(os.path.join(workdir, "Task1_Extracting_FundNames"))
+    shutil.copy(os.path.join(repository_root, "Task1_Extracting_FundNames", "Task1GptTrainMessage.json"),
+                os.path.join(workdir, "Task1_Extracting_FundNames"))
+
+    # The shared helpers read their settings from the environment when they are imported
+    os.environ["PROSPECTUS_CACHE_DIR"] = os.path.join(workdir, ".prospectus_cache")
+    os.environ["PROSPECTUS_CACHE_REVALIDATE_SECONDS"] = str(10 ** 9)
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, ".llm_cache", "responses.sqlite")
+
+    from CommonHelpers import llmStubServer
+    llm_server = llmStubServer.start_stub_server()
+    os.environ["OPENAI_API_BASE"] = llm_server.api_base
+
+    from CommonHelpers import documentCache
+    for rfid, document in corpus.items():
+        documentCache.store_document(documentCache.prospectus_url(rfid), document["html"], "utf-8")
+
+    mongo = None
+    try:
+        from CommonHelpers import mongoClient
+        import memoryMongo
+        mongo = memoryMongo.install(mongoClient)
+    except ImportError as e:
+        print("MongoDB helpers unavailable (" + str(e) + "), the tasks using them will be skipped")
+
+    os.chdir(workdir)
+    return {"mongo": mongo, "llm_server": llm_server}
+
+
+def import_task(folder, module_name):
+    # The task scripts are not packages: they are imported from their own folder, as when they are run
+    path = os.path.join(repository_root, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module_name)
+
+
+class StageRunner:
+    """
+    Times the stages and collects their results.
+
+    Every stage runs `repeat` times for the wall time (the median is reported), then once more under tracemalloc for
+    the peak memory, which is measured separately because tracing slows the code down.
+
+    Parameters:
+    - repeat (int): Number of timed runs of every stage.
+    - selected (list): Prefixes of the stage names to run; all stages when empty.
+    - verbose (bool): Keep the output printed by the tasks.
+    """
+
+    def __init__(self, repeat=3, selected=None, verbose=False):
+        self.repeat = max(1, repeat)
+        self.selected = selected or []
+        self.verbose = verbose
+        self.stages = {}
+
+    def wanted(self, name):
+        return not self.selected or any(name.startswith(prefix) for prefix in self.selected)
+
+    def skip(self, names, reason):
+        for name in names:
+            if self.wanted(name):
+                self.stages[name] = {"status": "skipped", "reason": reason}
+                print("%-70s skipped: %s" % (name, reason))
+
+    def _call(self, function):
+        if self.verbose:
+            return function()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+
+    def run(self, name, function, items, data_bytes=None, setup=None):
+        """
+        Runs and measures one stage.
+
+        Parameters:
+        - name (str): Name of the stage in the report.
+        - function (callable): Runs the whole stage over the corpus and returns its result.
+        - items (int): Number of items (documents, tables, paragraphs) the stage processes.
+        - data_bytes (int): Size of the documents processed, for the MB/s throughput.
+        - setup (callable): Called before every run of the stage, outside the measurements (e.g. to clear the
+          caches the stage would otherwise hit from the previous run).
+
+        Returns:
+        - The result of the stage, or None if it was not selected or failed.
+        """
+        if not self.wanted(name):
+            return None
+        try:
+            timings = []
+            result = None
+            for _ in range(self.repeat):
+                if setup is not None:
+                    setup()
+                gc.collect()
+                start = time.perf_counter()
+                result = self._call(function)
+                timings.append(time.perf_counter() - start)
+
+            if setup is not None:
+                setup()
+            gc.collect()
+            tracemalloc.start()
+            try:
+                self._call(function)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        except Exception as e:
+            self.stages[name] = {"status": "failed", "reason": type(e).__name__ + ": " + str(e)}
+            print("%-70s failed: %s" % (name, self.stages[name]["reason"]))
+            return None
+
+        wall = statistics.median(timings)
+        stage = {"status": "ok", "wall_seconds": round(wall, 6), "wall_seconds_min": round(min(timings), 6),
+                 "peak_memory_bytes": peak, "items": items,
+                 "items_per_second": round(items / wall, 3) if wall > 0 else None}
+        if data_bytes is not None:
+            stage["megabytes_per_second"] = round(data_bytes / 1024 ** 2 / wall, 3) if wall > 0 else None
+        self.stages[name] = stage
+        print("%-70s %9.4fs %10.1f items/s %8.1f MB peak" % (name, wall, stage["items_per_second"] or 0, peak / 1024 ** 2))
+        return result
+
+
+def benchmark_task1(runner, corpus, mongo):
+    stage_names = ["task1.get_offsets"]
+    try:
+        task1 = import_task("Task1_Extracting_FundNames", "Task1Extracting_Fund_Names_and_Offsets")
+    except ImportError as e:
+        runner.skip(stage_names, "missing dependency: " + str(e))
+        return
+
+    fund_names = {rfid: document["funds"] for rfid, document in corpus.items()}
+    data_bytes = sum(document["bytes"] for document in corpus.values())
+    offsets = runner.run("task1.get_offsets", lambda: task1.get_offsets(list(corpus), fund_names), len(corpus), data_bytes)
+
+    # The Task 1 documents are what Task 3 reads the fund offsets from
+    if offsets and mongo is not None:
+        collection = mongo[mongo_parameters[1]][mongo_parameters[2]]
+        collection.documents = []
+        collection.insert_many(task1.build_documents(list(corpus), offsets[0], offsets[1]))
+
+
+def benchmark_task2(runner, corpus):
+    stage_names = ["task2.extract_all_relevant_tables", "task2.class_level_front_back_load_extract"]
+    try:
+        task2 = import_task("Task2_Extract_ClassInfo_LoadType", "Task2_Extract_Class_LoadType")
+    except ImportError as e:
+        runner.skip(stage_names, "missing dependency: " + str(e))
+        return
+
+    data_bytes = sum(document["bytes"] for document in corpus.values())
+    tables = runner.run("task2.extract_all_relevant_tables",
+                        lambda: {rfid: task2.extract_all_relevant_tables(rfid) for rfid in corpus}, len(corpus), data_bytes)
+    if tables is None:
+        tables = {rfid: task2.extract_all_relevant_tables(rfid) for rfid in corpus}
+
+    def classify():
+        results = {}
+        for rfid, table_list in tables.items():
+            results[rfid] = []
+            for table in task2.get_data_from_table_list(table_list or []):
+                class_list, front_mp, back_mp = task2.class_level_front_back_load_extract(table)
+                results[rfid].append(task2.extract_front_back_load(class_list, front_mp, back_mp, task2.frontend_load,
+                                                                   task2.backend_load, task2.both_load, task2.fund_level))
+        return results
+
+    table_count = sum(len(table_list or []) for table_list in tables.values())
+    runner.run("task2.class_level_front_back_load_extract", classify, table_count)
+
+
+# Sizes of the paragraph lists de-duplicated by the task3.filterParagraphs stages
+filter_paragraph_counts = [100, 1000, 10000]
+
+
+def synthetic_paragraphs(words, count, seed=0):
+    """
+    Builds a list of Task 3 occurrences for de-duplication benchmarks: windows of up to 700 words of a document,
+    and windows contained in other ones, repeated at other offsets or repeated exactly, as the nested sections of
+    a prospectus produce them.
+
+    Parameters:
+    - words (list): Words of the document text.
+    - count (int): Number of paragraphs.
+    - seed (int): Seed of the generator.
+
+    Returns:
+    - list: (text, offset) tuples.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    while len(paragraphs) < count:
+        kind = rng.random()
+        if not paragraphs or kind < 0.6:
+            start = rng.randrange(len(words))
+            paragraphs.append((" ".join(words[start:start + rng.randint(50, 700)]), start))
+        elif kind < 0.85:
+            text, offset = rng.choice(paragraphs)
+            parts = text.split(" ")
+            start = rng.randrange(len(parts))
+            paragraphs.append((" ".join(parts[start:start + rng.randint(20, 200)]), offset + start))
+        elif kind < 0.95:
+            text, offset = rng.choice(paragraphs)
+            paragraphs.append((text, offset + rng.randint(1, 10 ** 6)))
+        else:
+            paragraphs.append(rng.choice(paragraphs))
+    return paragraphs
+
+
+def benchmark_task3(runner, corpus, mongo, all_fields=True):
+    try:
+        task3 = import_task("Task3_Extract_Paragraphs", "Task3_Paragraph_Extraction")
+    except ImportError as e:
+        runner.skip(["task3.document_parse", "task3.section_group", "task3.class_text_extraction",
+                     "task3.multi_field_text_extraction", "task3.field_offsets", "task3.fields_offsets",
+                     "task3.filterParagraphs"],
+                    "missing dependency: " + str(e))
+        return {}
+
+    # Every search pattern of a field, or only the fields the demo extracts
+    if all_fields:
+        elements = sorted(element for element in task3.re_patterns if element in task3.search_strings)
+    else:
+        elements = sorted(set(task3.fieldnames.values()))
+    tagslist = ['span', 'p', 'div', 'table']
+    data_bytes = sum(document["bytes"] for document in corpus.values())
+
+    # Parsed documents, for the stages selecting their sections differently
+    soups = {}
+
+    def parse():
+        documents = {}
+        for rfid in corpus:
+            soup, offset_map = task3.documentParser(task3.documentCache.prospectus_url(rfid), with_offset_map=True)
+            tags_info = [soup.find_all(tag, recursive=True) for tag in tagslist]
+            documents[rfid] = (tags_info, offset_map)
+            soups[rfid] = soup
+        return documents
+
+    documents = runner.run("task3.document_parse", parse, len(corpus), data_bytes) or parse()
+
+    # Texts, sibling chains and expansion flags of the sections, computed once per document by Task3()
+    if hasattr(task3, "SectionGroup"):
+        runner.run("task3.section_group",
+                   lambda: {rfid: task3.SectionGroup(tags_info, tagslist, offset_map)
+                            for rfid, (tags_info, offset_map) in documents.items()},
+                   len(corpus), data_bytes)
+
+    outputs = {}
+    total = {"wall_seconds": 0.0, "peak_memory_bytes": 0, "items": 0}
+    for element in elements:
+        name = "task3.class_text_extraction." + element.replace(' ', '_')
+
+        def extract(element=element):
+            return {rfid: task3.class_text_extraction(element, tags_info, tagslist, offset_map.text, offset_map)
+                    for rfid, (tags_info, offset_map) in documents.items()}
+
+        result = runner.run(name, extract, len(corpus), data_bytes)
+        if result is not None:
+            outputs[element] = result
+            stage = runner.stages[name]
+            total["wall_seconds"] += stage["wall_seconds"]
+            total["peak_memory_bytes"] = max(total["peak_memory_bytes"], stage["peak_memory_bytes"])
+            total["items"] += stage["items"]
+
+    # Sum over the fields, as the Task 3 run of a document extracts every field
+    if outputs:
+        runner.stages["task3.class_text_extraction"] = {
+            "status": "ok", "aggregate": True, "wall_seconds": round(total["wall_seconds"], 6),
+            "peak_memory_bytes": total["peak_memory_bytes"], "items": len(corpus),
+            "items_per_second": round(len(corpus) / total["wall_seconds"], 3) if total["wall_seconds"] > 0 else None}
+
+    # All the fields in a single pass over the sections, as Task3() extracts them
+    if hasattr(task3, "multi_field_text_extraction"):
+        runner.run("task3.multi_field_text_extraction",
+                   lambda: {rfid: task3.multi_field_text_extraction(elements, tags_info, tagslist, offset_map.text, offset_map)
+                            for rfid, (tags_info, offset_map) in documents.items()},
+                   len(corpus), data_bytes)
+
+    # The same, split into chunks of sections extracted by one worker process per CPU
+    if hasattr(task3, "parallel_min_sections"):
+        if (os.cpu_count() or 1) < 2:
+            runner.skip(["task3.multi_field_text_extraction.chunked"], "needs several CPUs")
+        else:
+            runner.run("task3.multi_field_text_extraction.chunked",
+                       lambda: {rfid: task3.multi_field_text_extraction(elements, tags_info, tagslist, offset_map.text, offset_map,
+                                                                        workers=os.cpu_count())
+                                for rfid, (tags_info, offset_map) in documents.items()},
+                       len(corpus), data_bytes)
+
+    # The same, searching only the innermost blocks instead of every nested tag
+    if hasattr(task3, "leaf_sections"):
+        runner.run("task3.multi_field_text_extraction.leaf_blocks",
+                   lambda: {rfid: task3.multi_field_text_extraction(elements, task3.leaf_sections(soups[rfid], tagslist),
+                                                                    tagslist, offset_map.text, offset_map)
+                            for rfid, (tags_info, offset_map) in documents.items()},
+                   len(corpus), data_bytes)
+
+    # The same in a refresh run of unchanged documents: the matches and the de-duplication of the last run are
+    # carried forward, so no section is searched again (the section groups are built in the stage, as a refresh run
+    # builds them)
+    if hasattr(task3, "SectionGroup") and hasattr(task3.SectionGroup, "filter_state"):
+        previous_states = {}
+        for rfid, (tags_info, offset_map) in documents.items():
+            section_group = task3.SectionGroup(tags_info, tagslist, offset_map, keep_state=True)
+            task3.multi_field_text_extraction(elements, tags_info, tagslist, offset_map.text, offset_map, section_group)
+            previous_states[rfid] = (section_group.match_state(elements), section_group.filter_state()[0])
+
+        def carried_forward():
+            results = {}
+            for rfid, (tags_info, offset_map) in documents.items():
+                section_group = task3.SectionGroup(tags_info, tagslist, offset_map, keep_state=True)
+                section_group.carry_forward(previous_states[rfid][0], elements, previous_states[rfid][1])
+                results[rfid] = task3.multi_field_text_extraction(elements, tags_info, tagslist, offset_map.text,
+                                                                  offset_map, section_group)
+            return results
+
+        runner.run("task3.multi_field_text_extraction.carried_forward", carried_forward, len(corpus), data_bytes)
+
+    fund_level =[element for element in outputs if task3.search_strings.get(element) == 'fund']
+    if mongo is None:
+        runner.skip(["task3.field_offsets", "task3.fields_offsets"], "MongoDB helpers unavailable")
+    elif fund_level:
+        paragraph_count = sum(len(outputs[element][rfid]) for element in fund_level for rfid in corpus)
+        runner.run("task3.field_offsets",
+                   lambda: {(element, rfid): task3.field_offsets(outputs[element][rfid], rfid)
+                            for element in fund_level for rfid in corpus},
+                   paragraph_count)
+        # All the fund level fields of a document at once, as Task3() assigns them
+        if hasattr(task3, "fields_offsets"):
+            runner.run("task3.fields_offsets",
+                       lambda: {rfid: task3.fields_offsets({element: outputs[element][rfid] for element in fund_level}, rfid)
+                                for rfid in corpus},
+                       paragraph_count)
+
+    # De-duplication of growing lists of occurrences taken from the largest document
+    if any(runner.wanted("task3.filterParagraphs." + str(count)) for count in filter_paragraph_counts):
+        largest = max(corpus, key=lambda rfid: corpus[rfid]["bytes"])
+        words = documents[largest][1].text.split()
+        for count in filter_paragraph_counts:
+            paragraphs = synthetic_paragraphs(words, count)
+            runner.run("task3.filterParagraphs." + str(count), lambda: task3.filterParagraphs(paragraphs), count,
+                       sum(len(text) for text, _ in paragraphs))
+    return outputs
+
+
+def benchmark_task4(runner, task3_outputs):
+    stage_names = ["task4.filter_paragraphs", "task4.filter_paragraphs.warm_cache", "task4.getValue"]
+    if not runner.wanted("task4"):
+        return
+    models_directory = os.path.join(repository_root, "Task4_Assigning_Values", "FilteringModels")
+    data_directory = os.path.join(repository_root, "Task4_Assigning_Values", "Data")
+    if not os.path.isdir(models_directory) or not os.path.isdir(data_directory):
+        runner.skip(stage_names, "Task4_Assigning_Values/FilteringModels and Data are not available")
+        return
+    if not task3_outputs:
+        runner.skip(stage_names, "no Task 3 paragraphs to run on")
+        return
+
+    # The Task 4 helpers read their models and data relative to the repository root
+    previous_directory = os.getcwd()
+    os.chdir(repository_root)
+    try:
+        try:
+            paragraphFiltering = importlib.import_module("Task4_Assigning_Values.HelperFunctions.paragraphFiltering")
+            bertValueAssignment = importlib.import_module("Task4_Assigning_Values.HelperFunctions.bertValueAssignment")
+        except (ImportError, OSError) as e:
+            runner.skip(stage_names, "missing dependency: " + str(e))
+            return
+
+        task3 = sys.modules["Task3_Paragraph_Extraction"]
+        fields = [(field, element) for field, element in task3.fieldnames.items() if element in task3_outputs
+                  and os.path.exists(os.path.join(models_directory, field + ".pkl"))]
+        paragraphs = []
+        for field, element in fields:
+            for output in task3_outputs[element].values():
+                for paragraph in (output if isinstance(output, list) else []):
+                    paragraphs.append((field, paragraph["text"]))
+
+        # The embeddings and results of the paragraphs are cached: they are cleared before every run, so the stage
+        # measures the embedding and the model inference, and measured again with every paragraph already cached
+        def filter_all():
+            return [paragraphFiltering.filter_paragraphs(text, field) for field, text in paragraphs]
+
+        def clear_caches():
+            paragraphFiltering.filter_paragraphs.cache_clear()
+            paragraphFiltering.generate_embeddings.cache_clear()
+
+        runner.run("task4.filter_paragraphs", filter_all, len(paragraphs), setup=clear_caches)
+        runner.run("task4.filter_paragraphs.warm_cache", filter_all, len(paragraphs), setup=filter_all)
+
+        # Value assignment on the first sentence of every paragraph of the text fields
+        texts = [(field, text.split('.')[0]) for field, text in paragraphs if not field.endswith("PURCHASE_AMOUNT")]
+        runner.run("task4.getValue",
+                   lambda: [bertValueAssignment.getValue(text, field, "Class A") for field, text in texts], len(texts))
+    finally:
+        os.chdir(previous_directory)
+
+
+def run_benchmarks(fixtures=default_fixtures, repeat=3, selected=None, all_fields=True, verbose=False):
+    """
+    Runs every stage over a fixture corpus.
+
+    Parameters:
+    - fixtures (str): Directory of the fixture corpus.
+    - repeat (int): Number of timed runs of every stage.
+    - selected (list): Prefixes of the stage names to run (e.g. ['task1', 'task3.class_text_extraction']).
+    - all_fields (bool): Run class_text_extraction for every field pattern, not only the demo fields.
+    - verbose (bool): Keep the output printed by the tasks.
+
+    Returns:
+    - dict: The report, with the measurements of every stage under 'stages'.
+    """
+    corpus = load_corpus(fixtures)
+    previous_directory = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="prospectus-benchmark-")
+    try:
+        environment = prepare_environment(workdir, corpus)
+        runner = StageRunner(repeat, selected, verbose)
+        benchmark_task1(runner, corpus, environment["mongo"])
+        benchmark_task2(runner, corpus)
+        task3_outputs = benchmark_task3(runner, corpus, environment["mongo"], all_fields)
+        benchmark_task4(runner, task3_outputs)
+        environment["llm_server"].shutdown()
+    finally:
+        os.chdir(previous_directory)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "revision": git_revision(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"directory": os.path.relpath(fixtures, repository_root), "documents": len(corpus),
+                   "bytes": sum(document["bytes"] for document in corpus.values())},
+        "repeat": runner.repeat,
+        "stages": runner.stages,
+    }
+
+
+def compare_reports(baseline, current, threshold=default_threshold):
+    """
+    Prints the change of wall time and peak memory of every stage between two reports.
+
+    Parameters:
+    - baseline (dict): Report of the reference revision.
+    - current (dict): Report of the revision being evaluated.
+    - threshold (float): Relative increase reported as a regression.
+
+    Returns:
+    - list: Names of the stages that regressed.
+    """
+    print("Baseline %s (%s)  ->  current %s (%s)" % (baseline.get("revision"), baseline.get("created"),
+                                                      current.get("revision"), current.get("created")))
+    print("%-70s %10s %10s %8s %10s" % ("stage", "base (s)", "now (s)", "time", "memory"))
+    regressions = []
+    for name in sorted(set(baseline["stages"]) | set(current["stages"])):
+        before = baseline["stages"].get(name, {})
+        after = current["stages"].get(name, {})
+        if before.get("status") != "ok" or after.get("status") != "ok":
+            print("%-70s %10s %10s" % (name, before.get("status", "-"), after.get("status", "-")))
+            continue
+        time_change = after["wall_seconds"] / before["wall_seconds"] - 1 if before["wall_seconds"] else 0.0
+        memory_change = after["peak_memory_bytes"] / before["peak_memory_bytes"] - 1 if before["peak_memory_bytes"] else 0.0
+        flag = ""
+        if time_change > threshold or memory_change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-70s %10.4f %10.4f %+7.1f%% %+9.1f%%%s" % (name, before["wall_seconds"], after["wall_seconds"],
+                                                           100 * time_change, 100 * memory_change, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extraction stages over a fixture corpus of prospectuses.")
+    parser.add_argument("--fixtures", default=default_fixtures, help="directory of the fixture corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of every stage (the median is reported)")
+    parser.add_argument("--stages", default="", help="comma-separated prefixes of the stages to run, e.g. task1,task3.document_parse")
+    parser.add_argument("--demo-fields", action="store_true", help="only run class_text_extraction for the Task 3 demo fields")
+    parser.add_argument("--output", help="report file (default: Benchmarks/Results/<revision>.json)")
+    parser.add_argument("--verbose", action="store_true", help="show the output printed by the tasks")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two reports instead of running")
+    parser.add_argument("--threshold", type=float, default=default_threshold, help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+        sys.exit(1 if compare_reports(reports[0], reports[1], args.threshold) else 0)
+
+    selected = [prefix.strip() for prefix in args.stages.split(",") if prefix.strip()]
+    report = run_benchmarks(os.path.abspath(args.fixtures), args.repeat, selected, not args.demo_fields, args.verbose)
+    output = args.output or os.path.join(default_results, report["revision"] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Report written to " + output)
@@ -0,0 +1,336 @@
+import codecs  # For decoding streamed documents incrementally
+import gzip  # For compressing the cached documents on disk
+import hashlib  # For the content hash of every document
+import os
+import threading  # For one HTTP session per thread
+import time
+from urllib.parse import urlparse, parse_qs  # For reading the RFID out of a prospectus URL
+
+import requests
+
+from CommonHelpers.sqliteStore import SqliteStore
+
+PROSPECTUS_BASE_URL = "https://prospectus-express.broadridge.com/getdocument.asp?rfid="
+
+# Cache settings, overridable through environment variables or configure()
+directory = os.path.abspath('./')
+cache_directory = os.environ.get('PROSPECTUS_CACHE_DIR', os.path.join(directory, '.prospectus_cache'))
+cache_max_bytes = int(os.environ.get('PROSPECTUS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+cache_revalidate_after = int(os.environ.get('PROSPECTUS_CACHE_REVALIDATE_SECONDS', 7 * 24 * 3600))
+request_timeout = int(os.environ.get('PROSPECTUS_REQUEST_TIMEOUT', 120))
+
+# The index maps every RFID to the hash of its current content, the blobs table tracks the compressed files
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    cache_key TEXT PRIMARY KEY,
+    url TEXT,
+    content_hash TEXT NOT NULL,
+    encoding TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash);
+"""
+
+_store = SqliteStore(os.path.join(cache_directory, 'index.sqlite'), CACHE_SCHEMA)
+_sessions = threading.local()
+
+
+def configure(cache_dir=None, max_bytes=None, revalidate_after=None):
+    """
+    Overrides the cache settings read from the environment.
+
+    Parameters:
+    - cache_dir (str): Directory holding the index and the compressed documents.
+    - max_bytes (int): Maximum total size of the compressed documents before LRU eviction.
+    - revalidate_after (int): Age in seconds after which a cached document is revalidated with the server.
+    """
+    global cache_directory, cache_max_bytes, cache_revalidate_after, _store
+    if cache_dir is not None:
+        _store.close()
+        cache_directory = cache_dir
+        _store = SqliteStore(os.path.join(cache_directory, 'index.sqlite'), CACHE_SCHEMA)
+    if max_bytes is not None:
+        cache_max_bytes = max_bytes
+    if revalidate_after is not None:
+        cache_revalidate_after = revalidate_after
+
+
+def prospectus_url(rfid):
+    """
+    Builds the Broadridge prospectus URL of an RFID.
+
+    Parameters:
+    - rfid (str): RFID of the prospectus.
+
+    Returns:
+    - str: URL of the prospectus document.
+    """
+    return PROSPECTUS_BASE_URL + str(rfid)
+
+
+def cache_key(url):
+    """
+    Returns the key a URL is cached under: the RFID for prospectus URLs, the URL itself otherwise.
+
+    Parameters:
+    - url (str): URL of the document.
+
+    Returns:
+    - str: The cache key.
+    """
+    rfid = parse_qs(urlparse(url).query).get('rfid')
+    if rfid:
+        return rfid[0]
+    return url
+
+
+def get_session():
+    """
+    Returns the HTTP session of the current thread, so connections to the server are reused.
+
+    Returns:
+    - requests.Session: The session of the current thread.
+    """
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _sessions.session = session
+    return session
+
+
+def _blob_path(content_hash):
+    return os.path.join(cache_directory, 'blobs', content_hash[:2], content_hash + '.html.gz')
+
+
+def _read_blob(content_hash):
+    try:
+        with gzip.open(_blob_path(content_hash), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_blob(content, content_hash):
+    path = _blob_path(content_hash)
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Writing to a temporary file first, so concurrent readers never see a partial document
+    tmp_path = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _touch(content_hash):
+    _store.connection().execute("UPDATE blobs SET last_access = ? WHERE content_hash = ?", (time.time(), content_hash))
+
+
+def _store_response(key, url, response):
+    return _store_content(key, url, response.content, response.encoding or response.apparent_encoding,
+                          response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+
+def _store_content(key, url, content, encoding, etag=None, last_modified=None):
+    content_hash = hashlib.sha256(content).hexdigest()
+    size = _write_blob(content, content_hash)
+    now = time.time()
+    with _store.transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (key, url, content_hash, encoding, etag, last_modified, now))
+        conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (content_hash, size, now))
+    _evict(keep=content_hash)
+    return content
+
+
+def store_document(url, content, encoding='utf-8'):
+    """
+    Adds a document obtained elsewhere (e.g. a saved prospectus) to the cache, as if it had just been downloaded.
+
+    Parameters:
+    - url (str): URL the document is requested with.
+    - content (bytes): The raw content of the document.
+    - encoding (str): Character encoding of the content.
+    """
+    _store_content(cache_key(url), url, content, encoding)
+
+
+def _evict(keep=None):
+    """
+    Removes the least recently used documents until the cache is below its size cap.
+
+    Parameters:
+    - keep (str): Content hash that must not be evicted (the document being returned to the caller).
+    """
+    conn = _store.connection()
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+    if total <= cache_max_bytes:
+        return
+
+    with _store.transaction() as conn:
+        for content_hash, size in conn.execute("SELECT content_hash, size FROM blobs ORDER BY last_access").fetchall():
+            if total <= cache_max_bytes:
+                break
+            if content_hash == keep:
+                continue
+            conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            conn.execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
+            try:
+                os.remove(_blob_path(content_hash))
+            except OSError:
+                pass
+            total -= size
+
+
+def _lookup(key):
+    row = _store.connection().execute(
+        "SELECT content_hash, encoding, etag, last_modified, fetched_at FROM documents WHERE cache_key = ?",
+        (key,)).fetchone()
+    if row is None:
+        return None, None
+    content = _read_blob(row[0])
+    if content is None:
+        return None, None
+    return row, content
+
+
+def fetch_document(url, revalidate=False):
+    """
+    Returns the content of a document, downloading it only when it is not cached or has changed on the server.
+
+    Cached documents older than the revalidation age are revalidated with a conditional request
+    (If-None-Match / If-Modified-Since). If the server cannot be reached, the cached copy is used.
+
+    Parameters:
+    - url (str): URL of the document.
+    - revalidate (bool): Revalidate a cached document whatever its age (refresh runs, which must see an
+      amendment filed since the document was cached).
+
+    Returns:
+    - tuple: The raw content (bytes) and the character encoding of the document.
+
+    Raises:
+    - requests.exceptions.RequestException: If the document is not cached and cannot be downloaded.
+    """
+    key = cache_key(url)
+    row, content = _lookup(key)
+
+    if row is not None:
+        content_hash, encoding, etag, last_modified, fetched_at = row
+        if not revalidate and time.time() - fetched_at < cache_revalidate_after:
+            _touch(content_hash)
+            return content, encoding
+
+        # Conditional revalidation of a stale entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = get_session().get(url, headers=headers, timeout=request_timeout)
+            if response.status_code == 304:
+                _store.connection().execute("UPDATE documents SET fetched_at = ? WHERE cache_key = ?", (time.time(), key))
+                _touch(content_hash)
+                return content, encoding
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Using cached copy of {url}, revalidation failed: {e}")
+            _touch(content_hash)
+            return content, encoding
+        return _store_response(key, url, response), response.encoding or response.apparent_encoding
+
+    response = get_session().get(url, timeout=request_timeout)
+    response.raise_for_status()
+    return _store_response(key, url, response), response.encoding or response.apparent_encoding
+
+
+def fetch_content(url, revalidate=False):
+    """
+    Returns the raw bytes of a document through the cache.
+
+    Parameters:
+    - url (str): URL of the document.
+    - revalidate (bool): Revalidate a cached document whatever its age, see fetch_document.
+
+    Returns:
+    - bytes: The content of the document.
+    """
+    return fetch_document(url, revalidate)[0]
+
+
+def fetch_text(url):
+    """
+    Returns the decoded text of a document through the cache, decoded the same way as requests' Response.text.
+
+    Parameters:
+    - url (str): URL of the document.
+
+    Returns:
+    - str: The text of the document.
+    """
+    content, encoding = fetch_document(url)
+    try:
+        return str(content, encoding or 'utf-8', errors='replace')
+    except LookupError:
+        return str(content, 'utf-8', errors='replace')
+
+
+def iter_text_chunks(url, chunk_size=64 * 1024):
+    """
+    Yields the decoded text of a document in chunks, without holding the whole document in memory.
+
+    A cached copy is read incrementally from disk. Otherwise the HTTP body is streamed; the consumer can stop
+    early, in which case the rest of the document is never downloaded (and the partial document is not cached).
+
+    Parameters:
+    - url (str): URL of the document.
+    - chunk_size (int): Number of bytes read at a time.
+
+    Yields:
+    - str: Consecutive pieces of the document text.
+
+    Raises:
+    - requests.exceptions.RequestException: If the document is not cached and cannot be downloaded.
+    """
+    row = _store.connection().execute(
+        "SELECT content_hash, encoding FROM documents WHERE cache_key = ?", (cache_key(url),)).fetchone()
+    if row is not None and os.path.exists(_blob_path(row[0])):
+        _touch(row[0])
+        decoder = _incremental_decoder(row[1])
+        with gzip.open(_blob_path(row[0]), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+        return
+
+    response = get_session().get(url, stream=True, timeout=request_timeout)
+    try:
+        response.raise_for_status()
+        decoder = _incremental_decoder(response.encoding)
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+    finally:
+        # Closing the response drops the connection when the consumer stopped early
+        response.close()
+
+
+def _incremental_decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
@@ -0,0 +1,165 @@
+import hashlib  # For the content hashes the state of a run is made of
+import json  # For hashing results in a canonical form
+import time
+
+from CommonHelpers import mongoClient
+
+# Number of RFIDs looked up in one query
+default_batch_size = 500
+
+# Bytes of the short hashes kept for every section of a document
+section_hash_size = 8
+
+
+def content_hash(value):
+    """
+    Returns the SHA-256 hash of a document, a text, or a result made of dictionaries, lists and plain values.
+
+    Parameters:
+    - value (bytes, str or JSON serializable): The value to hash. Results are hashed in canonical JSON (sorted
+      keys), so equal results have the same hash.
+
+    Returns:
+    - str: Hexadecimal hash.
+    """
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    elif not isinstance(value, (bytes, bytearray)):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.sha256(value).hexdigest()
+
+
+def section_hash(text):
+    """
+    Returns the short hash of the text of a section, as kept for every section in the state of a document.
+
+    Parameters:
+    - text (str): Text of the section.
+
+    Returns:
+    - str: Hexadecimal BLAKE2b hash of section_hash_size bytes.
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=section_hash_size).hexdigest()
+
+
+def build_state(rfid, hashes, output, details=None):
+    """
+    Builds the state document of an RFID after a run: the hashes of its inputs and of its result.
+
+    Parameters:
+    - rfid (str): The RFID.
+    - hashes (dict): Hashes of the inputs of the run (e.g. 'Content Hash'), compared by unchanged on the next run.
+    - output (JSON serializable): The documents written for the RFID, hashed as 'Output Hash'.
+    - details (dict): Task specific state carried forward to the next run (e.g. the per-section hashes).
+
+    Returns:
+    - dict: The state document.
+    """
+    state = {'RFID': rfid}
+    state.update(hashes)
+    state['Output Hash'] = content_hash(output)
+    if details:
+        state.update(details)
+    state['Updated At'] = time.time()
+    return state
+
+
+def unchanged(state, hashes):
+    """
+    Checks whether the inputs of an RFID are the ones of its last run, so its results can be carried forward.
+
+    Parameters:
+    - state (dict): State document of the last run, None if there is none.
+    - hashes (dict): Hashes of the current inputs, with the keys of build_state.
+
+    Returns:
+    - bool: True if the state has every hash with the same value.
+    """
+    return state is not None and all(state.get(name) == value for name, value in hashes.items())
+
+
+def output_unchanged(state, output):
+    """
+    Checks whether re-processing an RFID gave the result of its last run, which then needs no write.
+
+    Parameters:
+    - state (dict): State document of the last run, None if there is none.
+    - output (JSON serializable): The new result.
+
+    Returns:
+    - bool: True if the result hashes like the last one.
+    """
+    return state is not None and state.get('Output Hash') == content_hash(output)
+
+
+def field_changes(state, document, key_fields):
+    """
+    Compares the fields of a document with the ones written in the last run, so that a refresh run only writes the
+    fields that changed (see mongoClient.bulk_update).
+
+    Parameters:
+    - state (dict): State document of the last run, None if there is none.
+    - document (dict): The document to write.
+    - key_fields (list): Fields identifying the document, always written.
+
+    Returns:
+    - dict: The key fields and the changed fields, or None if the state has no field hashes and the whole
+      document has to be written.
+    - list: Fields of the last document the new one does not have.
+    - dict: Hashes of every field of the document but the key fields, to be kept in the state as 'Field Hashes'.
+    """
+    hashes = {field: content_hash(value) for field, value in document.items() if field not in key_fields}
+    previous = (state or {}).get('Field Hashes')
+    if previous is None:
+        return None, [], hashes
+    fields = {field: document[field] for field in key_fields}
+    fields.update((field, document[field]) for field, value_hash in hashes.items() if previous.get(field) != value_hash)
+    return fields, [field for field in previous if field not in hashes], hashes
+
+
+def load_state(collection, rfid):
+    """
+    Loads the state document of one RFID.
+
+    Parameters:
+    - collection (Collection): The state collection of the task.
+    - rfid (str): RFID to load.
+
+    Returns:
+    - dict: The state document, or None if the RFID has not been processed with states yet.
+    """
+    return collection.find_one({'RFID': rfid}, {'_id': 0})
+
+
+def load_states(collection, rfids, batch_size=default_batch_size):
+    """
+    Loads the state documents of many RFIDs with one $in query per batch.
+
+    Parameters:
+    - collection (Collection): The state collection of the task.
+    - rfids (iterable): RFIDs to load.
+    - batch_size (int): Number of RFIDs looked up in one query.
+
+    Returns:
+    - dict: RFIDs mapped to their state document. RFIDs without a state are left out.
+    """
+    rfids = list(dict.fromkeys(rfids))
+    states = {}
+    for start in range(0, len(rfids), batch_size):
+        for state in collection.find({'RFID': {'$in': rfids[start:start + batch_size]}}, {'_id': 0}):
+            states[state['RFID']] = state
+    return states
+
+
+def write_states(collection, states):
+    """
+    Writes state documents over the previous states of their RFIDs.
+
+    Parameters:
+    - collection (Collection): The state collection of the task.
+    - states (list): State documents, as returned by build_state.
+
+    Returns:
+    - dict: The number of 'inserted' and 'replaced' states.
+    """
+    return mongoClient.bulk_replace(collection, states, ['RFID'])
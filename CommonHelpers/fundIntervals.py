@@ -0,0 +1,143 @@
+from bisect import bisect_left  # For O(log n) fund lookups
+
+# Number of RFIDs looked up in one query
+default_batch_size = 500
+
+# Fund receiving the paragraphs whose offset is unknown (-1)
+OTHERS = 'others'
+
+# Only the fields the interval index is built from are read from the Task 1 documents
+FUND_PROJECTION = {'_id': 0, 'RFID': 1, 'Funds': 1}
+
+
+class FundIntervals:
+    """
+    Fund boundaries of one prospectus: the text offsets of its funds, sorted, so the fund owning a text offset is
+    found with a binary search.
+
+    A fund owns the text from its own offset up to and including the offset of the next fund, and the last fund
+    also owns everything that is not covered by another fund, as Task 3 has always assigned paragraphs.
+
+    Parameters:
+    - funds (dict): Fund names mapped to {'Text Offset': offset}, as stored by Task 1.
+    """
+
+    def __init__(self, funds):
+        # Funds in the order they are stored in, which Task 2 pairs with the fee tables
+        self.funds = list(funds)
+        ordered = sorted(funds.items(), key=lambda item: item[1]['Text Offset'])
+        self.names = [name for name, _ in ordered]
+        self.offsets = [value['Text Offset'] for _, value in ordered]
+
+    def __len__(self):
+        return len(self.names)
+
+    def fund_at(self, offset):
+        """
+        Returns the fund owning a text offset.
+
+        Parameters:
+        - offset (int): Text offset of a paragraph, -1 if it is unknown.
+
+        Returns:
+        - str: The fund name, OTHERS for an unknown offset, or None if the prospectus has no funds.
+        """
+        if offset == -1:
+            return OTHERS
+        count = len(self.offsets)
+        if count == 0:
+            return None
+        k = bisect_left(self.offsets, offset)
+        if k == 0:
+            # Before the first fund, only an offset equal to it belongs to it
+            return self.names[0] if self.offsets[0] == offset and count > 1 else self.names[-1]
+        if k < count:
+            return self.names[k - 1]
+        return self.names[-1]
+
+    def funds_at(self, offsets):
+        """
+        Returns the funds owning many text offsets, looking every distinct offset up once.
+
+        Parameters:
+        - offsets (list): Text offsets, -1 for the unknown ones.
+
+        Returns:
+        - list: The fund owning every offset, as returned by fund_at.
+        """
+        owners = {offset: self.fund_at(offset) for offset in set(offsets)}
+        return [owners[offset] for offset in offsets]
+
+    def assign_fields(self, fields, offset_key='offset'):
+        """
+        Groups the paragraphs of several fields by the fund owning their offset, in one pass over all of them.
+
+        Parameters:
+        - fields (dict): Field names mapped to their paragraphs, as dictionaries with their text offset.
+        - offset_key (str): Key of the offset in the paragraph dictionaries.
+
+        Returns:
+        - dict: Field names mapped to their paragraphs grouped by fund, as returned by assign.
+        """
+        owners = iter(self.funds_at([paragraph[offset_key] for paragraphs in fields.values() for paragraph in paragraphs]))
+        assigned_fields = {}
+        for field, paragraphs in fields.items():
+            assigned = {}
+            for paragraph in paragraphs:
+                fund = next(owners)
+                if fund is not None:
+                    assigned.setdefault(fund, []).append(paragraph)
+            assigned_fields[field] = assigned
+        return assigned_fields
+
+    def assign(self, paragraphs, offset_key='offset'):
+        """
+        Groups paragraphs by the fund owning their offset.
+
+        Parameters:
+        - paragraphs (list): Paragraphs as dictionaries with their text offset.
+        - offset_key (str): Key of the offset in the paragraph dictionaries.
+
+        Returns:
+        - dict: Fund names mapped to the list of their paragraphs, in the order given.
+        """
+        return self.assign_fields({None: paragraphs}, offset_key)[None]
+
+
+def load_fund_intervals(collection, rfids, batch_size=default_batch_size):
+    """
+    Loads the fund boundaries of many RFIDs from the Task 1 collection with one projected $in query per batch.
+
+    Parameters:
+    - collection (Collection): The Task 1 MongoDB collection.
+    - rfids (iterable): RFIDs to load.
+    - batch_size (int): Number of RFIDs looked up in one query.
+
+    Returns:
+    - dict: RFIDs mapped to their FundIntervals. RFIDs without a Task 1 document or without funds are left out.
+    """
+    rfids = list(dict.fromkeys(rfids))
+    intervals = {}
+    for start in range(0, len(rfids), batch_size):
+        batch = rfids[start:start + batch_size]
+        for document in collection.find({'RFID': {'$in': batch}}, FUND_PROJECTION):
+            if document['RFID'] not in intervals and document.get('Funds'):
+                intervals[document['RFID']] = FundIntervals(document['Funds'])
+    return intervals
+
+
+def load_fund_interval(collection, rfid):
+    """
+    Loads the fund boundaries of one RFID from the Task 1 collection.
+
+    Parameters:
+    - collection (Collection): The Task 1 MongoDB collection.
+    - rfid (str): RFID to load.
+
+    Returns:
+    - FundIntervals: The fund boundaries, or None if the RFID has no Task 1 document.
+    """
+    document = collection.find_one({'RFID': rfid}, FUND_PROJECTION)
+    if document is None:
+        return None
+    return FundIntervals(document.get('Funds') or {})
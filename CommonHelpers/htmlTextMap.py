@@ -0,0 +1,293 @@
+import re
+from array import array  # Compact storage of the run offsets
+from bisect import bisect_right  # For O(log n) offset conversions
+from html import unescape  # For decoding numeric character references
+from html.entities import html5  # Named character references
+from html.parser import HTMLParser
+
+# Characters BeautifulSoup treats as blank when collapsing whitespace-only strings
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# Tags handled like BeautifulSoup's html.parser builder does: void elements, tags whose whitespace is kept,
+# and tags whose strings are not part of the visible text
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+             'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+             'nextid', 'spacer'}
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+HIDDEN_STRING_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+# Named references without their trailing semicolon, as html.parser reports them
+ENTITIES = {}
+for _name, _character in sorted(html5.items()):
+    ENTITIES.setdefault(_name[:-1] if _name.endswith(';') else _name, _character)
+
+_DECIMAL_REFERENCE = re.compile('^([0-9]+)(.*)')
+_HEX_REFERENCE = re.compile('^([0-9a-f]+)(.*)')
+
+
+class _TextMapParser(HTMLParser):
+    """
+    Collects the visible text of a document with the HTML position of every piece of text.
+
+    Strings are built the way BeautifulSoup's html.parser builder builds them, so the text is the same as
+    BeautifulSoup(html, 'html.parser').get_text().
+    """
+
+    def __init__(self, line_starts):
+        super().__init__(convert_charrefs=False)
+        self.line_starts = line_starts
+        self.parts = []
+        self.length = 0
+        self.text_starts = array('q')
+        self.html_starts = array('q')
+        self.pending = []
+        self.open_tags = []
+        self.closed_void_tags = []
+        self.preserve_depth = 0
+        self.hidden_depth = 0
+
+    def _position(self):
+        line, column = self.getpos()
+        return self.line_starts[line - 1] + column
+
+    def _flush(self, included=None):
+        """
+        Ends the current string and appends it to the text unless it is hidden.
+
+        Parameters:
+        - included (bool): Force the string in (CDATA sections) or out; by default it depends on the open tags.
+        """
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        if included is None:
+            included = self.hidden_depth == 0
+        if not included:
+            return
+
+        # Whitespace-only strings are collapsed to a single newline or space
+        if self.preserve_depth == 0 and all(not text.strip(ASCII_SPACES) for text, _ in pending):
+            data = ''.join(text for text, _ in pending)
+            if not data:
+                return
+            pending = [('\n' if '\n' in data else ' ', pending[0][1])]
+
+        for text, position in pending:
+            if not text:
+                continue
+            last = len(self.text_starts) - 1
+            # A piece following the previous one in both the text and the HTML extends the same run
+            if last < 0 or self.html_starts[last] + (self.length - self.text_starts[last]) != position:
+                self.text_starts.append(self.length)
+                self.html_starts.append(position)
+            self.parts.append(text)
+            self.length += len(text)
+
+    def _push(self, tag):
+        self.open_tags.append(tag)
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+        if tag in HIDDEN_STRING_TAGS:
+            self.hidden_depth += 1
+
+    def _pop_to(self, tag):
+        # An end tag closes every tag opened after the matching start tag; unmatched end tags are ignored
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            closed = self.open_tags.pop()
+            if closed in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+            if closed in HIDDEN_STRING_TAGS:
+                self.hidden_depth -= 1
+            if closed == tag:
+                break
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_TAGS:
+            self.closed_void_tags.append(tag)
+        else:
+            self._push(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        # The end tag of a void element already closed by its start tag does not even end the current string
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self.pending.append((data, self._position()))
+
+    def handle_charref(self, name):
+        position = self._position()
+        hexadecimal = name[:1] in ('x', 'X')
+        digits = name[1:] if hexadecimal else name
+        extra = ''
+        try:
+            int(digits, 16 if hexadecimal else 10)
+        except ValueError:
+            # A reference without its semicolon: the leading digits are the reference, the rest is text
+            match = (_HEX_REFERENCE if hexadecimal else _DECIMAL_REFERENCE).search(digits)
+            if match is None:
+                self.pending.append((digits, position + 2 + len(name) - len(digits)))
+                return
+            digits, extra = match.groups()
+        self.pending.append((unescape('&#' + ('x' if hexadecimal else '') + digits + ';'), position))
+        if extra:
+            self.pending.append((extra, position + 2 + len(name) - len(extra)))
+
+    def handle_entityref(self, name):
+        character = ENTITIES.get(name)
+        self.pending.append((character if character is not None else '&' + name, self._position()))
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith('CDATA['):
+            # CDATA sections are part of the text, even inside hidden tags ('<![CDATA[' is 9 characters)
+            self.pending.append((data[len('CDATA['):], self._position() + 9))
+            self._flush(included=True)
+
+
+class HtmlTextMap:
+    """
+    Visible text of an HTML document with a mapping between text offsets and HTML character offsets.
+
+    The document is parsed once. The text is the same as BeautifulSoup(html, 'html.parser').get_text(); the mapping
+    is stored as runs of text copied verbatim from the HTML, so conversions in both directions are binary searches.
+
+    Parameters:
+    - html (str): The decoded HTML document.
+    - remove_escapes (bool): Remove every backslash and the character following it from the text, as Task 1 does
+      with re.sub(r'\\\\.', '', text).
+    """
+
+    def __init__(self, html, remove_escapes=False):
+        self.html = html
+        self.line_starts = array('q', [0])
+        newline = html.find('\n')
+        while newline != -1:
+            self.line_starts.append(newline + 1)
+            newline = html.find('\n', newline + 1)
+
+        parser = _TextMapParser(self.line_starts)
+        parser.feed(html)
+        parser.close()
+        parser._flush()
+
+        self.text = ''.join(parser.parts)
+        self.text_starts = parser.text_starts
+        self.html_starts = parser.html_starts
+        if remove_escapes:
+            self._remove_escapes()
+
+    def _remove_escapes(self):
+        kept = []
+        previous_end = 0
+        for match in re.finditer(r'\\.', self.text):
+            if match.start() > previous_end:
+                kept.append((previous_end, match.start()))
+            previous_end = match.end()
+        if not kept and previous_end == 0:
+            return
+        if previous_end < len(self.text):
+            kept.append((previous_end, len(self.text)))
+
+        # Splitting the runs at the removed characters
+        text_starts = array('q')
+        html_starts = array('q')
+        parts = []
+        length = 0
+        run = 0
+        for start, end in kept:
+            position = start
+            while position < end:
+                while run + 1 < len(self.text_starts) and self.text_starts[run + 1] <= position:
+                    run += 1
+                run_end = self.text_starts[run + 1] if run + 1 < len(self.text_starts) else len(self.text)
+                piece_end = min(end, run_end)
+                text_starts.append(length)
+                html_starts.append(self.html_starts[run] + position - self.text_starts[run])
+                parts.append(self.text[position:piece_end])
+                length += piece_end - position
+                position = piece_end
+
+        self.text = ''.join(parts)
+        self.text_starts = text_starts
+        self.html_starts = html_starts
+
+    def html_position(self, line, column):
+        """
+        Converts a (line, column) position, as reported by html.parser or BeautifulSoup's Tag.sourceline and
+        Tag.sourcepos, to a character offset in the HTML.
+
+        Parameters:
+        - line (int): Line number, starting at 1.
+        - column (int): Column, starting at 0.
+
+        Returns:
+        - int: The character offset in the HTML.
+        """
+        return self.line_starts[line - 1] + column
+
+    def text_to_html(self, offset):
+        """
+        Converts an offset in the text to the offset of the HTML character it was taken from.
+
+        Parameters:
+        - offset (int): Offset in the text.
+
+        Returns:
+        - int: Offset in the HTML.
+        """
+        run = bisect_right(self.text_starts, offset) - 1
+        if run < 0:
+            return 0
+        return self.html_starts[run] + offset - self.text_starts[run]
+
+    def html_to_text(self, position):
+        """
+        Converts an offset in the HTML to the number of text characters before it, i.e. the text offset of the
+        first visible character at or after that position.
+
+        Parameters:
+        - position (int): Offset in the HTML.
+
+        Returns:
+        - int: Offset in the text.
+        """
+        run = bisect_right(self.html_starts, position) - 1
+        if run < 0:
+            return 0
+        run_end = self.text_starts[run + 1] if run + 1 < len(self.text_starts) else len(self.text)
+        return min(self.text_starts[run] + position - self.html_starts[run], run_end)
+
+    def tag_text_offset(self, tag):
+        """
+        Returns the text offset where the text of a BeautifulSoup tag starts, from its source position.
+
+        Parameters:
+        - tag (bs4.element.Tag): A tag of a document parsed with 'html.parser' from the same HTML.
+
+        Returns:
+        - int: Offset in the text, or None if the tag has no source position.
+        """
+        line = getattr(tag, 'sourceline', None)
+        column = getattr(tag, 'sourcepos', None)
+        if line is None or column is None:
+            return None
+        return self.html_to_text(self.html_position(line, column))
@@ -0,0 +1,176 @@
+import hashlib  # For hashing the requests into cache keys
+import json
+import os
+import threading  # For the hit/miss counters shared by worker threads
+import time
+
+import openai
+
+from CommonHelpers.sqliteStore import SqliteStore
+
+# Cache settings, overridable through environment variables or configure()
+directory = os.path.abspath('./')
+cache_path = os.environ.get('LLM_CACHE_PATH', os.path.join(directory, '.llm_cache', 'responses.sqlite'))
+cache_ttl = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 90 * 24 * 3600))
+cache_max_bytes = int(os.environ.get('LLM_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+offline = os.environ.get('LLM_CACHE_OFFLINE', '').lower() in ['1', 'true', 'yes']
+
+# Arguments that change how a request is sent but not its answer, left out of the cache key
+TRANSPORT_PARAMETERS = ['api_key', 'api_base', 'api_type', 'api_version', 'organization', 'request_timeout', 'timeout', 'headers']
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    request_hash TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+_store = SqliteStore(cache_path, CACHE_SCHEMA)
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+class LLMCacheMiss(Exception):
+    """
+    Raised in offline mode when a request is not in the cache.
+    """
+
+
+def configure(path=None, ttl=None, max_bytes=None, offline_mode=None):
+    """
+    Overrides the cache settings read from the environment.
+
+    Parameters:
+    - path (str): Location of the SQLite file holding the responses.
+    - ttl (int): Number of seconds a response stays valid.
+    - max_bytes (int): Maximum total size of the stored responses before the least recently used are evicted.
+    - offline_mode (bool): When True, a cache miss raises LLMCacheMiss instead of calling the API.
+    """
+    global cache_path, cache_ttl, cache_max_bytes, offline, _store
+    if path is not None:
+        _store.close()
+        cache_path = path
+        _store = SqliteStore(cache_path, CACHE_SCHEMA)
+    if ttl is not None:
+        cache_ttl = ttl
+    if max_bytes is not None:
+        cache_max_bytes = max_bytes
+    if offline_mode is not None:
+        offline = offline_mode
+
+
+def request_key(**request):
+    """
+    Hashes the model, parameters and messages of a chat completion request.
+
+    Parameters:
+    - request: The keyword arguments passed to openai.ChatCompletion.create.
+
+    Returns:
+    - str: The hexadecimal SHA-256 of the canonical JSON form of the request.
+    """
+    keyed = {k: v for k, v in request.items() if k not in TRANSPORT_PARAMETERS}
+    canonical = json.dumps(keyed, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def lookup(**request):
+    """
+    Returns the cached response of a chat completion request.
+
+    Parameters:
+    - request: The keyword arguments passed to openai.ChatCompletion.create.
+
+    Returns:
+    - OpenAIObject: The cached response, or None on a miss.
+
+    Raises:
+    - LLMCacheMiss: On a miss in offline mode.
+    """
+    key = request_key(**request)
+    conn = _store.connection()
+    row = conn.execute("SELECT response, created_at FROM responses WHERE request_hash = ?", (key,)).fetchone()
+    if row is not None and time.time() - row[1] < cache_ttl:
+        conn.execute("UPDATE responses SET last_access = ? WHERE request_hash = ?", (time.time(), key))
+        _count('hits')
+        return openai.util.convert_to_openai_object(json.loads(row[0]))
+
+    _count('misses')
+    if offline:
+        raise LLMCacheMiss("No cached response for request " + key + " (model " + str(request.get('model')) + ")")
+    return None
+
+
+def store(response, **request):
+    """
+    Stores the response of a chat completion request.
+
+    Parameters:
+    - response (dict): The response returned by openai.ChatCompletion.create.
+    - request: The keyword arguments passed to openai.ChatCompletion.create.
+    """
+    key = request_key(**request)
+    serialized = json.dumps(response)
+    now = time.time()
+    with _store.transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, request.get('model'), serialized, len(serialized), now, now))
+    _evict()
+
+
+def _evict():
+    """
+    Removes the expired responses, then the least recently used ones until the cache is below its size cap.
+    """
+    with _store.transaction() as conn:
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - cache_ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= cache_max_bytes:
+            return
+        for key, size in conn.execute("SELECT request_hash, size FROM responses ORDER BY last_access").fetchall():
+            if total <= cache_max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE request_hash = ?", (key,))
+            total -= size
+
+
+def cached_chat_completion(**request):
+    """
+    Drop-in replacement for openai.ChatCompletion.create that answers from the cache when it can.
+
+    Parameters:
+    - request: The keyword arguments of openai.ChatCompletion.create.
+
+    Returns:
+    - OpenAIObject: The cached or freshly generated response.
+
+    Raises:
+    - LLMCacheMiss: On a miss in offline mode.
+    """
+    response = lookup(**request)
+    if response is not None:
+        return response
+    response = openai.ChatCompletion.create(**request)
+    store(response, **request)
+    return response
+
+
+def stats():
+    """
+    Returns the number of cache hits and misses since the process started.
+
+    Returns:
+    - dict: The 'hits' and 'misses' counters.
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,298 @@
+import json
+import os
+import random  # For the jitter of the retry delays
+import threading
+import time
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from CommonHelpers import llmCache
+
+# Gateway settings, overridable through environment variables or configure()
+requests_per_minute = float(os.environ.get('LLM_REQUESTS_PER_MINUTE', 200))
+tokens_per_minute = float(os.environ.get('LLM_TOKENS_PER_MINUTE', 40000))
+max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+max_retries = int(os.environ.get('LLM_MAX_RETRIES', 6))
+max_backoff = float(os.environ.get('LLM_MAX_BACKOFF_SECONDS', 60))
+default_completion_tokens = 500
+
+# Pointing the API at a local stub server for testing
+if os.environ.get('OPENAI_API_BASE'):
+    openai.api_base = os.environ['OPENAI_API_BASE']
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute of quota.
+
+    acquire() blocks until the requested amount is available. The amount can later be corrected with
+    adjust(), which may leave the bucket in debt when a request used more than estimated.
+
+    Parameters:
+    - rate_per_minute (float): Quota per minute (requests or tokens).
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = float(rate_per_minute) / 60.0
+        self.available = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0):
+        # Requests larger than the bucket would wait forever, they only wait for a full bucket
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait_time = (amount - self.available) / self.rate
+            time.sleep(min(wait_time, 1.0))
+
+    def adjust(self, amount):
+        with self.lock:
+            self._refill()
+            self.available -= amount
+
+    def set_rate(self, rate_per_minute):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate_per_minute) / 60.0
+
+
+class RateLimiter:
+    """
+    Request and token quotas with bounded concurrency, slowing down when the API answers 429.
+
+    After a rate limit error every caller is paused for the backoff delay and the request rate is reduced by 20%.
+    Each successful call recovers 5% of the configured rate.
+
+    Parameters:
+    - requests_per_minute (float): Request quota per minute.
+    - tokens_per_minute (float): Token quota per minute.
+    - concurrency (int): Maximum number of requests in flight.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, concurrency):
+        self.configured_rpm = float(requests_per_minute)
+        self.current_rpm = float(requests_per_minute)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait_for_slot(self, estimated_tokens):
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+    def on_success(self, estimated_tokens, used_tokens):
+        if used_tokens is not None:
+            self.tokens.adjust(used_tokens - estimated_tokens)
+        with self.lock:
+            if self.current_rpm < self.configured_rpm:
+                self.current_rpm = min(self.configured_rpm, self.current_rpm + 0.05 * self.configured_rpm)
+                self.requests.set_rate(self.current_rpm)
+
+    def on_rate_limited(self, delay):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.current_rpm = max(1.0, self.current_rpm * 0.8)
+            self.requests.set_rate(self.current_rpm)
+
+
+_limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_concurrency)
+_api_key_lock = threading.Lock()
+_api_key_path = None
+_metrics_lock = threading.Lock()
+_metrics = {'calls': 0, 'cache_hits': 0, 'errors': 0, 'retries': 0, 'rate_limited': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'latencies': []}
+
+
+def _configure_session(pool_size):
+    # One pooled HTTP session shared by all the threads, so connections to the API are reused
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    openai.requestssession = session
+
+
+_configure_session(max_concurrency)
+
+
+def configure(requests_per_minute=None, tokens_per_minute=None, concurrency=None, retries=None, api_base=None):
+    """
+    Overrides the gateway settings read from the environment.
+
+    Parameters:
+    - requests_per_minute (float): Request quota per minute.
+    - tokens_per_minute (float): Token quota per minute.
+    - concurrency (int): Maximum number of requests in flight.
+    - retries (int): Maximum number of retries of a failing request.
+    - api_base (str): Base URL of the API, e.g. a local stub server.
+    """
+    global _limiter, max_retries
+    rpm = requests_per_minute if requests_per_minute is not None else _limiter.configured_rpm
+    tpm = tokens_per_minute if tokens_per_minute is not None else _limiter.tokens.capacity
+    slots = concurrency if concurrency is not None else max_concurrency
+    _limiter = RateLimiter(rpm, tpm, slots)
+    _configure_session(slots)
+    if retries is not None:
+        max_retries = retries
+    if api_base is not None:
+        openai.api_base = api_base
+
+
+def load_api_key(path):
+    """
+    Reads the OpenAI API key from a file, once per process and path.
+
+    Parameters:
+    - path (str): Path of the file whose first line is the API key.
+
+    Raises:
+    - OSError: If the file cannot be read.
+    """
+    global _api_key_path
+    with _api_key_lock:
+        if _api_key_path == path:
+            return
+        with open(path, 'r') as f:
+            openai.api_key = f.readline().strip()
+        _api_key_path = path
+
+
+def estimate_tokens(request):
+    """
+    Estimates the tokens a request consumes: about four characters per prompt token plus the completion budget.
+
+    Parameters:
+    - request (dict): The keyword arguments of openai.ChatCompletion.create.
+
+    Returns:
+    - int: The estimated number of tokens.
+    """
+    prompt_chars = sum(len(str(message.get('content', ''))) for message in request.get('messages', []))
+    return prompt_chars // 4 + int(request.get('max_tokens') or default_completion_tokens)
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                          openai.error.Timeout, openai.error.APIConnectionError, openai.error.TryAgain)):
+        return True
+    status = getattr(error, 'http_status', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _record(name, value=1):
+    with _metrics_lock:
+        if name == 'latencies':
+            _metrics['latencies'].append(value)
+            # Keeping a bounded window of latencies for the percentiles
+            if len(_metrics['latencies']) > 10000:
+                del _metrics['latencies'][:5000]
+        else:
+            _metrics[name] += value
+
+
+def chat_completion(use_cache=True, api_key_path=None, **request):
+    """
+    Sends a chat completion request through the cache, the rate limiter and the retry policy.
+
+    Parameters:
+    - use_cache (bool): Answer from the persistent response cache when possible and store new responses.
+    - api_key_path (str): File holding the API key, read (once) only when the request has to be sent.
+    - request: The keyword arguments of openai.ChatCompletion.create.
+
+    Returns:
+    - OpenAIObject: The response of the API.
+
+    Raises:
+    - llmCache.LLMCacheMiss: On a cache miss in offline mode.
+    - OSError: If the API key file cannot be read.
+    - openai.error.OpenAIError: If the request fails and cannot be retried, or all retries fail.
+    """
+    if use_cache:
+        cached = llmCache.lookup(**request)
+        if cached is not None:
+            _record('cache_hits')
+            return cached
+
+    if api_key_path is not None:
+        load_api_key(api_key_path)
+
+    estimated_tokens = estimate_tokens(request)
+    attempt = 0
+    while True:
+        limiter = _limiter
+        limiter.wait_for_slot(estimated_tokens)
+        error = None
+        with limiter.slots:
+            start = time.monotonic()
+            try:
+                response = openai.ChatCompletion.create(**request)
+            except openai.error.OpenAIError as e:
+                error = e
+            latency = time.monotonic() - start
+
+        if error is not None:
+            if not _is_retryable(error) or attempt >= max_retries:
+                _record('errors')
+                raise error
+            # Exponential backoff with jitter, every caller pauses after a rate limit error
+            delay = min(max_backoff, (2 ** attempt) * (1 + random.random()))
+            if isinstance(error, openai.error.RateLimitError) or getattr(error, 'http_status', None) == 429:
+                _record('rate_limited')
+                limiter.on_rate_limited(delay)
+            _record('retries')
+            attempt += 1
+            time.sleep(delay)
+            continue
+
+        usage = response.get('usage') or {}
+        limiter.on_success(estimated_tokens, usage.get('total_tokens'))
+        _record('calls')
+        _record('latencies', latency)
+        _record('prompt_tokens', usage.get('prompt_tokens', 0))
+        _record('completion_tokens', usage.get('completion_tokens', 0))
+
+        if use_cache:
+            llmCache.store(response, **request)
+        return response
+
+
+def metrics():
+    """
+    Returns the call, error, retry and token counters and the latency percentiles since the process started.
+
+    Returns:
+    - dict: The gateway metrics.
+    """
+    with _metrics_lock:
+        snapshot = {k: v for k, v in _metrics.items() if k != 'latencies'}
+        latencies = sorted(_metrics['latencies'])
+    if latencies:
+        snapshot['latency_p50'] = round(latencies[len(latencies) // 2], 3)
+        snapshot['latency_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+        snapshot['latency_mean'] = round(sum(latencies) / len(latencies), 3)
+    return snapshot
+
+
+def format_metrics():
+    """
+    Returns the gateway metrics as a single JSON line, for logging at the end of a run.
+    """
+    return json.dumps(metrics(), sort_keys=True)
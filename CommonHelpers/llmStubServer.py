@@ -0,0 +1,87 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /chat/completions (under any prefix) with a canned completion in the OpenAI response format.
+
+    The server attributes control the behaviour:
+    - reply (str): Content of the assistant message.
+    - latency (float): Seconds to wait before answering.
+    - failures (list): HTTP status codes returned, in order, before the first successful answer (e.g. [429, 500]).
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            status = server.failures.pop(0) if server.failures else 200
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if status != 200:
+            payload = {'error': {'message': 'stub error', 'type': 'stub_error', 'code': status}}
+        else:
+            prompt_chars = sum(len(str(m.get('content', ''))) for m in body.get('messages', []))
+            payload = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': server.reply}}],
+                'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(server.reply) // 4,
+                          'total_tokens': prompt_chars // 4 + len(server.reply) // 4},
+            }
+
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(reply='None', latency=0.0, failures=None, port=0):
+    """
+    Starts a local OpenAI-compatible stub server in a background thread.
+
+    Parameters:
+    - reply (str): Content of every assistant message.
+    - latency (float): Seconds to wait before each answer.
+    - failures (list): HTTP status codes returned before the first successful answer.
+    - port (int): Port to listen on, 0 for any free port.
+
+    Returns:
+    - ThreadingHTTPServer: The running server; its api_base attribute can be passed to llmGateway.configure.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.reply = reply
+    server.latency = latency
+    server.failures = list(failures or [])
+    server.requests = []
+    server.lock = threading.Lock()
+    server.api_base = 'http://127.0.0.1:' + str(server.server_address[1]) + '/v1'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server for testing the LLM gateway.")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--reply', default='None')
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    stub = start_stub_server(args.reply, args.latency, port=args.port)
+    print("Stub server listening, set OPENAI_API_BASE=" + stub.api_base)
+    threading.Event().wait()
@@ -0,0 +1,280 @@
+import os
+import threading  # For sharing the clients and the write buffers between worker threads
+
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Default number of documents sent in one bulk write
+default_batch_size = 500
+
+_clients = {}
+_clients_lock = threading.Lock()
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+
+def get_client(connection_string, **kwargs):
+    """
+    Returns the shared MongoClient of a connection string, creating it on first use.
+
+    MongoClient keeps its own connection pool and is thread-safe, so one client per process is enough.
+    Clients are not shared with forked worker processes, which get their own on first use.
+
+    Parameters:
+    - connection_string (str): MongoDB connection string.
+    - kwargs: Extra MongoClient options (e.g. tlsCAFile), part of the cache key.
+
+    Returns:
+    - MongoClient: The pooled client.
+    """
+    key = (connection_string, tuple(sorted(kwargs.items())), os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = MongoClient(connection_string, connect=False, **kwargs)
+                _clients[key] = client
+    return client
+
+
+def get_collection(connection_string, database, collection, **kwargs):
+    """
+    Returns a collection through the shared client of a connection string.
+
+    Parameters:
+    - connection_string (str): MongoDB connection string.
+    - database (str): Name of the database.
+    - collection (str): Name of the collection.
+    - kwargs: Extra MongoClient options (e.g. tlsCAFile).
+
+    Returns:
+    - Collection: The MongoDB collection.
+    """
+    return get_client(connection_string, **kwargs)[database][collection]
+
+
+def ensure_unique_index(collection, key_fields):
+    """
+    Creates the unique index the upserts of a collection rely on, once per process.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection.
+    - key_fields (list): Fields identifying a document, e.g. ['RFID'] or ['RFID', 'Fund'].
+    """
+    key = (collection.full_name, tuple(key_fields), os.getpid())
+    if key in _indexed:
+        return
+    with _indexed_lock:
+        if key not in _indexed:
+            collection.create_index([(field, 1) for field in key_fields], unique=True)
+            _indexed.add(key)
+
+
+def find_existing(collection, field, values, batch_size=default_batch_size):
+    """
+    Returns which of the given values of a field already appear in a collection.
+
+    Values are looked up with indexed $in queries projected on the field, so the cost depends on the number of
+    values asked about rather than on the size of the collection.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection, with an index whose first field is the given field.
+    - field (str): Field to look up, e.g. 'RFID'.
+    - values (iterable): Values to look for.
+    - batch_size (int): Number of values sent in one query.
+
+    Returns:
+    - set: The values present in the collection.
+    """
+    values = list(dict.fromkeys(values))
+    found = set()
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        for document in collection.find({field: {'$in': batch}}, {'_id': 0, field: 1}):
+            found.add(document[field])
+    return found
+
+
+def bulk_upsert(collection, documents, key_fields, batch_size=default_batch_size):
+    """
+    Inserts documents that are not yet in a collection, in unordered bulk writes.
+
+    Every document is written with an upsert on its key fields using $setOnInsert, so a document that is already
+    present is left untouched and concurrent runs writing the same RFID cannot create duplicates.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection.
+    - documents (list): Documents to insert. Each must contain all the key fields.
+    - key_fields (list): Fields identifying a document, backed by a unique index.
+    - batch_size (int): Number of documents sent in one bulk write.
+
+    Returns:
+    - dict: The number of 'inserted' documents and of documents that were 'existing' already.
+    """
+    ensure_unique_index(collection, key_fields)
+    counts = {'inserted': 0, 'existing': 0}
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        requests = [UpdateOne({field: doc[field] for field in key_fields}, {'$setOnInsert': doc}, upsert=True)
+                    for doc in batch]
+        try:
+            result = collection.bulk_write(requests, ordered=False)
+            inserted = result.upserted_count
+        except BulkWriteError as e:
+            # Two writers upserting the same key at the same time: the loser fails on the unique index
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in errors):
+                raise
+            inserted = e.details.get('nUpserted', 0)
+        counts['inserted'] += inserted
+        counts['existing'] += len(batch) - inserted
+    return counts
+
+
+def bulk_replace(collection, documents, key_fields, batch_size=default_batch_size):
+    """
+    Writes documents over the ones with the same key fields, inserting those that are not yet in a collection, in
+    unordered bulk writes. Used by refresh runs, which update the results of documents processed before.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection.
+    - documents (list): Documents to write. Each must contain all the key fields.
+    - key_fields (list): Fields identifying a document, backed by a unique index.
+    - batch_size (int): Number of documents sent in one bulk write.
+
+    Returns:
+    - dict: The number of 'inserted' documents and of 'replaced' documents.
+    """
+    ensure_unique_index(collection, key_fields)
+    counts = {'inserted': 0, 'replaced': 0}
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        requests = [ReplaceOne({field: doc[field] for field in key_fields}, doc, upsert=True) for doc in batch]
+        try:
+            result = collection.bulk_write(requests, ordered=False)
+            inserted, replaced = result.upserted_count, result.matched_count
+        except BulkWriteError as e:
+            # Two writers inserting the same key at the same time: the loser fails on the unique index
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in errors):
+                raise
+            inserted, replaced = e.details.get('nUpserted', 0), e.details.get('nMatched', 0)
+        counts['inserted'] += inserted
+        counts['replaced'] += replaced
+    return counts
+
+
+def bulk_update(collection, updates, key_fields, batch_size=default_batch_size):
+    """
+    Writes only some fields of documents already in a collection, in unordered bulk writes. Used by refresh runs,
+    so that only the fields that changed since the last run are sent. A document missing from the collection is
+    written whole instead.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection.
+    - updates (list): (document, fields, unset) tuples: the whole document, the fields to set (with the key
+      fields), and the names of the fields to remove.
+    - key_fields (list): Fields identifying a document, backed by a unique index.
+    - batch_size (int): Number of documents sent in one bulk write.
+
+    Returns:
+    - dict: The number of 'inserted' documents (missing ones, written whole) and of 'updated' documents.
+    """
+    ensure_unique_index(collection, key_fields)
+    counts = {'inserted': 0, 'updated': 0}
+    for start in range(0, len(updates), batch_size):
+        batch = updates[start:start + batch_size]
+        requests = []
+        for document, fields, unset in batch:
+            update = {'$set': fields}
+            if unset:
+                update['$unset'] = {field: '' for field in unset}
+            requests.append(UpdateOne({field: document[field] for field in key_fields}, update, upsert=True))
+        try:
+            result = collection.bulk_write(requests, ordered=False)
+            updated, upserted = result.matched_count, list(result.upserted_ids)
+        except BulkWriteError as e:
+            # Two writers inserting the same key at the same time: the loser fails on the unique index
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in errors):
+                raise
+            updated, upserted = e.details.get('nMatched', 0), [entry['index'] for entry in e.details.get('upserted', [])]
+        # The upserts created documents with the updated fields only: they are written whole
+        if upserted:
+            bulk_replace(collection, [batch[index][0] for index in upserted], key_fields, batch_size)
+        counts['inserted'] += len(upserted)
+        counts['updated'] += updated
+    return counts
+
+
+class BulkWriter:
+    """
+    Buffers documents from several threads and writes them with bulk_upsert once a batch is full.
+
+    Parameters:
+    - collection (Collection): The MongoDB collection.
+    - key_fields (list): Fields identifying a document, backed by a unique index.
+    - batch_size (int): Number of buffered documents that triggers a write.
+    - replace (bool): Write the documents with bulk_replace instead, over the documents already present. Updates of
+      some fields of documents (see add_updates) are written with bulk_update.
+    """
+
+    def __init__(self, collection, key_fields, batch_size=default_batch_size, replace=False):
+        self.collection = collection
+        self.key_fields = list(key_fields)
+        self.batch_size = batch_size
+        self.replace = replace
+        self.buffer = []
+        self.updates = []
+        self.counts = {'inserted': 0, 'replaced': 0, 'updated': 0} if replace else {'inserted': 0, 'existing': 0}
+        self.lock = threading.Lock()
+
+    def add(self, documents):
+        """
+        Buffers documents, writing the buffer when it reaches the batch size.
+
+        Parameters:
+        - documents (list): Documents to insert.
+        """
+        with self.lock:
+            self.buffer.extend(documents)
+            if len(self.buffer) >= self.batch_size:
+                self._flush()
+
+    def add_updates(self, updates):
+        """
+        Buffers updates of some fields of documents, as taken by bulk_update, with the documents.
+
+        Parameters:
+        - updates (list): (document, fields, unset) tuples.
+        """
+        with self.lock:
+            self.updates.extend(updates)
+            if len(self.buffer) + len(self.updates) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """
+        Writes the buffered documents.
+
+        Returns:
+        - dict: The total number of 'inserted' and 'existing' (or 'replaced' and 'updated') documents written by this
+          writer.
+        """
+        with self.lock:
+            self._flush()
+            return dict(self.counts)
+
+    def _flush(self):
+        if self.buffer:
+            documents, self.buffer = self.buffer, []
+            write = bulk_replace if self.replace else bulk_upsert
+            counts = write(self.collection, documents, self.key_fields, self.batch_size)
+            for name in counts:
+                self.counts[name] += counts[name]
+        if self.updates:
+            updates, self.updates = self.updates, []
+            counts = bulk_update(self.collection, updates, self.key_fields, self.batch_size)
+            for name in counts:
+                self.counts[name] = self.counts.get(name, 0) + counts[name]
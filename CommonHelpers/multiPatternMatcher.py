@@ -0,0 +1,163 @@
+import re  # For jumping to the next possible match start while the automaton is idle
+
+
+def fold_case(text):
+    """
+    Lower-cases a text without changing its length, so offsets in the folded text are offsets in the original.
+
+    Parameters:
+    - text (str): The text to fold.
+
+    Returns:
+    - str: The lower-cased text, with the same length as the input.
+    """
+    folded = text.lower()
+    if len(folded) != len(text):
+        # A few characters (e.g. 'İ') lower-case to two characters, those are kept as they are
+        folded = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+    return folded
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick automaton finding every occurrence of a set of literal patterns in a single pass over a text.
+
+    Patterns are matched literally, so characters such as parentheses, '&' or '.' in fund names need no escaping.
+
+    Parameters:
+    - patterns (list): The literal strings to search for. Duplicates are allowed.
+    - ignore_case (bool): Whether matching is case-insensitive.
+    """
+
+    def __init__(self, patterns, ignore_case=True):
+        self.patterns = list(patterns)
+        self.ignore_case = ignore_case
+
+        # Identical patterns (after case folding) share one entry of the automaton
+        self._keys = []
+        self._key_index = {}
+        for pattern in self.patterns:
+            key = fold_case(pattern) if ignore_case else pattern
+            if key not in self._key_index:
+                self._key_index[key] = len(self._keys)
+                self._keys.append(key)
+
+        self._build()
+
+    def _build(self):
+        goto = [{}]
+        outputs = [[]]
+
+        # Building the trie of all the non-empty patterns
+        for idx, key in enumerate(self._keys):
+            if key == '':
+                continue
+            state = 0
+            for ch in key:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(idx)
+
+        # Breadth-first computation of the failure links, merging the outputs of the fallback states
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[nxt] = goto[fallback].get(ch, 0)
+                outputs[nxt].extend(outputs[fail[nxt]])
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(out) for out in outputs]
+        self._lengths = [len(key) for key in self._keys]
+
+        # Characters that can start a match, used to skip text while the automaton is in its root state
+        first_chars = ''.join(sorted(goto[0].keys()))
+        self._first_char = re.compile('[' + re.escape(first_chars) + ']') if first_chars else None
+
+    def _scan(self, text):
+        """
+        Returns every (overlapping) occurrence start of every distinct pattern key.
+        """
+        if self.ignore_case:
+            text = fold_case(text)
+        positions = [[] for _ in self._keys]
+        goto, fail, outputs, lengths = self._goto, self._fail, self._outputs, self._lengths
+        first_char = self._first_char
+
+        state = 0
+        i = 0
+        n = len(text)
+        while i < n and first_char is not None:
+            if state == 0:
+                match = first_char.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for idx in outputs[state]:
+                positions[idx].append(i - lengths[idx] + 1)
+            i += 1
+
+        # An empty pattern matches at every position, as re.finditer does
+        for idx, key in enumerate(self._keys):
+            if key == '':
+                positions[idx] = list(range(n + 1))
+        return positions
+
+    def find_all(self, text):
+        """
+        Finds all occurrences, including overlapping ones, of every pattern.
+
+        Parameters:
+        - text (str): The text to search.
+
+        Returns:
+        - dict: Maps every pattern to the sorted list of offsets where it starts in the text.
+        """
+        positions = self._scan(text)
+        return {pattern: positions[self._key_index[fold_case(pattern) if self.ignore_case else pattern]]
+                for pattern in self.patterns}
+
+    def find_non_overlapping(self, text):
+        """
+        Finds the occurrences of every pattern the way re.finditer does: left to right, without overlaps
+        between two occurrences of the same pattern.
+
+        Parameters:
+        - text (str): The text to search.
+
+        Returns:
+        - dict: Maps every pattern to the sorted list of offsets where it starts in the text.
+        """
+        positions = self._scan(text)
+        non_overlapping = []
+        for idx, starts in enumerate(positions):
+            length = self._lengths[idx]
+            if length == 0:
+                non_overlapping.append(starts)
+                continue
+            kept = []
+            end = -1
+            for start in starts:
+                if start >= end:
+                    kept.append(start)
+                    end = start + length
+            non_overlapping.append(kept)
+        return {pattern: non_overlapping[self._key_index[fold_case(pattern) if self.ignore_case else pattern]]
+                for pattern in self.patterns}
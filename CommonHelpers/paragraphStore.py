@@ -0,0 +1,179 @@
+import hashlib  # For the content hashes identifying the paragraphs
+import zlib  # For the optional compression of the stored paragraphs
+
+from CommonHelpers import mongoClient
+
+# Field of a Task 3 document naming the collection its paragraphs are stored in; documents without it hold the
+# paragraph texts inline
+PARAGRAPH_STORE_FIELD = 'Paragraph Store'
+
+# Fields of a Task 3 document that do not hold paragraphs
+DOCUMENT_FIELDS = ['_id', 'RFID', PARAGRAPH_STORE_FIELD]
+
+# Number of paragraphs looked up in one query
+default_batch_size = 500
+
+
+def paragraph_id(text):
+    """
+    Returns the identifier of a paragraph: the SHA-256 hash of its text.
+
+    Parameters:
+    - text (str): Text of the paragraph.
+
+    Returns:
+    - str: Hexadecimal hash of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_paragraph(text, compress=False):
+    """
+    Builds the paragraph store document of a paragraph.
+
+    Parameters:
+    - text (str): Text of the paragraph.
+    - compress (bool): Store the text compressed with zlib.
+
+    Returns:
+    - dict: The 'Hash' of the paragraph with its 'text', or its compressed text under 'zlib'.
+    """
+    if compress:
+        return {'Hash': paragraph_id(text), 'zlib': zlib.compress(text.encode('utf-8'))}
+    return {'Hash': paragraph_id(text), 'text': text}
+
+
+def decode_paragraph(document):
+    """
+    Returns the text of a paragraph store document, compressed or not.
+    """
+    if 'zlib' in document:
+        return zlib.decompress(document['zlib']).decode('utf-8')
+    return document['text']
+
+
+def _reference(value, paragraphs):
+    # Paragraph entries are dictionaries with a 'text'; fund level fields group them in a dictionary per fund
+    if isinstance(value, list):
+        return [_reference(entry, paragraphs) for entry in value]
+    if isinstance(value, dict) and 'text' in value:
+        identifier = paragraph_id(value['text'])
+        paragraphs.setdefault(identifier, value['text'])
+        entry = {'paragraph': identifier}
+        entry.update((key, item) for key, item in value.items() if key != 'text')
+        return entry
+    if isinstance(value, dict):
+        return {key: _reference(item, paragraphs) for key, item in value.items()}
+    return value
+
+
+def _resolve(value, texts):
+    if isinstance(value, list):
+        return [_resolve(entry, texts) for entry in value]
+    if isinstance(value, dict) and 'paragraph' in value:
+        entry = {'text': texts[value['paragraph']]}
+        entry.update((key, item) for key, item in value.items() if key != 'paragraph')
+        return entry
+    if isinstance(value, dict):
+        return {key: _resolve(item, texts) for key, item in value.items()}
+    return value
+
+
+def _referenced_ids(value, ids):
+    if isinstance(value, list):
+        for entry in value:
+            _referenced_ids(entry, ids)
+    elif isinstance(value, dict) and 'paragraph' in value:
+        ids.add(value['paragraph'])
+    elif isinstance(value, dict):
+        for item in value.values():
+            _referenced_ids(item, ids)
+    return ids
+
+
+def reference_document(document, store_name):
+    """
+    Replaces the paragraph texts of a Task 3 document with references to the paragraph store.
+
+    Parameters:
+    - document (dict): Task 3 document with the paragraphs inline: every field maps to a list of {'text', 'offset'}
+      entries, or to a dictionary of such lists per fund.
+    - store_name (str): Name of the paragraph store collection, recorded in the document.
+
+    Returns:
+    - tuple: The document with {'paragraph', 'offset'} entries instead, and the texts of its distinct paragraphs
+      keyed by paragraph identifier.
+    """
+    paragraphs = {}
+    referenced = {}
+    for field, value in document.items():
+        referenced[field] = value if field in DOCUMENT_FIELDS else _reference(value, paragraphs)
+    referenced[PARAGRAPH_STORE_FIELD] = store_name
+    return referenced, paragraphs
+
+
+def store_document(document, store_collection, compress=False):
+    """
+    Writes the distinct paragraphs of a Task 3 document to the paragraph store, each once, and returns the
+    document referencing them. Paragraphs already in the store are left untouched.
+
+    Parameters:
+    - document (dict): Task 3 document with the paragraphs inline.
+    - store_collection (Collection): The paragraph store collection.
+    - compress (bool): Store the new paragraphs compressed with zlib.
+
+    Returns:
+    - dict: The document to write to the Task 3 collection.
+    """
+    referenced, paragraphs = reference_document(document, store_collection.name)
+    if paragraphs:
+        mongoClient.bulk_upsert(store_collection, [encode_paragraph(text, compress) for text in paragraphs.values()], ['Hash'])
+    return referenced
+
+
+def load_paragraphs(collection, ids, batch_size=default_batch_size):
+    """
+    Loads paragraphs from the paragraph store with one $in query per batch.
+
+    Parameters:
+    - collection (Collection): The paragraph store collection.
+    - ids (iterable): Paragraph identifiers.
+    - batch_size (int): Number of identifiers looked up in one query.
+
+    Returns:
+    - dict: Paragraph identifiers mapped to their text. Identifiers missing from the store are left out.
+    """
+    ids = list(dict.fromkeys(ids))
+    texts = {}
+    for start in range(0, len(ids), batch_size):
+        for document in collection.find({'Hash': {'$in': ids[start:start + batch_size]}}, {'_id': 0}):
+            texts[document['Hash']] = decode_paragraph(document)
+    return texts
+
+
+def resolve_document(document, database):
+    """
+    Returns a Task 3 document with its paragraph texts inline, whichever format it was stored in.
+
+    Parameters:
+    - document (dict): Task 3 document, with the paragraphs inline or referencing a paragraph store.
+    - database (Database): The MongoDB database holding the paragraph store collection.
+
+    Returns:
+    - dict: The document with every field holding {'text', 'offset'} entries, as Task 3 has always written them.
+
+    Raises:
+    - KeyError: If a referenced paragraph is missing from the store.
+    """
+    if document is None or PARAGRAPH_STORE_FIELD not in document:
+        return document
+    ids = set()
+    for field, value in document.items():
+        if field not in DOCUMENT_FIELDS:
+            _referenced_ids(value, ids)
+    texts = load_paragraphs(database[document[PARAGRAPH_STORE_FIELD]], ids)
+    missing = ids - set(texts)
+    if missing:
+        raise KeyError("paragraphs missing from the store " + document[PARAGRAPH_STORE_FIELD] + ": " + ", ".join(sorted(missing)[:5]))
+    return {field: value if field in DOCUMENT_FIELDS else _resolve(value, texts)
+            for field, value in document.items() if field != PARAGRAPH_STORE_FIELD}
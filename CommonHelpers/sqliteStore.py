@@ -0,0 +1,69 @@
+import os  # For creating the directory of the database file
+import sqlite3  # Standard library SQLite driver
+import threading  # For keeping one connection per thread
+from contextlib import contextmanager  # For the transaction helper
+
+
+class SqliteStore:
+    """
+    Small wrapper around a SQLite database file used by the on-disk caches.
+
+    One connection is opened per thread and per process, so a single store object can be shared by
+    thread pools and by worker processes forked from the main process.
+
+    Parameters:
+    - path (str): Location of the SQLite database file. The parent directory is created if required.
+    - schema (str): SQL script executed once per connection to create the tables and indexes.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connection(self):
+        """
+        Returns the connection of the current thread, opening it on first use.
+
+        Returns:
+        - sqlite3.Connection: Connection in autocommit mode with the schema applied.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            # isolation_level=None keeps the connection in autocommit mode, transactions are explicit
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed statements in a single write transaction.
+
+        Yields:
+        - sqlite3.Connection: The connection of the current thread.
+        """
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """
+        Closes the connection of the current thread, if any.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,34 @@
+import multiprocessing  # For the start method of the worker processes
+from concurrent.futures import ProcessPoolExecutor
+
+
+def worker_context():
+    """
+    Returns the multiprocessing context the batch runners and the chunked Task 3 extraction start their worker
+    processes with.
+
+    By the time the workers are started, the process may have threads of its own and the pooled MongoClient
+    has started its monitor and connection pool threads. A worker forked at that moment can inherit a lock held by
+    one of them and hang, so the workers are started from a fresh process instead: forkserver, or spawn where it is
+    not available. The function given to the pool must then be importable at module level and its arguments
+    picklable.
+
+    Returns:
+    - multiprocessing.context.BaseContext: The forkserver context, or the spawn context.
+    """
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(start_method)
+
+
+def worker_pool(workers, **kwargs):
+    """
+    Creates a pool of worker processes started with worker_context.
+
+    Parameters:
+    - workers (int): Number of worker processes.
+    - **kwargs: Other arguments of ProcessPoolExecutor (e.g. initializer).
+
+    Returns:
+    - ProcessPoolExecutor: The pool, to be used as a context manager.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=worker_context(), **kwargs)
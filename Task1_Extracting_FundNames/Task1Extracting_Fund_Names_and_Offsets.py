@@ -1,24 +1,34 @@
 from bs4 import BeautifulSoup
 import requests
 import re
-import pymongo
 import os
-import openai
 import sys
 import json
+import time
+from bisect import bisect_left
+import argparse
+from html.parser import HTMLParser
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import warnings
 warnings.filterwarnings('ignore')
 
+# Making the shared helpers importable when the script is run from its own folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CommonHelpers import documentCache, extractionState, llmGateway, mongoClient
+from CommonHelpers.multiPatternMatcher import MultiPatternMatcher
+from CommonHelpers.htmlTextMap import HtmlTextMap
+
 # Loading MongoDB connection string
 directory = os.path.abspath('./')
-with open (directory + "\\mongodbConnectionParameters.txt", "r") as myfile:
+with open (os.path.join(directory, "mongodbConnectionParameters.txt"), "r") as myfile:
     dataString = myfile.read().split('\n')
     os.environ['MONGODB_CONNECTION_STRING'] = dataString[0]
     os.environ['MONGODB_DATABASE'] = dataString[1]
     os.environ['MONGODB_COLLECTION'] = dataString[2]
 
 # Load training prompt data from the JSON file
-with open(directory + "\\Task1_Extracting_FundNames\\Task1GptTrainMessage.json", 'r',encoding='utf-8') as json_file:
+with open(os.path.join(directory, "Task1_Extracting_FundNames", "Task1GptTrainMessage.json"), 'r',encoding='utf-8') as json_file:
     prompt_train = json.load(json_file)
 
 gpt_model_task1 = "gpt-4"
@@ -28,6 +38,17 @@ gpt_top_p = 1
 gpt_frequency_penalty = 0
 gpt_presence_penalty = 0
 
+# Headings used to validate the offsets of the fund names: searched in the visible text (case-insensitive)
+investment_headings = ['The Fund’s Investment Goal','Investment Objective','Investment Objectives','Investment Goal']
+fee_heading = 'fees'
+# and expected close to the fund names in the HTML (case-sensitive)
+close_by_headings = ['Fees and Expenses','INVESTMENT OBJECTIVE','Investment Objective','Investment Objectives','Investment Goal','nvestment Objective']
+
+# Concurrency settings for batch runs
+batch_workers = 8
+batch_llm_concurrency = 4
+batch_write_size = 100
+
 try:
     mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
     mongo_database = os.environ.get('MONGODB_DATABASE')
@@ -37,10 +58,116 @@ except:
 
 
 #Using the OpenAI API to generate text
-api_key_path = directory + "\\Key.txt"
-openai.api_key_path = api_key_path
+api_key_path = os.path.join(directory, "Key.txt")
+
+class CoverPageParser(HTMLParser):
+    """
+    Incremental parser collecting the text of the first N elements that directly contain non-empty text.
+
+    It reproduces the BeautifulSoup based extraction of get_text_from_url (the text of the parent of each of the
+    first max_tags non-empty strings, concatenated and cut to max_length characters) while the document is being
+    read, and reports through done() as soon as that text can no longer change.
+
+    Parameters:
+    - max_tags (int): Maximum number of tags to consider.
+    - max_length (int): Maximum length of the resulting text.
+    """
+
+    # Elements without content, closed as soon as they are opened
+    void_tags = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+    def __init__(self, max_tags=50, max_length=6000):
+        super().__init__(convert_charrefs=True)
+        self.max_tags = max_tags
+        self.max_length = max_length
+        self.text_parts = []
+        self.text_length = 0
+
+        # Every element is [name, start of its text, end of its text (None while open)]
+        self.root = ['[document]', 0, None]
+        self.stack = [self.root]
+        self.selected = []
+
+        # Consecutive data events form a single string, whose parent is selected once
+        self.string_selected = False
+
+    def _select(self, element):
+        if len(self.selected) < self.max_tags and element[0] not in ['script', 'style']:
+            self.selected.append(element)
+
+    def _end_string(self):
+        self.string_selected = False
+
+    def handle_starttag(self, tag, attrs):
+        self._end_string()
+        if tag in self.void_tags:
+            return
+        self.stack.append([tag, self.text_length, None])
+
+    def handle_endtag(self, tag):
+        self._end_string()
+        # Closing the nearest open element with this name, unmatched end tags are ignored
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i][0] == tag:
+                for element in self.stack[i:]:
+                    element[2] = self.text_length
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        parent = self.stack[-1]
+        if parent[0] in ['script', 'style']:
+            return
+        self.text_parts.append(data)
+        self.text_length += len(data)
+        if not self.string_selected and len(data.strip()) > 0:
+            self.string_selected = True
+            self._select(parent)
+
+    def handle_comment(self, data):
+        self._end_string()
+        if len(data.strip()) > 0:
+            self._select(self.stack[-1])
+
+    def handle_decl(self, decl):
+        self._end_string()
+        # The parent of the doctype is the document itself
+        if len(decl.strip()) > 0:
+            self._select(self.root)
+
+    def handle_pi(self, data):
+        self._end_string()
+        if len(data.strip()) > 0:
+            self._select(self.stack[-1])
+
+    def done(self):
+        """
+        Returns True when the collected text can no longer change, i.e. more input is not needed.
+        """
+        length = 0
+        for element in self.selected:
+            if element[2] is None:
+                # An open element only grows, so the prefix is final once it reaches max_length
+                return length + self.text_length - element[1] >= self.max_length
+            length += element[2] - element[1]
+            if length >= self.max_length:
+                return True
+        return len(self.selected) >= self.max_tags
+
+    def get_text(self):
+        """
+        Returns the concatenated text of the selected elements, cut to max_length characters.
+        """
+        text = ''.join(self.text_parts)
+        current_text = ''
+        for element in self.selected:
+            end = element[2] if element[2] is not None else len(text)
+            current_text += text[element[1]:end]
+            if len(current_text) >= self.max_length:
+                break
+        return current_text[:self.max_length]
 
-def get_text_from_url(url, max_tags=50, max_length=6000):
+def get_text_from_url(url, max_tags=50, max_length=6000, stream=True):
     """
     Retrieve text content from a URL by extracting the text from the first N non-empty tags.
 
@@ -48,15 +175,28 @@ def get_text_from_url(url, max_tags=50, max_length=6000):
     - url (str): The URL to fetch the content from.
     - max_tags (int): Maximum number of tags to consider.
     - max_length (int): Maximum length of the resulting text.
+    - stream (bool): Read the document in chunks and stop as soon as the tag or length budget is met,
+      instead of parsing the whole document.
 
     Returns:
     - str: The extracted text content.
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Check for HTTP errors
+        if stream:
+            # Feeding the document chunk by chunk to an incremental parser, stopping as early as possible
+            parser = CoverPageParser(max_tags, max_length)
+            for chunk in documentCache.iter_text_chunks(url):
+                parser.feed(chunk)
+                if parser.done():
+                    break
+            else:
+                parser.close()
+            return parser.get_text()
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Fetching the prospectus through the shared document cache (raises on HTTP errors)
+        html = documentCache.fetch_text(url)
+
+        soup = BeautifulSoup(html, 'html.parser')
         text_tags = soup.find_all(text=True)
 
         first_n_tags = []
@@ -80,129 +220,183 @@ def get_text_from_url(url, max_tags=50, max_length=6000):
         print(f"Error retrieving content from {url}: {e}")
         return ""
 
-def get_fund_names(Input_RFID):
+def get_cover_page_prompt(rfid):
     """
-    Retrieves the fund names associated with given RFIDs from mutual fund prospectuses.
-    
-    Utilizes the openai.ChatCompletion API by sending a training prompt that includes previously extracted fund names from the prospectus as examples. Additionally, appends the initial text data from the first few pages of the current RFID's prospectus as a test prompt. The objective is to retrieve fund names with the provided RFIDs.
+    Builds the test part of the ChatGPT prompt from the first pages of a prospectus.
 
     Parameters:
-    - Input_RFID (list): List of RFIDs (strings) for which fund names need to be retrieved.
+    - rfid (str): RFID of the prospectus.
 
     Returns:
-    - target_strings (dict): A dictionary mapping each RFID to its corresponding fund names.
+    - str: The cleaned cover page text followed by the "Fund Name: " cue, or "" if no text could be retrieved.
     """
-    # Generating the test part of the prompt for ChatGPT
-    html_text_from_current_prospectus = []
-    for rfid in Input_RFID:
-        url = "https://prospectus-express.broadridge.com/getdocument.asp?rfid="+str(rfid)
-        try:
-            current = get_text_from_url(url)
-            html_text_from_current_prospectus.append(current)
-        except requests.exceptions.RequestException as e:
-            # Handle exceptions (e.g., connection error, HTTP error)
-            print(f"Error retrieving content from {url}: {e}")
-            return ""
+    url = documentCache.prospectus_url(rfid)
+    current = get_text_from_url(url)
+    if current == "":
+        return ""
 
     # Removing all the unnecessary characters from the text
     remove = ['\n', '\t', '\r', '\xa0', '\u200b', '\u200e', '\u200f', '\u202a', '\u202c', '\u202d', '\u202e', '\u2060', '\ufeff']
-    for i in range(len(html_text_from_current_prospectus)):
-        html_text_from_current_prospectus[i] = re.sub(r'|'.join(map(re.escape, remove)), '', html_text_from_current_prospectus[i])
-        html_text_from_current_prospectus[i] = html_text_from_current_prospectus[i] + "\nFund Name: "
+    current = re.sub(r'|'.join(map(re.escape, remove)), '', current)
+    return current + "\nFund Name: "
+
+def request_fund_names(cover_page_prompt):
+    """
+    Sends the training prompt followed by the cover page of one prospectus to ChatGPT and parses the fund names.
 
-    # Add the new interaction to the training prompt data
+    Parameters:
+    - cover_page_prompt (str): Test prompt built by get_cover_page_prompt.
+
+    Returns:
+    - list: The fund names returned by the model.
+    """
+    # Add the new interaction to a copy of the training prompt data, so concurrent requests do not share it
     new_interaction = {
         "role": "user",
-        "content": html_text_from_current_prospectus[0]
+        "content": cover_page_prompt
     }
-    prompt_train.append(new_interaction)
-    output = []
-    for i in range(len(html_text_from_current_prospectus)):
-        response = openai.ChatCompletion.create(
-            model=gpt_model_task1,
-            messages=prompt_train,
-            temperature=gpt_temperature,
-            top_p=gpt_top_p,
-            max_tokens=gpt_max_tokens,
-            frequency_penalty=gpt_frequency_penalty,
-            presence_penalty=gpt_presence_penalty
-        )
-
-        # Appending the generated fund name to the output list
-        outputFund = response.choices[0]['message']['content']
-        # If output starts with "Fund Name: ", then remove it
-        if outputFund[:12] == "Fund Name: ":
-            output.append(response.choices[0]['message']['content'][12:])
-        else:
-            output.append(response.choices[0]['message']['content'])
-
-    # Removing all the unnecessary characters from the output
-    for i in range(len(output)):
-        output[i] = output[i].strip()
+    messages = prompt_train + [new_interaction]
+
+    # Sending the request through the shared gateway (response cache, rate limits and retries)
+    response = llmGateway.chat_completion(
+        api_key_path=api_key_path,
+        model=gpt_model_task1,
+        messages=messages,
+        temperature=gpt_temperature,
+        top_p=gpt_top_p,
+        max_tokens=gpt_max_tokens,
+        frequency_penalty=gpt_frequency_penalty,
+        presence_penalty=gpt_presence_penalty
+    )
+
+    # If output starts with "Fund Name: ", then remove it
+    outputFund = response.choices[0]['message']['content']
+    if outputFund[:12] == "Fund Name: ":
+        outputFund = outputFund[12:]
 
     # Splitting the output into a list of fund names
-    output_fund_list = []
-    for i in range(len(output)):
-        output_fund_list.append(output[i])
-    for i in range(len(output_fund_list)):
-        output_fund_list[i] = output_fund_list[i].split(', ')
+    return outputFund.strip().split(', ')
+
+def get_fund_names(Input_RFID):
+    """
+    Retrieves the fund names associated with given RFIDs from mutual fund prospectuses.
+    
+    Utilizes the openai.ChatCompletion API by sending a training prompt that includes previously extracted fund names from the prospectus as examples. Additionally, appends the initial text data from the first few pages of each RFID's prospectus as a test prompt. The objective is to retrieve fund names with the provided RFIDs.
+
+    Parameters:
+    - Input_RFID (list): List of RFIDs (strings) for which fund names need to be retrieved.
 
+    Returns:
+    - target_strings (dict): A dictionary mapping each RFID to its corresponding fund names.
+    """
     # Creating a dictionary of the RFIDs and their corresponding fund names
     target_strings = {}
-    for i in range(len(Input_RFID)):
-        target_strings[Input_RFID[i]] = output_fund_list[i]
+    for rfid in Input_RFID:
+        cover_page_prompt = get_cover_page_prompt(rfid)
+        if cover_page_prompt == "":
+            print(f"Error retrieving the cover page for RFID {rfid}")
+            return ""
+        target_strings[rfid] = request_fund_names(cover_page_prompt)
 
     return target_strings
 
-def check_if_fees(visibleText, startIndex):
+def build_heading_index(visibleText=None, html=None):
+    """
+        Records, in one pass per document, the sorted positions of the section headings used to validate fund name offsets.
+
+        Parameters:
+        - visibleText (str): Visible text of the prospectus, searched case-insensitively for the Investment Objective / Goal headings and for "fees".
+        - html (str): Raw HTML of the prospectus, searched case-sensitively for the headings expected close to a fund name.
+
+        Returns:
+        - dict: Sorted heading positions in the text ('text', 'fees') and in the HTML ('html') coordinate spaces.
+    """
+    heading_index = {'text': {}, 'fees': [], 'html': {}}
+    if visibleText is not None:
+        text_matches = MultiPatternMatcher(investment_headings + [fee_heading]).find_all(visibleText)
+        heading_index['fees'] = text_matches[fee_heading]
+        heading_index['text'] = {heading: text_matches[heading] for heading in investment_headings}
+    if html is not None:
+        heading_index['html'] = MultiPatternMatcher(close_by_headings, ignore_case=False).find_all(html)
+    return heading_index
+
+def next_heading_position(positions, startIndex):
+    """
+        Returns the first position at or after startIndex in a sorted list of heading positions, or None.
+    """
+    k = bisect_left(positions, startIndex)
+    if k < len(positions):
+        return positions[k]
+    return None
+
+def check_if_fees(visibleText, startIndex, heading_index=None):
     """
         Checks if the given text contains section regarding Fees and Expenses.
 
         Parameters:
         - visibleText (str): The text to search for fees.
         - startIndex (int): Starting index for the search.
+        - heading_index (dict): Heading positions built by build_heading_index for visibleText.
 
         Returns:
         - bool: True if the Fees and Expenses information is present, False otherwise.
     """
-    feeString = 'fees'
-    feePattern = re.compile(rf"{feeString}", re.IGNORECASE)
-    match = feePattern.search(visibleText, startIndex)
-    if not match:
+    if heading_index is None:
+        heading_index = build_heading_index(visibleText)
+    match_start = next_heading_position(heading_index['fees'], startIndex)
+    if match_start is None:
         return True
-    if match.start() - startIndex >= 50:
+    if match_start - startIndex >= 50:
         return True
 
     return False
 
-def check_if_investment(visibleText, startIndex):
+def check_if_investment(visibleText, startIndex, heading_index=None):
     """
         Checks if the given text contains section regarding Investment Objective of a Fund.
 
         Parameters:
         - visibleText (str): The text to search for investment information.
-        - index (int): Starting index for the search.
+        - startIndex (int): Starting index for the search.
+        - heading_index (dict): Heading positions built by build_heading_index for visibleText.
 
         Returns:
         - bool: True if investment objective section is present, False otherwise.
     """
-    close_string = ['The Fund’s Investment Goal','Investment Objective','Investment Objectives','Investment Goal']
-    i_pattern = False
-    while(not i_pattern):
-        for i_string in close_string:
-            i_pattern = re.compile(rf"{i_string}", re.IGNORECASE)
-            match = i_pattern.search(visibleText, startIndex)
-            if match:
-                if match.start() - startIndex <= 300:
-                    return check_if_fees(visibleText,match.start())
+    if heading_index is None:
+        heading_index = build_heading_index(visibleText)
+    for i_string in investment_headings:
+        match_start = next_heading_position(heading_index['text'][i_string], startIndex)
+        if match_start is not None and match_start - startIndex <= 300:
+            return check_if_fees(visibleText, match_start, heading_index)
+    return False
+
+def check_if_close_to_heading(heading_index, offset, window=1750):
+    """
+        Checks if one of the close-by headings starts and ends within `window` characters after an HTML offset.
 
-def text_offsets_extraction(rfid, fundNamesList):
+        Parameters:
+        - heading_index (dict): Heading positions built by build_heading_index for the HTML.
+        - offset (int): Offset of the fund name in the HTML.
+        - window (int): Number of characters after the offset to look at.
+
+        Returns:
+        - bool: True if a close-by heading is found, False otherwise.
+    """
+    for heading, positions in heading_index['html'].items():
+        match_start = next_heading_position(positions, offset)
+        if match_start is not None and match_start + len(heading) <= offset + window:
+            return True
+    return False
+
+def text_offsets_extraction(rfid, fundNamesList, matcher=None):
     """
         Retrieves HTML and text offsets for given RFIDs and search strings.
 
         Parameters:
         - rfid (str): RFID for which offsets are to be retrieved.
         - fundNamesList (list): List of search strings (Fund names from the prospectus)
+        - matcher (MultiPatternMatcher): Optional matcher already built for fundNamesList.
 
         Returns:
         - offset_collection (dict): A dictionary containing offsets for each search string.
@@ -211,30 +405,24 @@ def text_offsets_extraction(rfid, fundNamesList):
     offset_collection = {}
     # Retrieve HTML content of URL
     try:
-        response = requests.get(url)
-        html = response.text
+        html = documentCache.fetch_text(url)
 
-        # Use BeautifulSoup to extract visible text from HTML
-        soup = BeautifulSoup(html, 'html.parser')
-        visible_text = soup.get_text()
-        visible_text = re.sub(r'\\.', '', visible_text)
+        # Extract the visible text from HTML (same text as BeautifulSoup's get_text() without the backslash escapes)
+        visible_text = HtmlTextMap(html, remove_escapes=True).text
         present = {}
 
+        # Finding the occurrences of all the fund names in a single pass over the text
+        if matcher is None:
+            matcher = MultiPatternMatcher(fundNamesList)
+        fund_matches = matcher.find_non_overlapping(visible_text)
+        heading_index = build_heading_index(visible_text)
+
         # Iterate through the funds list to get the offset of each fund
         for fund in fundNamesList:
-            pattern = re.compile(rf"{fund}", re.IGNORECASE)
-            start = 0
-
-            while True:
-                match = pattern.search(visible_text, start)
-                if not match:
+            for match_start in fund_matches[fund]:
+                if check_if_investment(visible_text, match_start, heading_index):
+                    present[fund] = [match_start] # match_start gives the offset value
                     break
-
-                else:
-                    if check_if_investment(visible_text, match.start()):
-                        present[fund] = [match.start()] # match.start() gives the offset value 
-                        break
-                start = match.end()
         offset_collection[rfid] = present
         return offset_collection
     except requests.exceptions.RequestException as e:
@@ -255,35 +443,35 @@ def get_offsets(Input_RFID,target_strings):
     - tags (dict): HTML offsets for each fund name.
     - text_tags (dict): Text offsets for each fund name.
     """
-    # Using these keywords to get the HTML offsets of the fund names
-    closeByString = ['Fees and Expenses','INVESTMENT OBJECTIVE','Investment Objective','Investment Objectives','Investment Goal','nvestment Objective']
     tags = {}
     text_tags = {}
     for rfid in Input_RFID:
         current = {}
         url = "https://prospectus-express.broadridge.com/getdocument.asp?rfid="+str(rfid)
         try:
-            html = requests.get(url).text
+            html = documentCache.fetch_text(url)
 
             # Assigning 0 offset for RFIDs with only one fund name
             if len(target_strings[rfid] ) == 1:
                 tags[rfid] = {target_strings[rfid][0]:[0]}
                 text_tags[rfid] = {target_strings[rfid][0]:[0]}
             else:
+                # Finding the occurrences of all the fund names in a single pass over the HTML
+                matcher = MultiPatternMatcher(target_strings[rfid])
+                fund_matches = matcher.find_non_overlapping(html)
+                heading_index = build_heading_index(html=html)
+
                 # Getting the HTML offsets for RFIDs with more than one fund name
                 for fund in target_strings[rfid]:
-                    flag = False
-                    offsets =  [m.start() for m in re.finditer(fund, html, re.IGNORECASE) ]
-                    for offset in offsets:
-                        for tag in closeByString:
-                            if tag in html[offset:offset+1750]:
-                                offsets = [offset]
-                                flag = True
+                    offsets = fund_matches[fund]
+
+                    # Keeping the last occurrence followed closely by one of the section headings
+                    close_offsets = [offset for offset in offsets if check_if_close_to_heading(heading_index, offset)]
                     try:
-                        if flag == False:
+                        if len(close_offsets) == 0:
                             current[fund] = [offsets[2]]
                         else:
-                            current[fund] = offsets
+                            current[fund] = [close_offsets[-1]]
                     except:
                         # Setting offset to -1 when offset was not found
                         print("Error Finding offset for: " + str(fund))
@@ -291,7 +479,7 @@ def get_offsets(Input_RFID,target_strings):
                 tags[rfid] = current
 
                 # Getting the text offsets for RFIDs with more than one fund name
-                textOffsets = text_offsets_extraction(rfid, target_strings[rfid])
+                textOffsets = text_offsets_extraction(rfid, target_strings[rfid], matcher)
 
                 # Handling the case where the text offsets are not found or, are incomplete
                 if textOffsets[rfid] == {}:
@@ -311,21 +499,39 @@ def get_offsets(Input_RFID,target_strings):
                 # Assigning to text_tags dictionary when the right text offsets are found
                 else:
                     text_tags[rfid] = textOffsets[rfid]          
-            return tags, text_tags
         except requests.exceptions.RequestException as e:
             # Handle exceptions (e.g., connection error, HTTP error)
             print(f"Error retrieving content from {url}: {e}")
             return ""
+    return tags, text_tags
 
-# Inserting the data into MongoDB
-def insert_into_mongoDB(Input_RFID, tags, text_tags):
+# Getting the Task 1 collection through the shared MongoDB client
+def get_collection():
+    return mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_collection)
+
+# Getting the collection of the states of the RFIDs, which refresh runs compare the prospectuses with
+def get_state_collection():
+    collection = mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_collection + "_State")
+    mongoClient.ensure_unique_index(collection, ["RFID"])
+    return collection
+
+# Hashing the inputs of the fund names and offsets of an RFID: the prospectus and the ChatGPT request settings
+def task1_hashes(content):
+    request = [gpt_model_task1, gpt_temperature, gpt_max_tokens, gpt_top_p, gpt_frequency_penalty, gpt_presence_penalty, prompt_train]
+    return {"Content Hash": extractionState.content_hash(content), "Prompt Hash": extractionState.content_hash(request)}
+
+# Building the MongoDB documents of the RFIDs
+def build_documents(Input_RFID, tags, text_tags):
     """
-    Inserts data into MongoDB collection.
+    Builds one MongoDB document per RFID with the text offset of each fund name.
 
     Parameters:
     - Input_RFID (list): List of RFIDs.
     - tags (dict): HTML offsets for each fund name.
     - text_tags (dict): Text offsets for each fund name.
+
+    Returns:
+    - list: The documents of the RFIDs that could be built.
     """
     documents = []
     for rfid in Input_RFID:
@@ -338,49 +544,233 @@ def insert_into_mongoDB(Input_RFID, tags, text_tags):
             documents.append(dict)
         except:
             print("Error with RFID: " + str(rfid))
-    client = pymongo.MongoClient(mongo_connection_string)
-    db = client[mongo_database]
-    collection = db[mongo_collection]
-    collection.insert_many(documents)
+    return documents
+
+# Inserting the data into MongoDB
+def insert_into_mongoDB(Input_RFID, tags, text_tags):
+    """
+    Inserts data into MongoDB collection. RFIDs already present in the collection are left untouched.
+
+    Parameters:
+    - Input_RFID (list): List of RFIDs.
+    - tags (dict): HTML offsets for each fund name.
+    - text_tags (dict): Text offsets for each fund name.
+    """
+    documents = build_documents(Input_RFID, tags, text_tags)
+    mongoClient.bulk_upsert(get_collection(), documents, ["RFID"])
     return
 
-def task1(RFID):
+def task1(RFID, refresh=False):
     """
     Main function for Task 1. Retrieves fund names, HTML, and text offsets and inserts data into MongoDB.
 
     Parameters:
     - RFID (str): RFID for which data is to be processed.
+    - refresh (bool): Update the document of an RFID processed before. Nothing is done if the prospectus is
+      unchanged since the last run, and the fund names are not asked to ChatGPT again if its cover page is unchanged.
     """
     Input_RFID = str(RFID)
 
     # Checking if the RFID is already present in the database
-    client = pymongo.MongoClient(mongo_connection_string)
-    db = client[mongo_database]
-    collection = db[mongo_collection]
-    if collection.find_one({"RFID": Input_RFID}) is None:
+    collection = get_collection()
+    if not refresh and collection.find_one({"RFID": Input_RFID}, {"_id": 1}) is not None:
+        print("RFID already present in the database")
+        return
 
-        #Getting the fund names
-        Input_RFID = [Input_RFID]
-        target_strings = get_fund_names(Input_RFID)
+    state_collection = get_state_collection()
+    previous_state = extractionState.load_state(state_collection, Input_RFID) if refresh else None
+    try:
+        # Getting the fund names and the HTML and Text offsets
+        documents, state = process_rfid(Input_RFID, threading.BoundedSemaphore(1), previous_state, refresh)
+    except Exception as e:
+        print("Error with RFID: " + Input_RFID + ": " + str(e))
+        return
+    if state is None:
+        print("RFID unchanged since the last run")
+        return
+
+    # Inserting the data into MongoDB, then the state of the run
+    if documents is None:
+        print("Fund names and offsets unchanged")
+    elif refresh:
+        mongoClient.bulk_replace(collection, documents, ["RFID"])
+    elif mongoClient.bulk_upsert(collection, documents, ["RFID"])['inserted'] == 0:
+        print("RFID already present in the database")
+        return
+    extractionState.write_states(state_collection, [state])
 
-        # Getting the HTML and Text offsets
-        tags, text_tags = get_offsets(Input_RFID,target_strings)
+def read_rfids(source):
+    """
+    Reads RFIDs, one per line, from a file or from standard input.
 
-        # Inserting the data into MongoDB
-        insert_into_mongoDB(Input_RFID, tags, text_tags)
+    Parameters:
+    - source (str): Path of the file, or "-" for standard input.
+
+    Yields:
+    - str: Each non-empty RFID in the order it appears.
+    """
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        for line in stream:
+            rfid = line.strip()
+            if rfid:
+                yield rfid
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def process_rfid(rfid, llm_semaphore, previous_state=None, refresh=False):
+    """
+    Runs Task 1 for one RFID of a batch: cover page, fund names and offsets.
+
+    Parameters:
+    - rfid (str): RFID to process.
+    - llm_semaphore (threading.Semaphore): Limits the number of concurrent ChatGPT requests.
+    - previous_state (dict): State of the last run of the RFID, in a refresh run. The fund names of the last run
+      are reused when the cover page is unchanged.
+    - refresh (bool): Revalidate the cached prospectus with the server first, whatever its age.
+
+    Returns:
+    - list: The MongoDB documents of the RFID, None in a refresh run if they are the same as in the last run.
+    - dict: The state of the run, None if the prospectus is unchanged since the last run and was not processed.
+    """
+    # In a refresh run the cached document is revalidated with the server first, so an amendment filed since it was
+    # cached is seen by everything below, and hashed to skip it if unchanged. Otherwise the cover page is streamed
+    # and the document is only hashed once get_offsets has fetched it
+    hashes = None
+    if refresh or previous_state is not None:
+        content = documentCache.fetch_content(documentCache.prospectus_url(rfid), revalidate=refresh)
+        if previous_state is not None:
+            hashes = task1_hashes(content)
+            if extractionState.unchanged(previous_state, hashes):
+                return None, None
+
+    cover_page_prompt = get_cover_page_prompt(rfid)
+    if cover_page_prompt == "":
+        raise ValueError("no cover page text retrieved")
+
+    cover_page_hash = extractionState.content_hash(cover_page_prompt)
+    if previous_state is not None and extractionState.unchanged(previous_state, {"Prompt Hash": hashes["Prompt Hash"], "Cover Page Hash": cover_page_hash}):
+        # Same cover page as in the last run: its fund names are carried forward
+        fund_names = previous_state["Fund Names"]
     else:
-        print("RFID already present in the database")
+        with llm_semaphore:
+            fund_names = request_fund_names(cover_page_prompt)
+
+    offsets = get_offsets([rfid], {rfid: fund_names})
+    if not offsets:
+        raise ValueError("offsets could not be computed")
+    tags, text_tags = offsets
+    documents = build_documents([rfid], tags, text_tags)
+    if not documents:
+        raise ValueError("no document could be built")
+
+    if hashes is None:
+        hashes = task1_hashes(documentCache.fetch_content(documentCache.prospectus_url(rfid)))
+    state = extractionState.build_state(rfid, hashes, documents, {"Cover Page Hash": cover_page_hash, "Fund Names": fund_names})
+    if previous_state is not None and extractionState.output_unchanged(previous_state, documents):
+        return None, state
+    return documents, state
+
+def task1_batch(rfid_source, workers=batch_workers, llm_concurrency=batch_llm_concurrency, refresh=False):
+    """
+    Runs Task 1 for a file or stream of RFIDs.
+
+    Cover pages are fetched by a pool of worker threads and the ChatGPT requests are sent concurrently,
+    limited to llm_concurrency requests in flight. Results are upserted to MongoDB in batches of
+    batch_write_size RFIDs, RFIDs already present in the database are skipped and a failing RFID does not stop
+    the batch. The state of every RFID is written after its document, for refresh runs.
+
+    Parameters:
+    - rfid_source (str): Path of a file with one RFID per line, or "-" for standard input.
+    - workers (int): Number of RFIDs processed concurrently.
+    - llm_concurrency (int): Maximum number of concurrent ChatGPT requests.
+    - refresh (bool): Process again the RFIDs already in the database, see task1. Their documents are replaced
+      only if they changed.
+
+    Returns:
+    - dict: Counts of processed, skipped, failed, unchanged (prospectus unchanged) and carried forward (same fund
+      names and offsets) RFIDs, elapsed seconds and throughput in RFIDs per minute.
+    """
+    collection = get_collection()
+    state_collection = get_state_collection()
+    writer = mongoClient.BulkWriter(collection, ["RFID"], batch_write_size, replace=refresh)
+    llm_semaphore = threading.BoundedSemaphore(llm_concurrency)
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "unchanged": 0, "carried_forward": 0}
+    start_time = time.time()
+    states = []
+
+    def write_states():
+        # The buffered documents are written first, so a state never describes a document that was not written
+        writer.flush()
+        extractionState.write_states(state_collection, states)
+        del states[:]
+
+    def collect(done):
+        for future in done:
+            rfid = pending.pop(future)
+            try:
+                documents, state = future.result()
+                if state is None:
+                    stats["unchanged"] += 1
+                    continue
+                if documents is None:
+                    stats["carried_forward"] += 1
+                else:
+                    writer.add(documents)
+                states.append(state)
+                if len(states) >= batch_write_size:
+                    write_states()
+                stats["processed"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                print("Error with RFID: " + str(rfid) + ": " + str(e))
+
+    # Keeping a bounded number of RFIDs in flight, so arbitrarily long inputs are streamed
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rfid in read_rfids(rfid_source):
+            previous_state = None
+            if refresh:
+                previous_state = extractionState.load_state(state_collection, rfid)
+            elif collection.find_one({"RFID": rfid}, {"_id": 1}) is not None:
+                stats["skipped"] += 1
+                continue
+            pending[executor.submit(process_rfid, rfid, llm_semaphore, previous_state, refresh)] = rfid
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending)[0])
+    write_states()
+
+    elapsed = time.time() - start_time
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["rfids_per_minute"] = round(stats["processed"] * 60 / elapsed, 2) if elapsed > 0 else 0.0
+    print("Processed: {processed}, Skipped: {skipped}, Failed: {failed}, "
+          "Elapsed: {elapsed_seconds}s, Throughput: {rfids_per_minute} RFIDs/min".format(**stats))
+    if refresh:
+        print("Unchanged: {unchanged}, Carried forward: {carried_forward}".format(**stats))
+    print("LLM gateway: " + llmGateway.format_metrics())
+    return stats
 
 # Executing script from command line
 if __name__ == "__main__":
-    # Check if the user provided an RFID argument
-    if len(sys.argv) != 2:
-        print("Usage: python runner.py <RFID_data>")
+    parser = argparse.ArgumentParser(description="Extract fund names and their offsets from prospectuses.")
+    parser.add_argument("rfid", nargs="?", help="RFID of the prospectus to process")
+    parser.add_argument("--batch", metavar="FILE", help="file with one RFID per line, or - for standard input")
+    parser.add_argument("--workers", type=int, default=batch_workers, help="RFIDs processed concurrently in batch mode")
+    parser.add_argument("--llm-concurrency", type=int, default=batch_llm_concurrency, help="maximum concurrent ChatGPT requests in batch mode")
+    parser.add_argument("--refresh", action="store_true", help="process again the RFIDs already extracted, skipping the unchanged prospectuses")
+    args = parser.parse_args()
+
+    # Check if the user provided an RFID argument or a batch of RFIDs
+    if (args.rfid is None) == (args.batch is None):
+        parser.print_usage()
         sys.exit(1)
 
-    # Retrieve RFID data from command-line arguments 
-    rfid_data = sys.argv[1]
-
-    # Run function1 with RFID data
-    result1 = task1(rfid_data)
+    if args.batch is not None:
+        task1_batch(args.batch, workers=args.workers, llm_concurrency=args.llm_concurrency, refresh=args.refresh)
+    else:
+        # Run function1 with RFID data
+        result1 = task1(args.rfid, args.refresh)
     print("--------------------------------- TASK 1 Completed Successfully ---------------------------------")
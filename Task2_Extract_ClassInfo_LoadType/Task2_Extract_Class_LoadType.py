@@ -1,14 +1,28 @@
 # coding: utf-8
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import os
+import sys
+import time
+import json
+import hashlib  # For the fingerprints of the fee tables
+import threading  # For the hit/miss counters of the classification cache
+import argparse
+from concurrent.futures import wait, FIRST_COMPLETED
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.dammit import EntitySubstitution  # For the character references in the text of the tables
+from bs4.builder import HTMLParserTreeBuilder  # For the tags BeautifulSoup closes as soon as they are opened
+from html import unescape  # For the numeric character references in the text of the tables
+from html.parser import HTMLParser  # For locating the tables the way BeautifulSoup's parser does
 import re
 import yaml
-from pymongo import MongoClient
-from collections import OrderedDict
+from collections import namedtuple
 import certifi
 ca = certifi.where()
 
+# Making the shared helpers importable when the script is run from its own folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CommonHelpers import documentCache, extractionState, fundIntervals, mongoClient, workerPool
+from CommonHelpers.sqliteStore import SqliteStore
+
 # Function to read configuration from a YAML file
 def read_config(file_path):
     with open(file_path, 'r') as file:
@@ -23,6 +37,8 @@ mongo_connection_string = config['database']['mongo_connection_string']
 db_name = config['database']['name']
 collection_from = config['database']['collection_from']
 collection_task_2 = config['database']['collection_task_2']
+# States of the processed RFIDs, compared with the prospectuses in refresh runs
+collection_task_2_state = config['database'].get('collection_task_2_state', collection_task_2 + '_State')
 
 prospectus_base_url = config['prospectus_base_url']
 backend_load = config['backend_load']
@@ -30,53 +46,74 @@ frontend_load = config['frontend_load']
 both_load = config['both_load']
 fund_level = config['fund_level']
 
+# Persistent cache of fee-table classifications, shared by every run reading this configuration
+fee_table_cache_path = config.get('fee_table_cache_path', os.path.join('.fee_table_cache', 'classifications.sqlite'))
+# Changing the classifier must change this version, so stale classifications are not reused
+fee_table_classifier_version = 1
+
+FEE_TABLE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS classifications (
+    fingerprint TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+fee_table_cache = SqliteStore(os.path.abspath(fee_table_cache_path), FEE_TABLE_CACHE_SCHEMA)
+fee_table_cache_lock = threading.Lock()
+fee_table_cache_counters = {'hits': 0, 'misses': 0}
+
+# Batch mode settings: worker processes, RFIDs looked up in MongoDB per query and documents per bulk write
+batch_workers = os.cpu_count() or 4
+batch_prefetch_size = 500
+batch_write_size = 100
+
+
+# Function to get the Task2 collection, with the (RFID, Fund) index the lookups and upserts rely on
+def get_Task2_collection():
+    collection = mongoClient.get_collection(mongo_connection_string, db_name, collection_task_2, tlsCAFile=ca)
+    mongoClient.ensure_unique_index(collection, ['RFID', 'Fund'])
+    return collection
+
+# Function to get the collection of the states of the RFIDs, which refresh runs compare the prospectuses with
+def get_Task2_state_collection():
+    collection = mongoClient.get_collection(mongo_connection_string, db_name, collection_task_2_state, tlsCAFile=ca)
+    mongoClient.ensure_unique_index(collection, ['RFID'])
+    return collection
 
-# Creating ordered list of Funds from MongoDB (Function to retrieve RFIDs from the Task2 database)
-def getRFIDs_from_task2():
-    client = MongoClient(mongo_connection_string, tlsCAFile=ca)
-    db = client[db_name]
-    collection = db[collection_task_2]
+# Function to check whether an RFID is already in the Task2 database (an indexed lookup of a single document)
+def rfid_in_task2(rfid):
+    return get_Task2_collection().find_one({'RFID': rfid}, {'_id': 1}) is not None
 
-    # Fetch all rows and retrieve the 'rfids' field
-    result = collection.find({}, {'_id': 0, 'RFID': 1})
-    task1_list= set()
-    # Iterate through the results and print the 'rfids' field from each document
-    for document in result:
-        task1_list.add(document['RFID'])
-    return task1_list
+# Function to find which of a list of RFIDs are already in the Task2 database
+def rfids_in_task2(rfids):
+    return mongoClient.find_existing(get_Task2_collection(), 'RFID', rfids)
 
 # Function to get data from Task1 database
 def get_from_Task1_db():
-    client = MongoClient(mongo_connection_string, tlsCAFile=ca)
-    db = client[db_name]
-    collection = db[collection_from]
-    return collection
+    return mongoClient.get_collection(mongo_connection_string, db_name, collection_from, tlsCAFile=ca)
     
 # Function to fetch ordered list of funds for a given RFID
 def fetch_ordered_fund_list(collection, rfid):
-    # fetch documents 
-    docs= collection.find({"RFID": rfid})[0]
-    fund_list= docs['Funds']
-
-    fund_dict = OrderedDict()
-    # iterate through the dictionary
-    prev_key=''
-    for key, value in fund_list.items():
-
-        fund_dict[key]=[value['Text Offset'], 999999999]
-        if(prev_key!=''):
-            fund_dict[prev_key][1]= value['Text Offset']
-            fund_dict[prev_key] = tuple(fund_dict[prev_key])        
-        prev_key = key
-    fund_dict[prev_key] = tuple(fund_dict[prev_key]) 
-    
-    ordered_funds=[]
-    for key, value in fund_dict.items():
-        ordered_funds.append(key)
-    
-    return ordered_funds
+    intervals = fundIntervals.load_fund_interval(collection, rfid)
+    if intervals is None:
+        raise ValueError("RFID " + str(rfid) + " not found in the Task1 collection")
+    return intervals.funds
 
-# Function to extract data from a table
+# Function to fetch the ordered lists of funds of many RFIDs, with one projected query per batch of RFIDs
+def fetch_ordered_fund_lists(collection, rfids):
+    intervals = fundIntervals.load_fund_intervals(collection, rfids, batch_prefetch_size)
+    return {rfid: fund_intervals.funds for rfid, fund_intervals in intervals.items()}
+
+# A table cell with the normalized forms the load classifier looks at, computed once per cell
+TableCell = namedtuple('TableCell', ['text', 'lower', 'has_number', 'has_percent', 'has_none'])
+empty_cell = TableCell('', '', False, False, False)
+
+def make_cell(text):
+    lower = text.lower()
+    return TableCell(text, lower, contains_number(text), '%' in text, 'none' in lower)
+
+# Function to extract data from a table, as a tuple of rows of TableCells padded to the same width
 def extract_table(table):
     table_data=[]
     for row in table.find_all('tr'):
@@ -84,34 +121,157 @@ def extract_table(table):
         cells = row.find_all('td')
         row_data = []
         for cell in cells:
-            row_data.append(cell.text.strip())
+            row_data.append(make_cell(cell.text.strip()))
         table_data.append(row_data)
-    df = pd.DataFrame(table_data)
-    return df
-
-# Function to extract tables containing relevant information from prospectus
-def extract_all_relevant_tables(rfid):
+    width = max((len(row_data) for row_data in table_data), default=0)
+    return tuple(tuple(row_data) + (empty_cell,) * (width - len(row_data)) for row_data in table_data)
+
+# Tags that BeautifulSoup closes as soon as they are opened (br, img, ...), whose strings are not part of the text
+# of a tag (script, style, ...) and in which whitespace is kept as it is (pre, textarea)
+html_tree_builder = HTMLParserTreeBuilder()
+void_tags = frozenset(html_tree_builder.empty_element_tags)
+hidden_string_tags = frozenset(html_tree_builder.string_containers)
+preserve_whitespace_tags = frozenset(html_tree_builder.preserve_whitespace_tags)
+ascii_spaces = '\x20\x0a\x09\x0c\x0d'
+
+# Parser locating the outermost <table> elements of a document, with their text. The document is tokenized by
+# html.parser, as BeautifulSoup(html, 'html.parser') does, so a table tag in a comment, CDATA, an attribute value
+# or the content of a script never opens a table. The open tags are kept on a stack the way BeautifulSoup builds
+# its tree: an end tag closes the most recent open tag of its name and every tag opened after it (a table too, e.g.
+# a </div> closing a div opened before the table), and an end tag of a tag that is not open is ignored. The text of
+# a table is collected with the same rules as the text of the BeautifulSoup table
+class TableSpanParser(HTMLParser):
+    def __init__(self, html):
+        HTMLParser.__init__(self, convert_charrefs=False)
+        self.html = html
+        self.line_starts = [0] + [match.end() for match in re.finditer('\n', html)]
+        self.open_tags = []
+        self.open_tables = 0
+        self.open_hidden = 0
+        self.open_preserve = 0
+        self.start = 0
+        self.data = []
+        self.text = []
+        self.spans = []
+
+    # Offset in the HTML of the tag being handled
+    def position(self):
+        line, column = self.getpos()
+        return self.line_starts[line - 1] + column
+
+    # Adds the data read since the last tag to the text of the table, as one string of the tree
+    def end_data(self, cdata=False):
+        if not self.data:
+            return
+        data = ''.join(self.data)
+        self.data = []
+        if not self.open_preserve and not data.strip(ascii_spaces):
+            data = '\n' if '\n' in data else ' '
+        if cdata or not self.open_hidden:
+            self.text.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.end_data()
+        if tag in void_tags:
+            return
+        if tag == 'table':
+            if self.open_tables == 0:
+                self.start = self.position()
+                self.text = []
+            self.open_tables += 1
+        self.open_hidden += tag in hidden_string_tags
+        self.open_preserve += tag in preserve_whitespace_tags
+        self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # A tag written <tag/> is closed as soon as it is opened, and is empty
+        self.end_data()
+
+    def handle_endtag(self, tag):
+        self.end_data()
+        if tag not in self.open_tags:
+            return
+        index = len(self.open_tags) - 1 - self.open_tags[::-1].index(tag)
+        closed = self.open_tags[index:]
+        del self.open_tags[index:]
+        closed_tables = closed.count('table')
+        self.open_hidden -= sum(1 for name in closed if name in hidden_string_tags)
+        self.open_preserve -= sum(1 for name in closed if name in preserve_whitespace_tags)
+        if closed_tables and self.open_tables == closed_tables:
+            # The span ends with the end tag that closed the outermost table
+            end = self.html.find('>', self.position()) + 1 or len(self.html)
+            self.spans.append((self.start, end, ''.join(self.text)))
+        self.open_tables -= closed_tables
+
+    def handle_data(self, data):
+        if self.open_tables:
+            self.data.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name, '&' + name))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape('&#' + name + ';'))
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        if data.upper().startswith('CDATA['):
+            # CDATA is part of the text, even in a script
+            self.handle_data(data[len('CDATA['):])
+            self.end_data(cdata=True)
+
+    def close(self):
+        HTMLParser.close(self)
+        self.end_data()
+        if self.open_tables > 0:
+            # An unclosed table runs to the end of the document
+            self.spans.append((self.start, len(self.html), ''.join(self.text)))
+
+# Function to locate the outermost <table> elements of a document as (start, end, text) tuples, with their offsets
+# in the HTML. Parsing a span on its own gives the same tables as the whole document parsed with BeautifulSoup
+def find_table_spans(html):
+    parser = TableSpanParser(html)
+    parser.feed(html)
+    parser.close()
+    return parser.spans
+
+# Function to extract tables containing relevant information from prospectus (fetched unless its content is given)
+def extract_all_relevant_tables(rfid, content=None):
     
     try:
         # URL of the webpage to extract tags from
         url = prospectus_base_url+str(rfid)
 
-        # Send a GET request to the URL
-        response = requests.get(url)
-
-        # Create a BeautifulSoup object with the HTML content of the response
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Fetch the prospectus through the shared document cache
+        if content is None:
+            content = documentCache.fetch_content(url)
 
-        # Extract all <table> tags from the HTML content
-        table_tags = soup.find_all('table')
+        # Decoding the document the way BeautifulSoup does
+        html = UnicodeDammit(content, is_html=True).unicode_markup
 
         search_string='Maximum'
         table_list=[]
 
-        for table_tag in table_tags:
-
-            if(search_string in table_tag.text):
-                table_list.append(table_tag)
+        # Only the tables whose raw text mentions the search string are parsed, so the cost depends on the
+        # number of fee tables rather than on the size of the document
+        for start, end, text in find_table_spans(html):
+            if search_string not in text:
+                continue
+            soup = BeautifulSoup(html[start:end], 'html.parser')
+
+            # Nested tables are returned too, in document order, as find_all('table') on the whole document does
+            for table_tag in soup.find_all('table'):
+                if(search_string in table_tag.text):
+                    table_list.append(table_tag)
         
         return table_list
     
@@ -163,9 +323,8 @@ def check_string_for_frontend(big_str, small_str):
     return True
 
 # Function to extract frontend and backend load information at the class level
-def class_level_front_back_load_extract(df):
+def class_level_front_back_load_extract(table):
 
-    columns = df.columns.tolist()
     class_list=[]
     frontend='Maximum sales charge'.lower()
 
@@ -178,22 +337,22 @@ def class_level_front_back_load_extract(df):
     front_mp=dict()
     back_mp=dict()
 
-    for row_num, row in df.iterrows():
+    for row in table:
 
         if(found_front and found_back):
             break
 
         if(not row_found):
-            for c in columns:
+            for cell in row:
                 
-                if(row[c] and row[c]!='Class:'):
+                if(cell.text and cell.text!='Class:'):
                     row_found=True
-                    class_list.append(remove_esc_chars(row[c]))
+                    class_list.append(remove_esc_chars(cell.text))
 
         if(row_found):
-            for c in columns:
+            for cell in row:
 
-                if(row[c] and check_string_for_frontend(row[c].lower(), frontend)):
+                if(cell.text and check_string_for_frontend(cell.lower, frontend)):
                     front_row_found=True
                     item_ct=0
                     continue        
@@ -203,19 +362,19 @@ def class_level_front_back_load_extract(df):
                     if(item_ct>=len(class_list)):
                         front_row_found= False
                         break
-                    if('None'.lower() in row[c].lower() ):
+                    if(cell.has_none):
                         front_mp[class_list[item_ct]]='not frontend'  
                         item_ct=item_ct+1
-                    elif (("%" in row[c] and contains_number(row[c])) or contains_number(row[c]) and "None" not in row[c]):
+                    elif (cell.has_number):
                         front_mp[class_list[item_ct]]='frontend'
                         item_ct=item_ct+1
 
             front_row_found= False
 
         if(row_found):
-            for c in columns:
+            for cell in row:
 
-                if(row[c] and check_string_for_backend(row[c].lower(), backend)):
+                if(cell.text and check_string_for_backend(cell.lower, backend)):
                     back_row_found=True
                     item_ct=0
                     continue
@@ -224,10 +383,10 @@ def class_level_front_back_load_extract(df):
                     found_back=True
                     if(item_ct>=len(class_list)):
                         break
-                    if('None'.lower() in row[c].lower()):
+                    if(cell.has_none):
                         back_mp[class_list[item_ct]]='not backend' 
                         item_ct=item_ct+1
-                    elif ("%" in row[c] and contains_number(row[c]) and "None" not in row[c] ):
+                    elif (cell.has_percent and cell.has_number):
                         back_mp[class_list[item_ct]]='backend'
                         item_ct=item_ct+1
 
@@ -237,6 +396,39 @@ def class_level_front_back_load_extract(df):
                 break
     return class_list, front_mp, back_mp
 
+# Function to hash the cell grid of a fee table, the only input of the classifier
+def table_fingerprint(table):
+    grid = [[cell.text for cell in row] for row in table]
+    canonical = json.dumps([fee_table_classifier_version, grid], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Function to classify a fee table, reusing the stored result of an identical table when there is one: from the
+# tables of the last run of the prospectus (fingerprints mapped to results) if given, or from the cache
+def classify_fee_table(table, previous_tables=None):
+    fingerprint = table_fingerprint(table)
+    if previous_tables and fingerprint in previous_tables:
+        class_list, front_mp, back_mp = previous_tables[fingerprint]
+        return class_list, front_mp, back_mp
+    conn = fee_table_cache.connection()
+    row = conn.execute("SELECT result FROM classifications WHERE fingerprint = ?", (fingerprint,)).fetchone()
+    if row is not None:
+        with fee_table_cache_lock:
+            fee_table_cache_counters['hits'] += 1
+        class_list, front_mp, back_mp = json.loads(row[0])
+        return class_list, front_mp, back_mp
+
+    with fee_table_cache_lock:
+        fee_table_cache_counters['misses'] += 1
+    class_list, front_mp, back_mp = class_level_front_back_load_extract(table)
+    conn.execute("INSERT OR REPLACE INTO classifications VALUES (?, ?, ?)",
+                 (fingerprint, json.dumps([class_list, front_mp, back_mp], ensure_ascii=False), time.time()))
+    return class_list, front_mp, back_mp
+
+# Function to get the hit/miss counters of the classification cache in this process
+def fee_table_cache_stats():
+    with fee_table_cache_lock:
+        return dict(fee_table_cache_counters)
+
 # Function to extract frontend and backend load information
 def extract_front_back_load(class_list, front_mp, back_mp, frontend_load, backend_load, both_load, fund_level):
     field_list=dict()
@@ -270,16 +462,44 @@ def extract_front_back_load(class_list, front_mp, back_mp, frontend_load, backen
 
 # Function to push data to Task2 database
 def push_to_Task2_db(all_docs_fetched_for_rfid):
-    # connect to MongoDB server
-    client = MongoClient(mongo_connection_string, tlsCAFile=ca)
-    db = client[db_name]
-    collection = db[collection_task_2]
-    collection.insert_many(all_docs_fetched_for_rfid)
-    print("Documents inserted successfully!")
-
-# Function to run Task2 for a given RFID
-def run_Task2(rfid, ordered_funds):
-    table_list= extract_all_relevant_tables(rfid)
+    collection = get_Task2_collection()
+    # One document per (RFID, Fund): documents already present are left untouched
+    counts = mongoClient.bulk_upsert(collection, all_docs_fetched_for_rfid, ['RFID', 'Fund'])
+    print("Documents inserted successfully! (" + str(counts['inserted']) + " new, " + str(counts['existing']) + " already present)")
+    return counts
+
+# Function to remove the documents of the funds an RFID no longer has, before its new documents are written
+def remove_stale_funds(collection, rfid, documents):
+    collection.delete_many({'RFID': rfid, 'Fund': {'$nin': [document['Fund'] for document in documents]}})
+
+# Function to replace the documents of an RFID in the Task2 database, in a refresh run
+def replace_in_Task2_db(rfid, all_docs_fetched_for_rfid):
+    collection = get_Task2_collection()
+    remove_stale_funds(collection, rfid, all_docs_fetched_for_rfid)
+    counts = mongoClient.bulk_replace(collection, all_docs_fetched_for_rfid, ['RFID', 'Fund'])
+    print("Documents updated successfully! (" + str(counts['inserted']) + " new, " + str(counts['replaced']) + " replaced)")
+
+# Function to hash the classifier settings, which the documents and the table classifications of a state depend on
+def task2_classifier_hash():
+    return extractionState.content_hash([fee_table_classifier_version, frontend_load, backend_load, both_load, fund_level])
+
+# Function to hash the inputs of the Task2 documents of an RFID: the prospectus, its funds and the classifier settings
+def task2_hashes(content, ordered_funds):
+    return {'Content Hash': extractionState.content_hash(content),
+            'Funds Hash': extractionState.content_hash(ordered_funds),
+            'Classifier Hash': task2_classifier_hash()}
+
+# Function to run Task2 for a given RFID, from its content if already fetched. The tables whose fingerprint is in
+# the state of the last run are not classified again; with_state also returns the state of this run
+def run_Task2(rfid, ordered_funds, content=None, previous_state=None, with_state=False):
+    if with_state and content is None:
+        content = documentCache.fetch_content(prospectus_base_url+str(rfid))
+    previous_tables = None
+    if previous_state is not None and previous_state.get('Classifier Hash') == task2_classifier_hash():
+        previous_tables = previous_state.get('Tables')
+    table_list= extract_all_relevant_tables(rfid, content)
+    if table_list is None:
+        raise ValueError("prospectus " + str(rfid) + " could not be read")
     list_of_tables= get_data_from_table_list(table_list)
     
     if(len(list_of_tables)==0):
@@ -291,8 +511,9 @@ def run_Task2(rfid, ordered_funds):
     for i in range(min(len(ordered_funds),len(list_of_tables))):
         fund_table_dict[ordered_funds[i]]=list_of_tables[i]
 
-    # Creating a list of all Fund and Class for single RFID
+    # Creating a list of all Fund and Class for single RFID, and the classification of every table by fingerprint
     all_docs_fetched_for_rfid=[]
+    tables=dict()
 
     for key, value in fund_table_dict.items():
         json_doc= {
@@ -300,7 +521,8 @@ def run_Task2(rfid, ordered_funds):
         }
         json_doc.update({'Fund' : key})
 
-        class_list, front_mp, back_mp= class_level_front_back_load_extract(value)
+        class_list, front_mp, back_mp= classify_fee_table(value, previous_tables)
+        tables[table_fingerprint(value)]= [class_list, front_mp, back_mp]
 
         field_list, load_type= extract_front_back_load(class_list, front_mp, back_mp, frontend_load, backend_load, both_load, fund_level)
                 
@@ -308,21 +530,234 @@ def run_Task2(rfid, ordered_funds):
         json_doc.update({'Field List' : field_list})
         all_docs_fetched_for_rfid.append(json_doc)
         
-    return all_docs_fetched_for_rfid
-
-# Main function to run Task2 for a given RFID if it's not already in the database
-def run_task2_main(rfid):
-    task2_list= getRFIDs_from_task2()  
-    if rfid in task2_list:
+    if not with_state:
+        return all_docs_fetched_for_rfid
+    state = extractionState.build_state(rfid, task2_hashes(content, ordered_funds), all_docs_fetched_for_rfid, {'Tables': tables})
+    return all_docs_fetched_for_rfid, state
+
+# Main function to run Task2 for a given RFID if it's not already in the database. With refresh, the RFID is
+# processed again unless its prospectus and funds are unchanged since the last run, and its documents are replaced
+def run_task2_main(rfid, refresh=False):
+    if not refresh and rfid_in_task2(rfid):
         print("RFID " +rfid+" already present in Database")
     else: 
         collection= get_from_Task1_db()
         ordered_funds= fetch_ordered_fund_list(collection, rfid)
-        all_docs_fetched_for_rfid= run_Task2(rfid, ordered_funds)
+        state_collection= get_Task2_state_collection()
+        previous_state= extractionState.load_state(state_collection, rfid) if refresh else None
+        # A refresh run revalidates the cached prospectus with the server, so an amendment is not hidden by it
+        content= documentCache.fetch_content(prospectus_base_url+str(rfid), revalidate=refresh)
+        if extractionState.unchanged(previous_state, task2_hashes(content, ordered_funds)):
+            print("RFID " +rfid+" unchanged since the last run")
+            return
+        all_docs_fetched_for_rfid, state= run_Task2(rfid, ordered_funds, content, previous_state, with_state=True)
         if(len(all_docs_fetched_for_rfid)>0):
-            push_to_Task2_db(all_docs_fetched_for_rfid)
-
-# rfid = "2854858"
-# run_task2_main(rfid)
-
-
+            if refresh and extractionState.output_unchanged(previous_state, all_docs_fetched_for_rfid):
+                print("Documents of RFID " +rfid+" unchanged")
+            elif refresh:
+                replace_in_Task2_db(rfid, all_docs_fetched_for_rfid)
+            elif push_to_Task2_db(all_docs_fetched_for_rfid)['inserted'] == 0:
+                return
+            # The state is written after the documents, so it never describes documents that were not written
+            extractionState.write_states(state_collection, [state])
+
+def read_rfids(source):
+    """
+    Reads RFIDs, one per line, from a file or from standard input.
+
+    Parameters:
+    - source (str): Path of the file, or "-" for standard input.
+
+    Yields:
+    - str: Each non-empty RFID in the order it appears.
+    """
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        for line in stream:
+            rfid = line.strip()
+            if rfid:
+                yield rfid
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def read_rfid_batches(source, batch_size):
+    batch = []
+    for rfid in read_rfids(source):
+        batch.append(rfid)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def process_rfid(rfid, ordered_funds, previous_state=None, refresh=False):
+    """
+    Runs Task 2 for one RFID of a batch, in a worker process. Errors are returned rather than raised so the
+    batch goes on and the failure is reported with the worker it happened in.
+
+    Parameters:
+    - rfid (str): RFID to process.
+    - ordered_funds (list): Fund names of the RFID in document order.
+    - previous_state (dict): State of the last run of the RFID, in a refresh run.
+    - refresh (bool): Revalidate the cached prospectus with the server whatever its age.
+
+    Returns:
+    - dict: The worker 'pid', the 'rfid', its 'documents' (None in a refresh run if they are the same as in the
+      last run), the 'state' of the run (None if the prospectus and funds are unchanged and it was not processed),
+      the 'error' if any, the processing 'seconds' and the fee-table 'cache' hits and misses.
+    """
+    start_time = time.time()
+    cache_before = fee_table_cache_stats()
+    result = {"pid": os.getpid(), "rfid": rfid, "documents": [], "state": None, "error": None}
+    try:
+        content = documentCache.fetch_content(prospectus_base_url+str(rfid), revalidate=refresh)
+        if extractionState.unchanged(previous_state, task2_hashes(content, ordered_funds)):
+            result["documents"] = None
+        else:
+            result["documents"], result["state"] = run_Task2(rfid, ordered_funds, content, previous_state, with_state=True)
+            if not result["documents"]:
+                raise ValueError("no shareholder fee table found")
+            if previous_state is not None and extractionState.output_unchanged(previous_state, result["documents"]):
+                result["documents"] = None
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.time() - start_time
+    cache_after = fee_table_cache_stats()
+    result["cache"] = {name: cache_after[name] - cache_before[name] for name in cache_after}
+    return result
+
+def task2_batch(rfid_source, workers=batch_workers, refresh=False):
+    """
+    Runs Task 2 for a file or stream of RFIDs on a pool of worker processes.
+
+    RFIDs are read in batches. For each batch, the RFIDs already in the Task2 collection are found with one query
+    and the ordered fund lists are prefetched from the Task1 collection with another. The workers only parse and
+    classify; their documents are sent back to this process, where a single writer inserts them in bulk, and then
+    their states.
+
+    Parameters:
+    - rfid_source (str): Path of a file with one RFID per line, or "-" for standard input.
+    - workers (int): Number of worker processes.
+    - refresh (bool): Process again the RFIDs already in the Task2 collection, with the states of their last run
+      (one query per batch). RFIDs whose prospectus and funds are unchanged are not parsed, the fee tables seen in
+      the last run are not classified again, and the documents of an RFID are replaced only if they changed.
+
+    Returns:
+    - dict: Counts of processed, skipped, failed, unchanged (not parsed) and carried forward (same documents)
+      RFIDs, elapsed seconds, throughput in RFIDs per minute, the same counts per worker process and the fee-table
+      cache hits and misses.
+    """
+    task1_collection = get_from_Task1_db()
+    task2_collection = get_Task2_collection()
+    state_collection = get_Task2_state_collection()
+    writer = mongoClient.BulkWriter(task2_collection, ['RFID', 'Fund'], batch_write_size, replace=refresh)
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "unchanged": 0, "carried_forward": 0}
+    states = []
+
+    def write_states():
+        # The buffered documents are written first, so a state never describes documents that were not written
+        writer.flush()
+        extractionState.write_states(state_collection, states)
+        del states[:]
+
+    cache_stats = {"hits": 0, "misses": 0}
+    worker_stats = dict()
+    start_time = time.time()
+
+    def collect(done):
+        for future in done:
+            rfid = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                stats["failed"] += 1
+                print("Error with RFID: " + str(rfid) + ": " + str(e))
+                continue
+            worker = worker_stats.setdefault(result["pid"], {"processed": 0, "failed": 0, "seconds": 0.0})
+            worker["seconds"] += result["seconds"]
+            for name in cache_stats:
+                cache_stats[name] += result["cache"][name]
+            if result["error"] is not None:
+                stats["failed"] += 1
+                worker["failed"] += 1
+                print("Error with RFID: " + str(rfid) + " (worker " + str(result["pid"]) + "): " + result["error"])
+                continue
+            stats["processed"] += 1
+            worker["processed"] += 1
+            if result["state"] is None:
+                stats["unchanged"] += 1
+                continue
+            if result["documents"] is None:
+                stats["carried_forward"] += 1
+            else:
+                if refresh:
+                    remove_stale_funds(task2_collection, rfid, result["documents"])
+                writer.add(result["documents"])
+            states.append(result["state"])
+            if len(states) >= batch_write_size:
+                write_states()
+
+    # Keeping a bounded number of RFIDs in flight, so arbitrarily long inputs are streamed. The workers are started
+    # from a fresh process, not forked from this one once the MongoDB queries have started the client's threads
+    pending = {}
+    with workerPool.worker_pool(workers) as executor:
+        for batch in read_rfid_batches(rfid_source, batch_prefetch_size):
+            done_rfids = set() if refresh else rfids_in_task2(batch)
+            todo = [rfid for rfid in dict.fromkeys(batch) if rfid not in done_rfids]
+            stats["skipped"] += len(batch) - len(todo)
+            ordered_fund_lists = fetch_ordered_fund_lists(task1_collection, todo)
+            previous_states = extractionState.load_states(state_collection, todo, batch_prefetch_size) if refresh else {}
+
+            for rfid in todo:
+                if rfid not in ordered_fund_lists:
+                    stats["failed"] += 1
+                    print("Error with RFID: " + str(rfid) + ": not found in the Task1 collection")
+                    continue
+                pending[executor.submit(process_rfid, rfid, ordered_fund_lists[rfid], previous_states.get(rfid), refresh)] = rfid
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        collect(wait(pending)[0])
+    write_states()
+    counts = writer.flush()
+
+    elapsed = time.time() - start_time
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["rfids_per_minute"] = round(stats["processed"] * 60 / elapsed, 2) if elapsed > 0 else 0.0
+    for pid, worker in sorted(worker_stats.items()):
+        worker["rfids_per_minute"] = round(worker["processed"] * 60 / worker["seconds"], 2) if worker["seconds"] > 0 else 0.0
+        worker["seconds"] = round(worker["seconds"], 2)
+        print("Worker {pid}: Processed: {processed}, Failed: {failed}, Busy: {seconds}s, "
+              "Throughput: {rfids_per_minute} RFIDs/min".format(pid=pid, **worker))
+    stats["workers"] = worker_stats
+    stats["fee_table_cache"] = cache_stats
+    print("Processed: {processed}, Skipped: {skipped}, Failed: {failed}, "
+          "Elapsed: {elapsed_seconds}s, Throughput: {rfids_per_minute} RFIDs/min".format(**stats))
+    print("Fee table cache: " + str(cache_stats['hits']) + " hits, " + str(cache_stats['misses']) + " misses")
+    if refresh:
+        print("Unchanged: {unchanged}, Carried forward: {carried_forward}".format(**stats))
+        print("Documents written: " + str(counts['inserted']) + " new, " + str(counts['replaced']) + " replaced")
+    else:
+        print("Documents inserted: " + str(counts['inserted']) + " new, " + str(counts['existing']) + " already present")
+    return stats
+
+# Executing script from command line
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the classes and load types of every fund of prospectuses.")
+    parser.add_argument("rfid", nargs="?", help="RFID of the prospectus to process")
+    parser.add_argument("--batch", metavar="FILE", help="file with one RFID per line, or - for standard input")
+    parser.add_argument("--workers", type=int, default=batch_workers, help="worker processes in batch mode")
+    parser.add_argument("--refresh", action="store_true", help="process again the RFIDs already extracted, skipping the unchanged prospectuses")
+    args = parser.parse_args()
+
+    # Check if the user provided an RFID argument or a batch of RFIDs
+    if (args.rfid is None) == (args.batch is None):
+        parser.print_usage()
+        sys.exit(1)
+
+    if args.batch is not None:
+        task2_batch(args.batch, workers=args.workers, refresh=args.refresh)
+    else:
+        run_task2_main(args.rfid, args.refresh)
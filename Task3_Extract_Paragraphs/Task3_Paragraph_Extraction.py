@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
 #Importing the required libraries
-import requests
 import regex as re
-from bs4 import BeautifulSoup
-from pymongo import MongoClient
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.element import Tag
 import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from bisect import bisect_left, bisect_right  # For the length-sorted paragraph index
+from collections import Counter
+
+# Making the shared helpers importable when the script is run from its own folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CommonHelpers import documentCache, extractionState, fundIntervals, mongoClient, paragraphStore, workerPool
+from CommonHelpers.htmlTextMap import HtmlTextMap
 
 # Loading MongoDB connection string
 directory = os.path.abspath('./')
@@ -14,6 +26,23 @@ with open (directory + "/mongodbConnectionParameters.txt", "r") as myfile:
     os.environ['MONGODB_DATABASE'] = dataString[1]
     os.environ['MONGODB_TASK1_COLLECTION'] = dataString[2]
     os.environ['MONGODB_TASK3_COLLECTION'] = dataString[3]
+    # Optional fifth line: the paragraph store collection, next to the Task3 collection by default
+    os.environ['MONGODB_TASK3_PARAGRAPH_COLLECTION'] = dataString[4] if len(dataString) > 4 and dataString[4] else dataString[3] + '_Paragraphs'
+    # Optional sixth line: the collection of the per-RFID states used by refresh runs, next to the Task3 collection by default
+    os.environ['MONGODB_TASK3_STATE_COLLECTION'] = dataString[5] if len(dataString) > 5 and dataString[5] else dataString[3] + '_State'
+
+
+# Concurrency settings for batch runs
+batch_workers = os.cpu_count() or 4
+batch_fetch_workers = 8
+batch_queue_size = 32
+batch_prefetch_size = 500
+batch_write_size = 20
+batch_report_interval = 10
+
+# Changing the way the paragraphs are extracted must change this version, so refresh runs do not carry forward
+# results of the previous extraction
+task3_state_version = 1
 
 
 #Preparing a dictionary with all the field names as keys and it's type as value
@@ -95,76 +124,825 @@ fieldnames = {'NONDIVERSIFIED': 'nondiversified', 'INCOME_FREQUENCY':'income_fre
                'AUDITOR':'auditor',}
 
 # Define a function named documentParser that takes a URL as input
-def documentParser(url):
+def documentParser(url, with_offset_map=False):
   """
     Retrieves HTML content from the specified URL and parses it using BeautifulSoup.
 
     Parameters:
     - url (str): The URL of the document to be parsed. Must be a valid and accessible URL.
+    - with_offset_map (bool): Also return the HtmlTextMap of the document, built from the same decoded HTML.
 
     Returns:
-    - BeautifulSoup: An object representing the parsed HTML content.
+    - BeautifulSoup: An object representing the parsed HTML content, or a tuple of the BeautifulSoup object and
+      the HtmlTextMap when with_offset_map is True.
   """
   try:
-    # Make a GET request to the URL
-    response = requests.get(url)
-    # Parse the HTML content using BeautifulSoup
-    soup = BeautifulSoup(response.content, 'html.parser')
-    return soup
+    # Fetch the document through the shared document cache
+    content = documentCache.fetch_content(url)
+    if not with_offset_map:
+      # Parse the HTML content using BeautifulSoup
+      soup = BeautifulSoup(content, 'html.parser')
+      return soup
+
+    # Decoding the document once (as BeautifulSoup would), so the soup and the offset map see the same HTML
+    html = UnicodeDammit(content, is_html=True).unicode_markup
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup, HtmlTextMap(html)
   except Exception as e:
     return "Encountered the following error while trying to fetch the data from the HTML:" + "\n" + e
 
-def filterParagraphs(paras):
+# Containment index of filterParagraphs: runs of anchor_tokens tokens starting with a sampled token, one token out
+# of anchor_sampling on average (sampled by content, so the same runs are sampled in every text)
+anchor_tokens = 4
+anchor_sampling = 8
+# Number of extra runs a candidate must contain before the substring search
+anchor_filters = 3
+
+
+def contained_texts(texts, containers=None):
+    """
+    Finds the texts that are a substring of another, longer text of the list.
+
+    The interior tokens of a text (split on ' ', without the first and last one, which may be parts of words) are
+    whole tokens of any text containing it. The candidates containing a text are therefore found in an index of
+    sampled runs of tokens, using the run of the text with the fewest texts and keeping the candidates having its
+    next rarest runs too, or else in an inverted index of single tokens. Texts with fewer than three tokens are
+    searched in the concatenation of all the longer texts. Every candidate is then checked with a substring search.
+
+    Parameters:
+    - texts (list): Distinct texts.
+    - containers (dict): Optional dictionary where every contained text is mapped to a longer text containing it.
+
+    Returns:
+    - set: The texts contained in another text.
+    """
+    # Texts sorted by length, so the texts longer than a text are a suffix of the list
+    ordered = sorted(texts, key=len)
+    lengths = [len(text) for text in ordered]
+    token_lists = [text.split(' ') for text in ordered]
+
+    # Sampled tokens, chosen once for the whole vocabulary
+    vocabulary = set()
+    for tokens in token_lists:
+        vocabulary.update(tokens)
+    sampled = set(token for token in vocabulary if hash(token) % anchor_sampling == 0)
+
+    # Index of the sampled runs of tokens of every text
+    anchor_sets = []
+    anchor_postings = {}
+    for index, tokens in enumerate(token_lists):
+        last_start = len(tokens) - anchor_tokens
+        anchors = set(tuple(tokens[i:i + anchor_tokens]) for i, token in enumerate(tokens)
+                      if token in sampled and i <= last_start)
+        anchor_sets.append(anchors)
+        for anchor in anchors:
+            anchor_postings.setdefault(anchor, []).append(index)
+
+    # Built on first use: inverted index of single tokens, and concatenation of all the texts with a separator
+    # none of them contains
+    token_postings = None
+    joined = None
+
+    contained = set()
+    for index, text in enumerate(ordered):
+        # Texts of the same length cannot contain it, being distinct
+        first_longer = bisect_right(lengths, len(text))
+        if first_longer == len(ordered):
+            continue
+        tokens = token_lists[index]
+
+        if len(tokens) < 3:
+            if joined is None:
+                separator = '\x00'
+                while any(separator in other for other in ordered):
+                    separator += '\x00'
+                starts = []
+                position = 0
+                for other in ordered:
+                    starts.append(position)
+                    position += len(other) + len(separator)
+                joined = separator.join(ordered)
+            position = joined.find(text, starts[first_longer])
+            if position != -1:
+                contained.add(text)
+                if containers is not None:
+                    # The separator is in no text, so the occurrence is inside a single text
+                    containers[text] = ordered[bisect_right(starts, position) - 1]
+            continue
+
+        # Runs of the interior tokens only
+        last_start = len(tokens) - 1 - anchor_tokens
+        anchors = set(tuple(tokens[i:i + anchor_tokens]) for i in range(1, last_start + 1) if tokens[i] in sampled)
+        filters = []
+        if anchors:
+            # A run of the text missing from the index is in no other text
+            ranked = sorted(anchors, key=lambda anchor: len(anchor_postings.get(anchor, ())))
+            candidates = anchor_postings.get(ranked[0], [])
+            filters = ranked[1:1 + anchor_filters]
+        else:
+            if token_postings is None:
+                token_postings = {}
+                for other_index, other_tokens in enumerate(token_lists):
+                    for token in set(other_tokens):
+                        token_postings.setdefault(token, []).append(other_index)
+            candidates = min((token_postings[token] for token in tokens[1:-1]), key=len)
+
+        for candidate in candidates[bisect_left(candidates, first_longer):]:
+            if filters and not all(anchor in anchor_sets[candidate] for anchor in filters):
+                continue
+            if text in ordered[candidate]:
+                contained.add(text)
+                if containers is not None:
+                    containers[text] = ordered[candidate]
+                break
+    return contained
+
+
+def text_containers(texts):
+    """
+    Maps the texts that are a substring of another, longer text of the list to one of the texts containing them
+    (see contained_texts).
+    """
+    containers = {}
+    contained_texts(texts, containers)
+    return containers
+
+
+def filterParagraphs(paras, contained=None):
     """
     Filters out duplicate paragraphs from the provided list.
 
     Parameters:
     - paras (list): A list of paragraphs, each represented as a tuple with content and offset.
+    - contained (set): The contents that are part of a longer content, if already known (see
+      SectionGroup.carried_contained). Computed with contained_texts when not given.
 
     Returns:
     - list: A filtered list of paragraphs without duplicates.
 
     Notes:
-    - The function iterates over each paragraph to identify and exclude duplicates based on content.
-    - The first loop compares each paragraph with all others, excluding self-comparisons.
-    - If a duplicate is found, the index of the current paragraph is added to the exclusion list ('idxes').
-    - The second loop constructs the final list by including paragraphs whose index is not in the exclusion list.
-    - The function returns the filtered list of paragraphs without duplicates.
-    """
-    # Initialize a list to store indexes of paragraphs to be excluded
-    idxes = []
-
-    # Initialize a list to store the final set of paragraphs
-    final_list = []
-
-    # Iterate over each paragraph in the provided list
-    for i in range(len(paras)):
-      # Compare the current paragraph with all other paragraphs
-      for j in range(len(paras)):
-        # Skipping self-comparisons
-        if i != j:
-          # Check if the content of the current paragraph is present in another paragraph
-          if paras[i][0] in paras[j][0]:
-            # Check if the paragraphs have the same content but different indices
-            if paras[i][0] == paras[j][0] and paras[i][1] != paras[j][1]:
-                # If the content is the same but indices are different, skip to the next iteration
+    - A paragraph is excluded when its content is part of the content of a longer paragraph.
+    - A paragraph is also excluded when another paragraph has the same content and the same offset (all the
+      copies are excluded); paragraphs with the same content at different offsets are all kept.
+    - Duplicates are found by hashing and contained contents with contained_texts, so the cost grows with the
+      total length of the paragraphs rather than with its square.
+    - The function returns the remaining paragraphs in their original order.
+    """
+    # Paragraphs appearing more than once with the same content and offset
+    counts = Counter(paras)
+
+    # Contents that are part of a longer content
+    if contained is None:
+        contained = contained_texts(list(set(para[0] for para in paras)))
+
+    # Include each paragraph in the final list unless it is excluded
+    return [para for para in paras if counts[para] == 1 and para[0] not in contained]
+
+
+# Constructs whose result depends on the text around a match: anchors, word boundaries, lookarounds and
+# backreferences. A pattern without any of them that matches a text also matches every text containing it.
+_context_dependent = re.compile(r'[\^$]|\\[bBAZzGK0-9]|\(\?<?[=!]')
+
+def pattern_is_context_free(pattern):
+    return _context_dependent.search(pattern.pattern) is None
+
+
+# Paragraphs are limited to this many words
+paragraph_words = 700
+
+# Words of a paragraph in which an element pattern must still be found
+confirmation_words = 200
+
+# Elements with more new paragraph texts than this since the previous run of the document are de-duplicated again
+# from scratch rather than checking every new text against every text
+filter_carry_max_added = 32
+
+# Documents with fewer sections are extracted in a single process, as starting worker processes costs more
+parallel_min_sections = 2000
+# Chunks per worker process, so that the workers finishing early take over the remaining chunks
+parallel_chunks_per_worker = 4
+
+# Siblings mentioning a table of contents are not part of a paragraph, siblings with letters may be headings
+table_of_contents_pattern = re.compile('table of contents')
+letter_pattern = re.compile('[a-zA-Z]')
+
+
+# Tags of tagslist that are part of a line of text rather than a block of their own
+inline_tags = ('span',)
+
+# Ways of selecting the sections of a document: every tag of tagslist, or only the innermost blocks
+section_modes = ('nested', 'leaf')
+
+
+def leaf_sections(soup, tagslist, inline=inline_tags):
+    """
+    Selects a set of non-overlapping sections in one traversal of the document: the innermost blocks.
+
+    A tag of tagslist is selected when it contains no block tag (a tag of tagslist that is not inline). The tags
+    inside a selected tag are not selected, so every text of the document is part of at most one section. An
+    inline tag is selected when it is not inside a selected block, e.g. a span directly inside a table cell. Text
+    directly inside a tag that contains blocks belongs to no section.
+
+    Parameters:
+    - soup (BeautifulSoup): The parsed document.
+    - tagslist (list): Tag names of the sections.
+    - inline (tuple): Tag names of tagslist that do not make a block.
+
+    Returns:
+    - list: The selected sections of every tag of tagslist in document order, shaped like the find_all lists
+      given to multi_field_text_extraction.
+    """
+    names = set(tagslist)
+    block_names = names - set(inline)
+
+    # Sections selected so far, in document order
+    selected = []
+    # Per tag being visited: the number of sections selected before it, and whether it contains a block
+    frames = []
+    stack = [(soup, False)]
+    while stack:
+        node, leaving = stack.pop()
+        if not leaving:
+            frames.append([len(selected), False])
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(list(node.children)) if isinstance(child, Tag))
+            continue
+
+        start, contains_block = frames.pop()
+        if node.name in names and not contains_block:
+            # The tag replaces the inline tags selected inside it
+            del selected[start:]
+            selected.append(node)
+        if frames and (contains_block or node.name in block_names):
+            frames[-1][1] = True
+
+    sections = {name: [] for name in tagslist}
+    for section in selected:
+        sections[section.name].append(section)
+    return [sections[name] for name in tagslist]
+
+
+class SectionGroup:
+    """
+    Sections of one document, flattened into arrays of plain values once so that extracting several elements, or
+    extracting them in several calls, does not walk the parsed tree again.
+
+    Every section and every sibling a paragraph may be expanded with is a node: its texts, the next sibling of the
+    same tag, the flags of the expansion rules and the number of spaces of its text (for the running word count)
+    are computed once. The paragraph of a section is built the first time it is asked for and shared by every
+    element and every call afterwards. The group holds no reference to the tree, so it can be pickled.
+
+    Parameters:
+    - tags_info (list): Lists of sections, one per tag of tagslist.
+    - tagslist (list): List of tag names corresponding to tags_info.
+    - offset_map (HtmlTextMap): Optional offset map of the document, used to get the offset of every section from
+      its source position.
+    - keep_state (bool): Record the de-duplication of the paragraphs of every element, for the state of the
+      document (see filter_state).
+    """
+
+    def __init__(self, tags_info, tagslist, offset_map=None, keep_state=False):
+        self.tag_names = list(tagslist)
+        # Node indices of the sections of every tag
+        self.sections = []
+        # Per node: text with separator=' ' and strip=True (None for siblings or if the extraction failed),
+        # full text, offset in the document text and whether it is a section
+        self.texts = []
+        self.full_texts = []
+        self.offsets = []
+        self.is_section = []
+        # Per node: next sibling of the same tag (-1 if none) and enclosing section (-1 if none, or if its
+        # strings are of other types and do not contain the text of the node)
+        self.next_sibling = []
+        self.enclosing = []
+        # Per node: skipped by the expansion (digits or table of contents), heading-like, and spaces in its text
+        self.skipped = []
+        self.heading = []
+        self.spaces = []
+        # Paragraph and its first words, per starting section
+        self._expansions = {}
+        # Elements matching every section, per set of searched elements; hash of the text of every node; and the
+        # matches of a previous run of the document by section hash, with the elements searched in that run
+        self._matches = {}
+        self._hashes = None
+        self._carried = {}
+        self._carried_elements = frozenset()
+        # Per element: hashes of its distinct paragraph texts and the texts containing the contained ones, for this
+        # run (if kept) and from the previous run, with the elements whose de-duplication was carried forward
+        self._filters = {} if keep_state else None
+        self._carried_filters = {}
+        self._filters_carried = set()
+
+        nodes = {}
+        tags = []
+
+        def add(tag):
+            if id(tag) not in nodes:
+                nodes[id(tag)] = len(tags)
+                tags.append(tag)
+            return nodes[id(tag)]
+
+        for tag_sections in tags_info:
+            self.sections.append([add(section) for section in tag_sections])
+        section_ids = set(id(tag) for tag in tags)
+
+        # Linking every node to its next sibling of the same tag, with one pass over the children of each parent
+        next_tags = {}
+        visited_parents = set()
+        position = 0
+        while position < len(tags):
+            parent = tags[position].parent
+            position += 1
+            if parent is None or id(parent) in visited_parents:
+                continue
+            visited_parents.add(id(parent))
+            names = set(child.name for child in parent.children if id(child) in nodes)
+            previous = {}
+            for child in parent.children:
+                if getattr(child, 'name', None) in names:
+                    add(child)
+                    if child.name in previous:
+                        next_tags[id(previous[child.name])] = child
+                    previous[child.name] = child
+
+        for tag in tags:
+            section = id(tag) in section_ids
+            self.is_section.append(section)
+            text = None
+            if section:
+                try:
+                    text = tag.get_text(separator=' ', strip=True)
+                except Exception as e:
+                    text = None
+            self.texts.append(text)
+
+            full_text = tag.get_text()
+            self.full_texts.append(full_text)
+            self.offsets.append(offset_map.tag_text_offset(tag) if section and offset_map is not None else None)
+            following = next_tags.get(id(tag))
+            self.next_sibling.append(nodes[id(following)] if following is not None else -1)
+
+            # Flags of the expansion rules, see expansion
+            spaces = full_text.count(' ')
+            self.skipped.append(bool(full_text.isdigit() or table_of_contents_pattern.search(full_text)))
+            try:
+                char_index = full_text.find(next(filter(str.isalpha, full_text)))
+            except Exception as index_error:
+                char_index = 0
+            # A text split on ' ' has one more word than spaces
+            self.heading.append(bool(letter_pattern.search(full_text) and
+                                     (spaces + 1 < 3 or full_text[char_index:char_index + 3].isupper())))
+            self.spaces.append(spaces)
+
+        # Document order of the nodes, for splitting the sections into contiguous chunks
+        self.order = [0] * len(tags)
+        if tags:
+            root = tags[0]
+            while root.parent is not None:
+                root = root.parent
+            rank = 0
+            for descendant in root.descendants:
+                if id(descendant) in nodes:
+                    self.order[nodes[id(descendant)]] = rank
+                    rank += 1
+
+        for tag in tags:
+            enclosing = -1
+            if id(tag) in section_ids:
+                node = tag.parent
+                while node is not None and id(node) not in section_ids:
+                    node = node.parent
+                # Sections with other string types (e.g. script) do not contain the text of their children
+                if node is not None and getattr(node, 'interesting_string_types', None) == getattr(tag, 'interesting_string_types', None):
+                    enclosing = nodes[id(node)]
+            self.enclosing.append(enclosing)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def section_nodes(self):
+        """
+        Returns the nodes of the sections, in the order of the sections of every tag.
+        """
+        return [section for tag_sections in self.sections for section in tag_sections]
+
+    def section_hashes(self):
+        """
+        Returns the short hash of the text of every node (see extractionState.section_hash), computed once. Siblings
+        and sections whose text could not be extracted have None.
+        """
+        if self._hashes is None:
+            self._hashes = [extractionState.section_hash(text) if text is not None else None for text in self.texts]
+        return self._hashes
+
+    def carry_forward(self, section_matches, elements, filters=None):
+        """
+        Reuses the matches of a previous run of the document for the sections whose text has not changed, so that
+        only the new and changed sections are searched again, and the de-duplication of the paragraphs of the
+        elements, for the paragraph texts that have not changed (see carried_contained).
+
+        Parameters:
+        - section_matches (dict): Section hashes mapped to the elements matching the section, as returned by
+          match_state for the previous version of the document.
+        - elements (list): Elements searched in the previous run. Searches for other elements do not reuse them.
+        - filters (list): The de-duplication of the previous run, as returned by filter_state.
+
+        Returns:
+        - int: Number of sections whose text is new or changed.
+        """
+        self._carried = {section_hash: frozenset(matched) for section_hash, matched in section_matches.items()}
+        self._carried_elements = frozenset(elements)
+        self._carried_filters = {element: (set(hashes), {hashes[text]: hashes[container] for text, container in pairs})
+                                 for element, hashes, pairs in filters or []}
+        hashes = self.section_hashes()
+        return sum(1 for section in set(self.section_nodes())
+                   if hashes[section] is not None and hashes[section] not in self._carried)
+
+    def add_matches(self, elements, matches):
+        """
+        Adds the matches of some sections found by another process, as returned by matches.
+        """
+        self._matches.setdefault(frozenset(elements), {}).update(matches)
+
+    def match_state(self, elements):
+        """
+        Returns the elements matching every section, keyed by the hash of its text, to be carried forward to the
+        next run of the document (see carry_forward).
+
+        Parameters:
+        - elements (list): Elements searched.
+
+        Returns:
+        - dict: Section hashes mapped to the sorted list of the elements whose pattern matches the section.
+        """
+        hashes = self.section_hashes()
+        return {hashes[section]: sorted(matched) for section, matched in self.matches(elements).items()
+                if hashes[section] is not None}
+
+    def carried_contained(self, element, texts):
+        """
+        Finds which paragraph texts of an element are part of a longer one from the de-duplication of the previous
+        run of the document, checking only what the changes may affect: a text that was contained is still
+        contained if the text containing it is still there; a text that was not can only be contained in a new
+        text; and a new text is checked against every text. The texts are recorded for the state of this run.
+
+        Parameters:
+        - element (str): The element.
+        - texts (list): The distinct paragraph texts of the element, sorted.
+
+        Returns:
+        - set: The contained texts, or None if the element has no previous de-duplication or too many of its texts
+          are new, and they have to be computed (see text_containers and add_contained).
+        """
+        if self._filters is None and not self._carried_filters:
+            return None
+        hashes = [extractionState.section_hash(text) for text in texts]
+        if self._filters is not None:
+            self._filters[element] = [hashes, None]
+        carried = self._carried_filters.get(element)
+        if carried is None:
+            return None
+        previous, previous_containers = carried
+        added = [text for text, text_hash in zip(texts, hashes) if text_hash not in previous]
+        if len(added) > filter_carry_max_added:
+            return None
+
+        present = dict(zip(hashes, texts))
+        containers = {}
+        for text, text_hash in zip(texts, hashes):
+            candidates = texts
+            if text_hash in previous:
+                container = previous_containers.get(text_hash)
+                if container in present:
+                    containers[text] = present[container]
+                    continue
+                if container is None:
+                    candidates = added
+            container = next((other for other in candidates if len(other) > len(text) and text in other), None)
+            if container is not None:
+                containers[text] = container
+        self._filters_carried.add(element)
+        self.add_contained(element, texts, containers)
+        return set(containers)
+
+    def add_contained(self, element, texts, containers):
+        """
+        Records the contained paragraph texts of an element, mapped to a text containing them (see text_containers),
+        for the state of the document.
+        """
+        if self._filters is not None and element in self._filters:
+            index = {text: position for position, text in enumerate(texts)}
+            self._filters[element][1] = sorted([index[text], index[container]] for text, container in containers.items())
+
+    def filter_state(self):
+        """
+        Returns the de-duplication of the paragraphs of every element, to be carried forward to the next run of the
+        document (see carry_forward).
+
+        Returns:
+        - list: [element, hashes of its distinct paragraph texts (sorted), [index of a contained text, index of a
+          text containing it] pairs] for every element extracted since the group was built.
+        - int: Number of these elements whose de-duplication was carried forward from the previous run.
+        """
+        filters = [[element, hashes, pairs] for element, (hashes, pairs) in (self._filters or {}).items()
+                   if pairs is not None]
+        return filters, len(self._filters_carried)
+
+    def chunks(self, count):
+        """
+        Splits the sections into contiguous chunks in document order, with about the same amount of text each.
+
+        Parameters:
+        - count (int): Number of chunks.
+
+        Returns:
+        - list: The nodes of the sections of every chunk.
+        """
+        sections = sorted(set(self.section_nodes()), key=self.order.__getitem__)
+        sizes = [len(self.texts[section] or '') + 1 for section in sections]
+        target = sum(sizes) / max(count, 1)
+        chunks = []
+        chunk = []
+        size = 0
+        for section, section_size in zip(sections, sizes):
+            chunk.append(section)
+            size += section_size
+            if size >= target and len(chunks) < count - 1:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def matches(self, elements, sections=None):
+        """
+        Finds the elements whose pattern matches the text of every section.
+
+        The sections are nested: the text of a section is a substring of the text of the enclosing section, as both
+        join the same stripped strings with ' '. A context-free pattern that does not match a section therefore
+        cannot match any section inside it, so each pattern is only searched in the sections whose enclosing
+        section it matched. The result is the same as searching every pattern in every section.
+
+        The matches of a section are computed once for a set of elements, and the sections whose text is unchanged
+        since a previous run of the document are not searched at all (see carry_forward).
+
+        Parameters:
+        - elements (list): Elements (keys of re_patterns) to search.
+        - sections (list): Nodes of the sections to search, all the sections by default. Enclosing sections that
+          are not in the list are not searched, and do not narrow the patterns searched inside them.
+
+        Returns:
+        - dict: The node of every section mapped to the set of elements whose pattern matches its text (every
+          element if the text could not be extracted).
+        """
+        all_elements = set(elements)
+        context_free = set(element for element in elements if pattern_is_context_free(re_patterns[element]))
+        always_searched = all_elements - context_free
+        if sections is None:
+            sections = self.section_nodes()
+        searched = set(sections)
+        results = {}
+        found = self._matches.setdefault(frozenset(all_elements), {})
+        carried = self._carried if all_elements <= self._carried_elements else {}
+        hashes = self.section_hashes() if carried else None
+
+        for section in sections:
+            # Resolving the enclosing sections first, outermost first
+            chain = []
+            node = section
+            while node != -1 and node not in results and node in searched:
+                chain.append(node)
+                node = self.enclosing[node]
+
+            for node in reversed(chain):
+                if node in found:
+                    results[node] = found[node]
+                    continue
+                if carried and hashes[node] in carried:
+                    # Same text as in the previous run
+                    results[node] = found[node] = set(carried[hashes[node]] & all_elements)
+                    continue
+                parent = self.enclosing[node]
+                candidates = all_elements
+                if parent in results:
+                    candidates = (results[parent] & context_free) | always_searched
+                text = self.texts[node]
+                if text is None:
+                    # Without its text, everything is possible in the section
+                    results[node] = set(candidates)
+                    continue
+                results[node] = found[node] = set(element for element in candidates if re_patterns[element].search(text))
+        return results
+
+    def occurrences(self, elements, sections=None):
+        """
+        Finds the sections where the pattern of an element matches and builds their paragraphs.
+
+        Parameters:
+        - elements (list): Elements (keys of re_patterns) to search.
+        - sections (list): Nodes of the sections to search, all the sections by default.
+
+        Returns:
+        - dict: The node of every section with an occurrence mapped to the elements matching its text, its
+          paragraph, and the elements whose pattern is still found in the first 200 words of the paragraph.
+        """
+        if sections is None:
+            sections = self.section_nodes()
+        matches = self.matches(elements, sections)
+        results = {}
+        for section in sections:
+            # Skip the sections whose text could not be extracted or without any occurrence
+            matched = matches[section]
+            if self.texts[section] is None or not matched:
+                continue
+            occurrence_paragraph, first_words = self.expansion(section)
+            confirmed = set(element for element in matched if re_patterns[element].search(first_words))
+            results[section] = (matched, occurrence_paragraph, confirmed)
+        return results
+
+    def expansion(self, node):
+        """
+        Builds the paragraph of an occurrence: the text of the section followed by the text of its next siblings
+        of the same tag, skipping numbers, tables of contents and texts already in the paragraph, up to the next
+        heading-like sibling (included) or 700 words.
+
+        Parameters:
+        - node (int): Node of the section where a pattern matched.
+
+        Returns:
+        - tuple: The paragraph, limited to its first 700 words, and its first 200 words.
+        """
+        if node in self._expansions:
+            return self._expansions[node]
+
+        occurrence_paragraph = self.texts[node] + '\n'
+        # Words of the paragraph when split on ' ', kept up to date instead of splitting it again
+        word_count = self.texts[node].count(' ') + 1
+
+        sibling = self.next_sibling[node]
+        while sibling != -1:
+            current = sibling
+            sibling = self.next_sibling[current]
+            text = self.full_texts[current]
+
+            # Skip numbers, tables of contents and texts already part of the paragraph
+            if self.skipped[current] or text in occurrence_paragraph:
                 continue
 
-            # Add the index of the current paragraph to the exclusion list
-            idxes.append(i)
-            # Break out of the inner loop since a match has been found
-            break
+            occurrence_paragraph += text + ' '
+            word_count += self.spaces[current] + 1
+
+            # Stop after a heading-like sibling, or once the paragraph exceeds 700 words
+            if self.heading[current] or word_count > paragraph_words:
+                break
+
+        words = occurrence_paragraph.split()
+        result = (' '.join(words[:paragraph_words]), ' '.join(words[:confirmation_words]))
+        self._expansions[node] = result
+        return result
+
+
+# Sections of the document being extracted by a worker process of multi_field_text_extraction
+_worker_section_group = None
+
+def _init_section_worker(section_group):
+    global _worker_section_group
+    _worker_section_group = section_group
+
+def _section_occurrences(elements, sections):
+    # The matches are sent back as well, so the parent has the matches of every section for the state of the document
+    return _worker_section_group.matches(elements, sections), _worker_section_group.occurrences(elements, sections)
+
+
+def multi_field_text_extraction(elements, tags_info, tagslist, all_text='', offset_map=None, section_group=None, workers=1):
+    """
+    Extracts the text occurrences of several elements in a single pass over the sections.
+
+    The patterns are searched in the sections (see SectionGroup.matches); the paragraph of a matching section is
+    built once and routed to every element whose pattern is found in its first 200 words. The result for each
+    element is the same as class_text_extraction(element, ...).
+
+    With several workers, a document of at least parallel_min_sections sections is split into contiguous chunks
+    (see SectionGroup.chunks) searched and expanded by worker processes, and the paragraphs of the elements are
+    de-duplicated in the workers as well. The occurrences are put back in the order of the sections with their
+    offsets in the whole document, so the result is the same as with a single process.
+
+    Parameters:
+    - elements (list): The elements (keys of re_patterns) for which text occurrences are to be extracted.
+    - tags_info (list): List of tags containing information about sections relevant to the elements.
+    - tagslist (list): List of tag names corresponding to tags_info.
+    - all_text (str): Optional parameter containing the entire text document.
+    - offset_map (HtmlTextMap): Optional offset map of the document, used to get the offset of a section from its
+      source position instead of searching its text in all_text.
+    - section_group (SectionGroup): Optional sections of the document built from tags_info, to share the
+      paragraphs between calls. Built from tags_info when not given.
+    - workers (int): Number of worker processes for large documents; 1 extracts in this process.
+
+    Returns:
+    - dict: Each element mapped to a list of dictionaries with 'text' and 'offset' keys.
+    """
+    elements = list(dict.fromkeys(elements))
+    if section_group is None:
+        section_group = SectionGroup(tags_info, tagslist, offset_map)
+
+    if workers <= 1 or len(section_group.section_nodes()) < parallel_min_sections:
+        # Elements found in every section, with the paragraphs of the sections
+        occurrences = section_group.occurrences(elements)
+        tag_outputs = route_occurrences(elements, section_group, occurrences, all_text)
+        texts, contained = carried_contained(elements, section_group, tag_outputs)
+        for element in elements:
+            if contained[element] is None:
+                containers = text_containers(texts[element])
+                section_group.add_contained(element, texts[element], containers)
+                contained[element] = set(containers)
+    else:
+        # The workers are started from a fresh process rather than forked from this one, whose MongoDB client threads
+        # may be running (Task3 loads the fund offsets first), and get a pickled copy of the section group
+        chunks = section_group.chunks(workers * parallel_chunks_per_worker)
+        with workerPool.worker_pool(workers, initializer=_init_section_worker, initargs=(section_group,)) as executor:
+            occurrences = {}
+            for chunk_matches, chunk_occurrences in executor.map(_section_occurrences, [elements] * len(chunks), chunks):
+                section_group.add_matches(elements, chunk_matches)
+                occurrences.update(chunk_occurrences)
+            tag_outputs = route_occurrences(elements, section_group, occurrences, all_text)
+            texts, contained = carried_contained(elements, section_group, tag_outputs)
+            missing = [element for element in elements if contained[element] is None]
+            for element, containers in zip(missing, executor.map(text_containers, [texts[element] for element in missing])):
+                section_group.add_contained(element, texts[element], containers)
+                contained[element] = set(containers)
+
+    filtered = [filterParagraphs(tag_outputs[element], contained[element]) for element in elements]
+    outputs = {}
+    for element, element_outputs in zip(elements, filtered):
+        # Remove duplicate tag outputs and create instances with 'text' and 'offset' keys
+        outputs[element] = [{'text': paragraph, 'offset': offset} for paragraph, offset in element_outputs]
+    return outputs
+
+
+def carried_contained(elements, section_group, tag_outputs):
+    """
+    Gets the distinct paragraph texts of every element and, for the elements de-duplicated in the previous run of
+    the document, the texts contained in a longer one (see SectionGroup.carried_contained).
+
+    Returns:
+    - dict: Each element mapped to its distinct paragraph texts, sorted.
+    - dict: Each element mapped to its contained texts, or None if they have to be computed.
+    """
+    texts = {element: sorted(set(paragraph for paragraph, offset in tag_outputs[element])) for element in elements}
+    return texts, {element: section_group.carried_contained(element, texts[element]) for element in elements}
+
+
+def route_occurrences(elements, section_group, occurrences, all_text=''):
+    """
+    Gives every element the paragraphs of the sections where it occurs, with their offsets, in the order of the
+    sections of every tag.
+
+    Parameters:
+    - elements (list): The elements (keys of re_patterns) extracted.
+    - section_group (SectionGroup): The sections of the document.
+    - occurrences (dict): The occurrences of the elements, as returned by SectionGroup.occurrences.
+    - all_text (str): The entire text document, where the sections without a known offset are searched.
 
-    # Iterate over each paragraph and include it in the final list if its index is not in the exclusion list
-    for i in range(len(paras)):
-      if i not in idxes:
-          final_list.append(paras[i])
+    Returns:
+    - dict: Each element mapped to a list of (paragraph, offset) tuples.
+    """
+    # Text occurrences along with their offsets, per element
+    tag_outputs = {element: [] for element in elements}
 
-    # Return the final list of paragraphs without duplicates
-    return final_list
+    # Iterate over the sections of each tag
+    for tag_sections in section_group.sections:
+        # Previous offset of every element, for searching the section texts in all_text
+        prev_offsets = {element: 0 for element in elements}
+
+        try:
+            for section in tag_sections:
+                # Skip the sections without any occurrence
+                if section not in occurrences:
+                    continue
+                matched, occurrence_paragraph, confirmed = occurrences[section]
+
+                # Get the full text of the section and the offset of the text within the entire document
+                text1 = section_group.full_texts[section]
+                offset = section_group.offsets[section]
+
+                # Keep the occurrence for the elements whose pattern is still found in its first 200 words
+                for element in elements:
+                    if element not in matched:
+                        continue
+                    element_offset = offset
+                    if element_offset is None:
+                        element_offset = all_text.find(text1, prev_offsets[element])
+                    prev_offsets[element] = element_offset + len(text1)
+                    if element in confirmed:
+                        tag_outputs[element].append((occurrence_paragraph, element_offset))
+        except Exception as e:
+            # Print an error message if there is no section with the given data
+            print('No section with given data', e)
+    return tag_outputs
 
 
-def class_text_extraction(element, tags_info, tagslist, all_text=''):
+def class_text_extraction(element, tags_info, tagslist, all_text='', offset_map=None, section_group=None, workers=1):
     """
     Extracts text occurrences for a given element based on specified tags and patterns.
 
@@ -173,6 +951,11 @@ def class_text_extraction(element, tags_info, tagslist, all_text=''):
     - tags_info (list): List of tags containing information about sections relevant to the element.
     - tagslist (list): List of tag names corresponding to tags_info.
     - all_text (str): Optional parameter containing the entire text document.
+    - offset_map (HtmlTextMap): Optional offset map of the document, used to get the offset of a section from its
+      source position instead of searching its text in all_text.
+    - section_group (SectionGroup): Optional sections of the document built from tags_info. Passing the same group
+      to the calls for several elements builds the paragraph of a section only once.
+    - workers (int): Number of worker processes for large documents, see multi_field_text_extraction.
 
     Returns:
     - list: A list of dictionaries, each containing 'text' and 'offset' keys, representing extracted text occurrences.
@@ -180,200 +963,135 @@ def class_text_extraction(element, tags_info, tagslist, all_text=''):
     Notes:
     - The function uses regular expressions specified by 'element' to identify relevant text within each section.
     - For each identified section, it extracts text along with offset and appends it to the 'outputs' list.
-    - The resulting list provides instances of text occurrences for the given element.
+    - To extract several elements, multi_field_text_extraction does it in a single pass.
     """
+    return multi_field_text_extraction([element], tags_info, tagslist, all_text, offset_map, section_group, workers)[element]
 
-    # Initialize a list to store text occurrences along with their offsets
-    tag_outputs = []
+# Function to get the Task1 collection, where the fund offsets are read from
+def get_Task1_collection():
+    # Try to retrieve MongoDB connection information from environment variables
+    try:
+        mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
+        mongo_database = os.environ.get('MONGODB_DATABASE')
+        mongo_task1_collection = os.environ.get('MONGODB_TASK1_COLLECTION')
+    except:
+        print("The environment variables for MongoDB connection are not defined")
 
-    # Iterate over each tag in the provided 'tags_info' list
-    for tag in range(len(tags_info)):
-        # Initialize the previous offset
-        prev_offset = 0
+    # Access the 'Task1_Demo' collection through the shared MongoDB client
+    return mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_task1_collection)
 
-        try:
-            # Initialize a counter for occurrences within a section
-            occurrence = 0
 
-            # Iterate over each section in the current tag's information
-            for section in tags_info[tag]:
-                # Extract the regular expression pattern for the given element
-                pattern = re_patterns[element]
+# Function to get the Task3 collection, with the unique RFID index the upserts rely on
+def get_Task3_collection():
+    try:
+        mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
+        mongo_database = os.environ.get('MONGODB_DATABASE')
+        mongo_task3_collection = os.environ.get('MONGODB_TASK3_COLLECTION')
+    except:
+        print("The environment variables for MongoDB connection are not defined")
 
-                try:
-                    # Attempt to extract the text from the section
-                    text = section.get_text(separator=' ', strip=True)
-                except Exception as e:
-                    # Continue to the next iteration if text extraction fails
-                    continue
+    # Access the 'Task3_Extract' collection through the shared MongoDB client
+    collection = mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_task3_collection)
+    mongoClient.ensure_unique_index(collection, ['RFID'])
+    return collection
 
-                # Find all occurrences of the pattern within the text
-                pmatch = re.findall(pattern, text)
-                # Initialize a string to store the text content of the occurrence
-                occurrence_paragraph = ''
-
-                if pmatch:
-                    # Get the full text of the section
-                    text1 = section.get_text()
-
-                    # Calculate the offset of the text within the entire document
-                    offset = all_text.find(text1, prev_offset)
-                    prev_offset = offset + len(text1)
-                    occurrence_paragraph += text + '\n'
-                    # Initialize the parent div as the current section
-                    parent_div = section
-
-                    # Iterate through parent divs to extract additional text
-                    while True:
-                        # Find the next sibling with the specified tag
-                        parent_div = parent_div.find_next_sibling(tagslist[tag])
-
-                        try:
-                            # Attempt to get the text content of the parent div
-                            parent_div_text = parent_div.get_text()
-                        except:
-                            # Break the loop if text extraction fails
-                            break
-
-                        # Skip if the text consists of digits or mentions a table of contents
-                        if parent_div_text.isdigit() or re.search('table of contents', parent_div_text.strip()):
-                            continue
-
-                        # Try to find the index of the next alphabetical character in the text
-                        try:
-                            char_index = parent_div_text.find(next(filter(str.isalpha, parent_div_text)))
-                        except Exception as index_error:
-                            char_index = 0
-
-                        # Skip if the parent div text is already part of the occurrence paragraph
-                        if parent_div_text in occurrence_paragraph:
-                            continue
-
-                        # If the text contains alphabets and is either short or starts with uppercase letters,
-                        # add it to the occurrence paragraph
-                        if re.search('[a-zA-Z]', parent_div_text.strip()) and (len(parent_div_text.split(' ')) < 3 or parent_div_text[char_index:char_index + 3].isupper()):
-                            occurrence_paragraph += parent_div_text + ' '
-                            break
-
-                        # Add the parent div text to the occurrence paragraph
-                        occurrence_paragraph += parent_div_text + ' '
-                        
-                        # Break the loop if the length of the occurrence paragraph exceeds 700 words
-                        if len(occurrence_paragraph.split(' ')) > 700:
-                            break
-
-                    # Limit the occurrence paragraph to the first 700 words
-                    occurrence_paragraph = ' '.join(occurrence_paragraph.split()[:700])
-
-                    # If the pattern is still found in the first 200 words of the occurrence paragraph,
-                    # increment the occurrence counter and append the occurrence to the outputs list
-                    if re.findall(pattern, ' '.join(occurrence_paragraph.split()[:200])):
-                      occurrence += 1
-                      tag_outputs.append((occurrence_paragraph, offset))
-        except Exception as e:
-            # Print an error message if there is no section with the given data
-            print('No section with given data', e)
 
-    # Initialize a list to store the final outputs
-    outputs = []
+# Function to get the paragraph store collection, where the paragraphs of the Task3 documents are written once each
+def get_Task3_paragraph_collection():
+    try:
+        mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
+        mongo_database = os.environ.get('MONGODB_DATABASE')
+        mongo_paragraph_collection = os.environ.get('MONGODB_TASK3_PARAGRAPH_COLLECTION')
+    except:
+        print("The environment variables for MongoDB connection are not defined")
 
-    # Check if there are any tag outputs
-    if len(tag_outputs) > 0:
-        # Remove duplicate tag outputs
-        set_outputs = list(set(tag_outputs))
-        # Filter and process the outputs using the filterParagraphs function
-        set_outputs = filterParagraphs(tag_outputs)
-        # Iterate through the set outputs and create instances with 'text' and 'offset' keys
-        for i in set_outputs:
-            instance = {}
-            instance['text'] = i[0]
-            instance['offset'] = i[1]
-            outputs.append(instance)
+    collection = mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_paragraph_collection)
+    mongoClient.ensure_unique_index(collection, ['Hash'])
+    return collection
 
-    # Return the final list of dictionaries containing '
 
-    return outputs
+# Function to get the collection of the states of the RFIDs, which refresh runs compare the documents with
+def get_Task3_state_collection():
+    try:
+        mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
+        mongo_database = os.environ.get('MONGODB_DATABASE')
+        mongo_state_collection = os.environ.get('MONGODB_TASK3_STATE_COLLECTION')
+    except:
+        print("The environment variables for MongoDB connection are not defined")
+
+    collection = mongoClient.get_collection(mongo_connection_string, mongo_database, mongo_state_collection)
+    mongoClient.ensure_unique_index(collection, ['RFID'])
+    return collection
+
+
+def load_task1_intervals(rfid):
+    """
+    Loads the fund boundaries of an RFID from the Task 1 collection, with a single query.
+
+    Parameters:
+    - rfid (str): RFID identifier used to fetch the corresponding fund list with offset ranges from the database.
+
+    Returns:
+    - FundIntervals: The fund offsets of the RFID, sorted.
+
+    Raises:
+    - ValueError: If the RFID has no Task 1 document.
+    """
+    # Retrieve the fund boundaries of the RFID, sorted by 'Text Offset'
+    intervals = fundIntervals.load_fund_interval(get_Task1_collection(), rfid)
+    if intervals is None:
+        raise ValueError("RFID " + str(rfid) + " not found in the Task1 collection")
+    return intervals
+
 
 #For fund level paragraphs, assigning each paragraph to respective fund
-def field_offsets(element, rfid):
+def fields_offsets(fields, rfid, intervals=None):
     """
-    Assigns each paragraph in the provided element to the respective fund based on offset ranges retrieved from the database.
+    Assigns the paragraphs of several fund level fields to the respective funds, loading the fund boundaries of the
+    RFID once and looking every distinct offset up once with a binary search.
 
     Parameters:
-    - element (list): A list of paragraphs, each represented as a dictionary with 'offset' information.
+    - fields (dict): Field names mapped to their paragraphs, each represented as a dictionary with 'offset' information.
     - rfid (str): RFID identifier used to fetch the corresponding fund list with offset ranges from the database.
+    - intervals (FundIntervals): Optional fund boundaries of the RFID, already loaded.
 
     Returns:
-    - dict: A dictionary where keys are fund names, and values are lists of paragraphs assigned to each fund based on offsets.
+    - dict: Field names mapped to dictionaries where keys are fund names, and values are lists of paragraphs
+      assigned to each fund based on offsets ('others' when the offset is -1).
 
     Notes:
-    - The function retrieves offset information for funds associated with the given RFID from a MongoDB database.
-    - Each paragraph in the 'element' is assigned to the fund whose offset range encompasses the paragraph's offset.
-    - The resulting dictionary provides a mapping of funds to paragraphs.
-    - In case of an error, the original 'element' is returned, and an error message is printed.
+    - In case of an error, the paragraphs of every field are returned unchanged, and an error message is printed.
     """
     try:
-        # Try to retrieve MongoDB connection information from environment variables
-        try:
-            mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
-            mongo_database = os.environ.get('MONGODB_DATABASE')
-            mongo_task1_collection = os.environ.get('MONGODB_TASK1_COLLECTION')
-        except:
-            print("The environment variables for MongoDB connection are not defined")
-
-        # Connect to the MongoDB server
-        client = MongoClient(mongo_connection_string)
-    
-        # Select the 'broadridge' database
-        db = client[mongo_database]
-
-        # Access the 'Task1_Demo' collection within the database
-        collection = db[mongo_task1_collection]
-
-        # Retrieve document with fund information based on RFID
-        docs = collection.find({"RFID": rfid})[0]
-        fund_list = docs['Funds']
-        fund_final = {}
-        print(fund_list)
-        
-        # Sort fund list based on 'Text Offset'
-        fund_list = sorted(fund_list.items(), key=lambda x:x[1]['Text Offset'])
-        print(fund_list)
-        
-        # Assigning each paragraph to a fund based on offset ranges
-        for i in element:
-          current_offset = i['offset']
-          
-          # Check if the offset is -1, and assign to 'others' fund if true
-          if current_offset == -1:
-            try:
-                  fund_final["others"].append(i)
-            except:
-                  fund_final["others"] = [i]
-            continue
+        if intervals is None:
+            intervals = load_task1_intervals(rfid)
 
-          # Iterate through the sorted fund list and assign the paragraph to the appropriate fund
-          for idx in range(len(fund_list)):
-            if idx != len(fund_list) - 1:
-              if fund_list[idx][1]['Text Offset'] <= current_offset <= fund_list[idx+1][1]['Text Offset']:
-                try:
-                  fund_final[fund_list[idx][0]].append(i)
-                except:
-                  fund_final[fund_list[idx][0]] = [i]
-                break
-            else:
-              try:
-                fund_final[fund_list[idx][0]].append(i)
-              except:
-                fund_final[fund_list[idx][0]] = [i]
-              break
+        # Assigning the paragraphs of all the fields in one pass
+        return intervals.assign_fields(fields)
     except Exception as e:
         # Print an error message if an exception occurs
         print("Error while fetching field_offsets", e)
-        return element
-    
-    # Return the final dictionary mapping funds to paragraphs
-    return fund_final
+        return dict(fields)
+
+
+def field_offsets(element, rfid, intervals=None):
+    """
+    Assigns each paragraph in the provided element to the respective fund based on offset ranges retrieved from the database.
+
+    Parameters:
+    - element (list): A list of paragraphs, each represented as a dictionary with 'offset' information.
+    - rfid (str): RFID identifier used to fetch the corresponding fund list with offset ranges from the database.
+    - intervals (FundIntervals): Optional fund boundaries of the RFID, already loaded.
+
+    Returns:
+    - dict: A dictionary where keys are fund names, and values are lists of paragraphs assigned to each fund based on offsets.
+
+    Notes:
+    - Each paragraph in the 'element' is assigned to the fund whose offset range encompasses the paragraph's offset.
+    - To assign several fields, fields_offsets loads the fund boundaries once for all of them.
+    - In case of an error, the original 'element' is returned, and an error message is printed.
+    """
+    return fields_offsets({'element': element}, rfid, intervals)['element']
 
 
 def validate_rfid_format(rfid):
@@ -390,12 +1108,126 @@ def validate_rfid_format(rfid):
     # Assuming RFID should have 10 alphanumeric characters
     return bool(re.match("^[0-9]{7}$", rfid))
 
-def Task3(RFID):
+def task3_hashes(content, intervals, section_mode='nested'):
+  """
+  Hashes the inputs of the Task3 document of an RFID: when none of them changed since the last run, its result
+  can be carried forward without parsing the document.
+
+  Parameters:
+  - content (bytes): The raw HTML of the document.
+  - intervals (FundIntervals): Fund boundaries of the RFID, None if it has none.
+  - section_mode (str): 'nested' or 'leaf', see Task3.
+
+  Returns:
+  - dict: The 'Content Hash' of the document, the 'Funds Hash' of the fund boundaries and the 'Fields Hash' of
+    the fieldnames, their patterns and the extraction settings.
+  """
+  elements = sorted(set(fieldnames.values()))
+  fields = [task3_state_version, section_mode, sorted(fieldnames.items()), paragraph_words, confirmation_words,
+            [[element, re_patterns[element].pattern, re_patterns[element].flags, search_strings[element]] for element in elements]]
+  funds = None if intervals is None else [intervals.names, intervals.offsets]
+  return {'Content Hash': extractionState.content_hash(content),
+          'Funds Hash': extractionState.content_hash(funds),
+          'Fields Hash': extractionState.content_hash(fields)}
+
+
+def extract_task3_document(rfid, content, section_mode='nested', intervals=None, workers=1, previous_state=None, with_state=False):
+  """
+  Extracts the paragraphs of every fieldname from a fetched document, without writing them.
+
+  Parameters:
+  - rfid (str): The RFID of the document.
+  - content (bytes): The raw HTML of the document, as returned by documentCache.fetch_content.
+  - section_mode (str): 'nested' or 'leaf', see Task3.
+  - intervals (FundIntervals): Fund boundaries of the RFID, loaded from the Task1 collection when not given.
+  - workers (int): Number of worker processes extracting a large document in chunks, see
+    multi_field_text_extraction.
+  - previous_state (dict): State of the last run of the RFID. The sections whose text has not changed since are
+    not searched again, their matches are carried forward, and so is the de-duplication of the paragraphs of the
+    fieldnames whose paragraph texts have not changed (see SectionGroup.carry_forward).
+  - with_state (bool): Also return the state of this run, to be written to the state collection.
+
+  Returns:
+  - dict: The Task3 document of the RFID: the 'RFID' and the paragraphs of every fieldname, grouped by fund for
+    the fund level fieldnames.
+  - dict: With with_state, the state of the run: the hashes of task3_hashes, the hash of the document, the
+    elements matching every section by section hash, the de-duplication of the paragraphs of every element, the
+    number of sections and of changed sections, and the number of elements and of elements de-duplicated again.
+  """
+  final_outputs = {'RFID': rfid}
+  if intervals is None and (with_state or previous_state is not None):
+      # The state records the fund boundaries the paragraphs were assigned with
+      intervals = fundIntervals.load_fund_interval(get_Task1_collection(), rfid)
+  hashes = task3_hashes(content, intervals, section_mode) if with_state or previous_state is not None else None
+
+  # Decoding the document once, so the soup and the offset map see the same HTML
+  html = UnicodeDammit(content, is_html=True).unicode_markup
+  soup = BeautifulSoup(html, 'html.parser')
+  offset_map = HtmlTextMap(html)
+  all_text = offset_map.text
+
+  # List of HTML tags to extract information from
+  tagslist = ['span', 'p', 'div', 'table']
+  tags_info = []
+
+  if section_mode == 'leaf':
+      # Getting the innermost blocks only, which do not overlap
+      tags_info = leaf_sections(soup, tagslist)
+  else:
+      # Getting the text of all the HTML tags present in the tagslist
+      for tag in tagslist:
+          extracted_section = soup.find_all(tag, recursive=True)
+          tags_info.append(extracted_section)
+
+  # Texts, siblings and offsets of the sections, computed once for the document
+  section_group = SectionGroup(tags_info, tagslist, offset_map, keep_state=with_state)
+  elements = list(dict.fromkeys(fieldnames.values()))
+  section_count = len(set(section_group.section_nodes()))
+  changed_sections = section_count
+
+  # Only the sections that changed since the last run are searched, if the fieldnames are the same
+  if previous_state is not None and previous_state.get('Fields Hash') == hashes['Fields Hash'] and previous_state.get('Sections'):
+      changed_sections = section_group.carry_forward(previous_state['Sections'], elements, previous_state.get('Filters'))
+
+  # Getting paragraphs of every fieldname, with a single pass over the sections for all of them
+  paragraphs = multi_field_text_extraction(elements, tags_info, tagslist, all_text, offset_map, section_group, workers)
+  for element in fieldnames.keys():
+    final_outputs[element] = paragraphs[fieldnames[element]]
+
+  # For the fund level fieldnames, get the information about the fund of the paragraphs also, loading the funds once
+  fund_fields = {element: final_outputs[element] for element in fieldnames.keys() if search_strings[fieldnames[element]] == 'fund'}
+  if fund_fields:
+    final_outputs.update(fields_offsets(fund_fields, rfid, intervals))
+  if not with_state:
+    return final_outputs
+
+  filters, carried_filters = section_group.filter_state()
+  state = extractionState.build_state(rfid, hashes, final_outputs, {'Sections': section_group.match_state(elements),
+                                                                    'Filters': filters,
+                                                                    'Section Count': section_count,
+                                                                    'Changed Sections': changed_sections,
+                                                                    'Element Count': len(elements),
+                                                                    'Changed Elements': len(elements) - carried_filters})
+  return final_outputs, state
+
+
+def Task3(RFID, section_mode='nested', workers=1, paragraph_store=False, compress_paragraphs=False, refresh=False):
   """
   Process data for a given RFID using web scraping.
 
   Parameters:
   - RFID (str): The RFID for which data is to be processed.
+  - section_mode (str): 'nested' to search every span, p, div and table of the document, or 'leaf' to search only
+    the innermost blocks (see leaf_sections), so that nested tags do not match and expand the same text again.
+  - workers (int): Number of worker processes extracting the document in chunks when it is large (at least
+    parallel_min_sections sections).
+  - paragraph_store (bool): Write every paragraph once to the paragraph store, keyed by the hash of its text, and
+    only references to it ('paragraph' and 'offset') in the Task3 document (see CommonHelpers/paragraphStore.py).
+  - compress_paragraphs (bool): Compress the paragraphs written to the paragraph store with zlib.
+  - refresh (bool): Update the document of an RFID processed before. If the document, the funds and the fieldnames
+    are unchanged since the last run nothing is done; otherwise only the changed sections are searched again, the
+    de-duplication of the unchanged paragraphs is carried forward, and only the fields of the document whose
+    paragraphs changed are written.
 
   Returns:
   - dict: A dictionary containing processed data for the given RFID.
@@ -403,6 +1235,7 @@ def Task3(RFID):
   Notes:
   - The function extracts data from a specific URL using BeautifulSoup and processes it based on predefined rules.
   - The final_outputs dictionary contains information about different fieldnames.
+  - To process many RFIDs, task3_batch runs the fetch, the extraction and the insert as a pipeline.
   """
 
   # Set up the URL
@@ -412,68 +1245,458 @@ def Task3(RFID):
   if validate_rfid_format(RFID) is False:
     print('Invalid RFID Format')
     return final_outputs
-  url = 'https://prospectus-express.broadridge.com/getdocument.asp?rfid=' + rfid
+  if section_mode not in section_modes:
+    print('Invalid section mode', section_mode)
+    return final_outputs
+  url = documentCache.prospectus_url(rfid)
 
-  # Get the Beautiful Soup instance
-  soup = documentParser(url)
-  if isinstance(soup, str):
-    return "Error while parsing the HTML: " + soup
-  all_text = soup.get_text()
+  # Get the document through the shared document cache (revalidated with the server in a refresh run, so an
+  # amendment is not hidden by the cached copy) and extract the paragraphs of every fieldname
+  try:
+    content = documentCache.fetch_content(url, revalidate=refresh)
+    previous_state = None
+    intervals = None
+    if refresh:
+        # Comparing the document with the last run of the RFID
+        previous_state = extractionState.load_state(get_Task3_state_collection(), rfid)
+        intervals = fundIntervals.load_fund_interval(get_Task1_collection(), rfid)
+        if extractionState.unchanged(previous_state, task3_hashes(content, intervals, section_mode)):
+            print(f"RFID {RFID} unchanged since the last run")
+            return final_outputs
+    final_outputs, state = extract_task3_document(rfid, content, section_mode, intervals, workers, previous_state, with_state=True)
+  except Exception as e:
+    return "Error while parsing the HTML: " + str(e)
 
-  # List of HTML tags to extract information from
-  tagslist = ['span', 'p', 'div', 'table']
-  tags_info = []
+  for element in fieldnames.keys():
+    print(element, len(final_outputs[element]))
+  if refresh:
+    print("Sections searched again: " + str(state['Changed Sections']) + " of " + str(state['Section Count']) +
+          ", fields de-duplicated from scratch: " + str(state['Changed Elements']) + " of " + str(state['Element Count']))
 
-  # Getting the text of all the HTML tags present in the tagslist
-  for tag in tagslist:
-      extracted_section = soup.find_all(tag, recursive=True)
-      tags_info.append(extracted_section)
+  try:
+    # Access the 'Task3_Extract' collection through the shared MongoDB client
+    collection = get_Task3_collection()
 
-  # Getting paragraphs of every fieldname
-  for element in fieldnames.keys():
-    # Process text for each fieldname using class_text_extraction function
-    final_outputs[element] = class_text_extraction(fieldnames[element], tags_info, tagslist, all_text)
+    try:
+        written = True
+        if refresh and extractionState.output_unchanged(previous_state, final_outputs):
+            # Same paragraphs as the last run: the document is left as it is
+            print(f"Paragraphs of RFID {RFID} unchanged")
+            if previous_state.get('Field Hashes') is not None:
+                state['Field Hashes'] = previous_state['Field Hashes']
+        else:
+            document = final_outputs
+            if paragraph_store:
+                # Write the paragraphs first, so the references of the document always resolve
+                document = paragraphStore.store_document(final_outputs, get_Task3_paragraph_collection(), compress_paragraphs)
+
+            # Only the fields that changed since the last run are written, or the whole document if the last run did
+            # not record the hashes of its fields
+            fields, unset, state['Field Hashes'] = extractionState.field_changes(previous_state, document, ["RFID"])
+            if refresh and fields is None:
+                # Replace the document of the last run
+                mongoClient.bulk_replace(collection, [document], ["RFID"])
+                print(f"Updated document for RFID {RFID}")
+            elif refresh:
+                mongoClient.bulk_update(collection, [(document, fields, unset)], ["RFID"])
+                print(f"Updated {len(fields) - 1 + len(unset)} fields of the document for RFID {RFID}")
+            else:
+                # Insert the document unless the RFID is already present (upsert on the unique RFID index)
+                counts = mongoClient.bulk_upsert(collection, [document], ["RFID"])
+                written = counts['inserted'] > 0
+                if written:
+                    print(f"Inserted document for RFID {RFID}")
+                else:
+                    print("RFID already present in the database")
+
+        # The state is written after the document, so it never describes a document that was not written
+        if written:
+            extractionState.write_states(get_Task3_state_collection(), [state])
+    except Exception as e:
+       print('Error while inserting the record ', e)
 
-    # If it is a fund level fieldname, get the information about the fund of the paragraph also
-    if search_strings[fieldnames[element]] == 'fund':
-      final_outputs[element] = field_offsets(final_outputs[element], rfid)
+  # Handle any unexpected errors that may occur during MongoDB operations
+  except Exception as e:
+    print(f"Following error occurred while iserting the record into database: {e}")
 
-    print(element, len(final_outputs[element]))
+def read_rfids(source):
+    """
+    Reads RFIDs, one per line, from a file or from standard input.
 
-  try:
+    Parameters:
+    - source (str): Path of the file, or "-" for standard input.
 
+    Yields:
+    - str: Each non-empty RFID in the order it appears.
+    """
+    stream = sys.stdin if source == "-" else open(source, "r")
     try:
-        mongo_connection_string = os.environ.get('MONGODB_CONNECTION_STRING')
-        mongo_database = os.environ.get('MONGODB_DATABASE')
-        mongo_task3_collection = os.environ.get('MONGODB_TASK3_COLLECTION')
-    except:
-        print("The environment variables for MongoDB connection are not defined")
+        for line in stream:
+            rfid = line.strip()
+            if rfid:
+                yield rfid
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def read_rfid_batches(source, batch_size):
+    batch = []
+    for rfid in read_rfids(source):
+        batch.append(rfid)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def process_document(rfid, content, section_mode, intervals, previous_state=None):
+    """
+    Extracts the paragraphs of one fetched document of a batch, in a worker process. Errors are returned rather
+    than raised so the batch goes on and the failure is reported with the worker it happened in.
+
+    Parameters:
+    - rfid (str): RFID of the document.
+    - content (bytes): The raw HTML of the document.
+    - section_mode (str): 'nested' or 'leaf', see Task3.
+    - intervals (FundIntervals): Fund boundaries of the RFID.
+    - previous_state (dict): State of the last run of the RFID in a refresh run, see extract_task3_document.
+
+    Returns:
+    - dict: The worker 'pid', the 'rfid', its Task3 'document' (None in a refresh run if its paragraphs did not
+      change), the 'state' of the run, the 'error' if any and the processing 'seconds'.
+    """
+    start_time = time.time()
+    result = {"pid": os.getpid(), "rfid": rfid, "document": None, "state": None, "error": None}
+    try:
+        document, result["state"] = extract_task3_document(rfid, content, section_mode, intervals,
+                                                           previous_state=previous_state, with_state=True)
+        if previous_state is None or not extractionState.output_unchanged(previous_state, document):
+            result["document"] = document
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.time() - start_time
+    return result
 
-    # Connect to the MongoDB server
-    client = MongoClient(mongo_connection_string)
-    
-    # Select the 'broadridge' database
-    db = client[mongo_database]
+class StageStats:
+    """
+    Counts the items a pipeline stage handled, the time its threads were busy, and samples the depth of the queue
+    feeding it.
 
-    # Access the 'Task3_Extract' collection within the database
-    collection = db[mongo_task3_collection]
+    Parameters:
+    - name (str): Name of the stage, for the report.
+    - source (queue.Queue): The queue the stage reads from, or None.
+    """
 
-    if collection.find_one({"RFID": RFID}) is None:
+    def __init__(self, name, source=None):
+        self.name = name
+        self.source = source
+        self.items = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, failed=False, size=0):
+        with self.lock:
+            self.seconds += seconds
+            self.bytes += size
+            if failed:
+                self.failed += 1
+            else:
+                self.items += 1
+
+    def sample(self):
+        if self.source is None:
+            return
+        depth = self.source.qsize()
+        with self.lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def report(self, elapsed):
+        """
+        Summarizes the stage.
+
+        Parameters:
+        - elapsed (float): Seconds since the pipeline started.
+
+        Returns:
+        - dict: Items done and failed, busy seconds, throughput in items per minute over the elapsed time, MB
+          handled, and the mean and maximum depth of the queue feeding the stage.
+        """
+        with self.lock:
+            return {"items": self.items, "failed": self.failed, "busy_seconds": round(self.seconds, 2),
+                    "items_per_minute": round(self.items * 60 / elapsed, 2) if elapsed > 0 else 0.0,
+                    "megabytes": round(self.bytes / 1e6, 2),
+                    "queue_depth_mean": round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0,
+                    "queue_depth_max": self.depth_max}
+
+def format_stage_reports(stages, elapsed, capacity):
+    lines = []
+    for stage in stages:
+        report = stage.report(elapsed)
+        lines.append("{name}: {items} done, {failed} failed, Busy: {busy_seconds}s, Throughput: {items_per_minute}/min, "
+                     "Queue depth: {queue_depth_mean} mean, {queue_depth_max} max of {capacity}".format(
+                         name=stage.name, capacity=capacity, **report))
+    return lines
+
+def task3_batch(rfid_source, workers=batch_workers, fetch_workers=batch_fetch_workers, section_mode='nested',
+                queue_size=batch_queue_size, report_interval=batch_report_interval, paragraph_store=False,
+                compress_paragraphs=False, refresh=False):
+    """
+    Runs Task 3 for a file or stream of RFIDs as a pipeline of stages connected by bounded queues.
+
+    - A reader thread skips the RFIDs already in the Task3 collection and prefetches the fund boundaries of the
+      others from the Task1 collection, one query of each per batch of RFIDs.
+    - A pool of fetch threads downloads the documents through the document cache.
+    - A pool of worker processes parses the documents and extracts the paragraphs (extract_task3_document).
+    - A single writer thread inserts the documents in bulk into the Task3 collection, and then their states.
+
+    In a refresh run, the RFIDs already in the Task3 collection are processed again. A document whose content,
+    funds and fieldnames are unchanged since the last run is not extracted at all; the others are extracted
+    searching only their changed sections, and only the fields of their document that changed are written.
+
+    A full queue blocks the stage feeding it, so a slow stage holds the others back instead of piling up documents
+    in memory. The depth of every queue is sampled while the pipeline runs: the stage behind a queue that stays
+    full is the bottleneck (fetch, extraction or MongoDB).
+
+    Parameters:
+    - rfid_source (str): Path of a file with one RFID per line, or "-" for standard input.
+    - workers (int): Number of worker processes extracting the paragraphs.
+    - fetch_workers (int): Number of threads fetching the documents.
+    - section_mode (str): 'nested' or 'leaf', see Task3.
+    - queue_size (int): Capacity of every queue between two stages.
+    - report_interval (float): Seconds between two progress reports, 0 to only report at the end.
+    - paragraph_store (bool): Write the paragraphs once to the paragraph store and references in the documents.
+    - compress_paragraphs (bool): Compress the paragraphs written to the paragraph store with zlib.
+    - refresh (bool): Process again the RFIDs already in the Task3 collection, as described above.
+
+    Returns:
+    - dict: Counts of processed, skipped, failed, unchanged (not extracted) and carried forward (extracted, same
+      paragraphs) RFIDs, elapsed seconds, throughput in RFIDs per minute, the report of every stage and the same
+      counts per worker process.
+    """
+    if section_mode not in section_modes:
+        raise ValueError("Invalid section mode " + str(section_mode))
+    task1_collection = get_Task1_collection()
+    task3_collection = get_Task3_collection()
+    state_collection = get_Task3_state_collection()
+    writer = mongoClient.BulkWriter(task3_collection, ['RFID'], batch_write_size, replace=refresh)
+    paragraph_collection = get_Task3_paragraph_collection() if paragraph_store else None
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "unchanged": 0, "carried_forward": 0}
+    worker_stats = dict()
+    start_time = time.time()
+
+    # RFIDs to fetch, fetched documents to extract, and extracted documents with their states to write; None ends a stage
+    fetch_queue = queue.Queue(queue_size)
+    extract_queue = queue.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    fetch_stage = StageStats("Fetch", fetch_queue)
+    extract_stage = StageStats("Extract", extract_queue)
+    write_stage = StageStats("Write", write_queue)
+    stages = [fetch_stage, extract_stage, write_stage]
+    stats_lock = threading.Lock()
+    finished = threading.Event()
+
+    def fail(rfid, error):
+        with stats_lock:
+            stats["failed"] += 1
+        print("Error with RFID: " + str(rfid) + ": " + str(error))
+
+    def read():
         try:
-            # Insert the document into the collection
-            result = collection.insert_one(final_outputs)
-            inserted_id = result.inserted_id
-            print(f"Inserted document with id {inserted_id}")
+            for batch in read_rfid_batches(rfid_source, batch_prefetch_size):
+                done_rfids = set() if refresh else mongoClient.find_existing(task3_collection, 'RFID', batch)
+                todo = [rfid for rfid in dict.fromkeys(batch) if rfid not in done_rfids]
+                with stats_lock:
+                    stats["skipped"] += len(batch) - len(todo)
+                intervals = fundIntervals.load_fund_intervals(task1_collection, todo, batch_prefetch_size)
+                states = extractionState.load_states(state_collection, todo, batch_prefetch_size) if refresh else {}
+                for rfid in todo:
+                    if not validate_rfid_format(rfid):
+                        fail(rfid, "invalid RFID format")
+                    elif rfid not in intervals:
+                        fail(rfid, "not found in the Task1 collection")
+                    else:
+                        fetch_queue.put((rfid, intervals[rfid], states.get(rfid)))
         except Exception as e:
-           print('Error while inserting the record ', e)
-    else:
-        print("RFID already present in the database")
+            print("Error while reading the RFIDs: " + str(e))
+        finally:
+            for _ in range(fetch_workers):
+                fetch_queue.put(None)
 
-  # Handle any unexpected errors that may occur during MongoDB operations
-  except Exception as e:
-    print(f"Following error occurred while iserting the record into database: {e}")
+    def fetch():
+        try:
+            while True:
+                item = fetch_queue.get()
+                if item is None:
+                    return
+                rfid, intervals, state = item
+                fetch_start = time.time()
+                try:
+                    content = documentCache.fetch_content(documentCache.prospectus_url(rfid), revalidate=refresh)
+                except Exception as e:
+                    fetch_stage.record(time.time() - fetch_start, failed=True)
+                    fail(rfid, e)
+                    continue
+                fetch_stage.record(time.time() - fetch_start, size=len(content))
+                if refresh and extractionState.unchanged(state, task3_hashes(content, intervals, section_mode)):
+                    # Nothing changed since the last run: the document is not parsed
+                    with stats_lock:
+                        stats["unchanged"] += 1
+                    continue
+                extract_queue.put((rfid, content, intervals, state))
+        finally:
+            extract_queue.put(None)
+
+    # States of the documents written, waiting for the documents to be flushed
+    states = []
+
+    def write_states():
+        # The buffered documents are written first, so a state never describes a document that was not written
+        writer.flush()
+        extractionState.write_states(state_collection, states)
+        del states[:]
+
+    def write():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                if states:
+                    write_states()
+                return
+            document, state, previous_state = item
+            write_start = time.time()
+            try:
+                if document is not None:
+                    if paragraph_store:
+                        # The paragraphs are written right away, before the buffered document referencing them
+                        document = paragraphStore.store_document(document, paragraph_collection, compress_paragraphs)
+                    # In a refresh run, only the fields that changed since the last run are written
+                    fields, unset, state['Field Hashes'] = extractionState.field_changes(previous_state, document, ["RFID"])
+                    if fields is None:
+                        writer.add([document])
+                    else:
+                        writer.add_updates([(document, fields, unset)])
+                elif previous_state is not None and previous_state.get('Field Hashes') is not None:
+                    state['Field Hashes'] = previous_state['Field Hashes']
+                states.append(state)
+                if len(states) >= batch_write_size:
+                    write_states()
+                write_stage.record(time.time() - write_start)
+            except Exception as e:
+                write_stage.record(time.time() - write_start, failed=True)
+                fail(state['RFID'], e)
+
+    def monitor():
+        last_report = time.time()
+        while not finished.wait(0.5):
+            for stage in stages:
+                stage.sample()
+            if report_interval and time.time() - last_report >= report_interval:
+                last_report = time.time()
+                print("Queues: " + ", ".join(stage.name + " " + str(stage.source.qsize()) + "/" + str(queue_size)
+                                             for stage in stages))
+
+    def collect(done):
+        for future in done:
+            rfid, previous_state = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                extract_stage.record(0.0, failed=True)
+                fail(rfid, e)
+                continue
+            worker = worker_stats.setdefault(result["pid"], {"processed": 0, "failed": 0, "seconds": 0.0})
+            worker["seconds"] += result["seconds"]
+            extract_stage.record(result["seconds"], failed=result["error"] is not None)
+            if result["error"] is not None:
+                worker["failed"] += 1
+                fail(rfid, result["error"] + " (worker " + str(result["pid"]) + ")")
+                continue
+            worker["processed"] += 1
+            if result["document"] is None:
+                # Re-extracted with the same paragraphs: only the state is written
+                with stats_lock:
+                    stats["carried_forward"] += 1
+            write_queue.put((result["document"], result["state"], previous_state))
+
+    threads = [threading.Thread(target=read, name="task3-read"), threading.Thread(target=write, name="task3-write"),
+               threading.Thread(target=monitor, name="task3-monitor", daemon=True)]
+    threads += [threading.Thread(target=fetch, name="task3-fetch-" + str(i)) for i in range(fetch_workers)]
+    for thread in threads:
+        thread.start()
+
+    # Extracting in worker processes, with a bounded number of documents in flight. The workers are not forked
+    # from this process, whose threads may hold locks at that moment, but started from a fresh one
+    pending = {}
+    with workerPool.worker_pool(workers) as executor:
+        fetchers_running = fetch_workers
+        while fetchers_running:
+            item = extract_queue.get()
+            if item is None:
+                fetchers_running -= 1
+                continue
+            rfid, content, intervals, state = item
+            pending[executor.submit(process_document, rfid, content, section_mode, intervals, state)] = (rfid, state)
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending)[0])
+
+    write_queue.put(None)
+    for thread in threads:
+        if thread.name != "task3-monitor":
+            thread.join()
+    finished.set()
+    counts = writer.flush()
+    stats["processed"] = write_stage.items
+
+    elapsed = time.time() - start_time
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["rfids_per_minute"] = round(stats["processed"] * 60 / elapsed, 2) if elapsed > 0 else 0.0
+    stats["stages"] = {stage.name.lower(): stage.report(elapsed) for stage in stages}
+    for line in format_stage_reports(stages, elapsed, queue_size):
+        print(line)
+    for pid, worker in sorted(worker_stats.items()):
+        worker["rfids_per_minute"] = round(worker["processed"] * 60 / worker["seconds"], 2) if worker["seconds"] > 0 else 0.0
+        worker["seconds"] = round(worker["seconds"], 2)
+        print("Worker {pid}: Processed: {processed}, Failed: {failed}, Busy: {seconds}s, "
+              "Throughput: {rfids_per_minute} RFIDs/min".format(pid=pid, **worker))
+    stats["workers"] = worker_stats
+    print("Processed: {processed}, Skipped: {skipped}, Failed: {failed}, "
+          "Elapsed: {elapsed_seconds}s, Throughput: {rfids_per_minute} RFIDs/min".format(**stats))
+    if refresh:
+        print("Unchanged: {unchanged}, Carried forward: {carried_forward}".format(**stats))
+        print("Documents written: " + str(counts['inserted']) + " new, " + str(counts['replaced']) + " replaced, " +
+              str(counts['updated']) + " updated")
+    else:
+        print("Documents inserted: " + str(counts['inserted']) + " new, " + str(counts['existing']) + " already present")
+    return stats
 
+# Executing script from command line
 if __name__ == '__main__':
-    #Change the RFID to process the record for different RFID
-    RFID = '2854858'
-    Task3(RFID)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract the paragraphs of every field from prospectuses.")
+    parser.add_argument("rfid", nargs="?", default='2854858', help="RFID of the prospectus to process")
+    parser.add_argument("--batch", metavar="FILE", help="file with one RFID per line, or - for standard input")
+    parser.add_argument("--workers", type=int, default=batch_workers, help="worker processes extracting the paragraphs in batch mode")
+    parser.add_argument("--fetch-workers", type=int, default=batch_fetch_workers, help="threads fetching the documents in batch mode")
+    parser.add_argument("--section-mode", choices=section_modes, default='nested', help="sections searched for the fields")
+    parser.add_argument("--document-workers", type=int, default=1, help="worker processes extracting one large document in chunks")
+    parser.add_argument("--paragraph-store", action="store_true", help="write every paragraph once to the paragraph store and references in the documents")
+    parser.add_argument("--compress-paragraphs", action="store_true", help="compress the paragraphs of the paragraph store with zlib")
+    parser.add_argument("--refresh", action="store_true", help="process again the RFIDs already extracted, searching only what changed since the last run")
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        task3_batch(args.batch, workers=args.workers, fetch_workers=args.fetch_workers, section_mode=args.section_mode,
+                    paragraph_store=args.paragraph_store, compress_paragraphs=args.compress_paragraphs,
+                    refresh=args.refresh)
+    else:
+        Task3(args.rfid, args.section_mode, args.document_workers, args.paragraph_store, args.compress_paragraphs,
+              args.refresh)
@@ -39,7 +39,7 @@ def get_ground_truths(fieldName, className):
 
     # Reading data from an Excel file containing template information
     directory = os.path.abspath('./')
-    df = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\Requirement_Template_2.xlsx")
+    df = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "Requirement_Template_2.xlsx"))
     
     # Filtering the data based on the provided field name
     df = df[df["Field Name "] == fieldName]
@@ -1,13 +1,13 @@
 import pandas as pd  # Library for data manipulation and analysis
-import openai  # OpenAI Python library for accessing the OpenAI GPT model
 from sklearn.utils import shuffle  # Utility function for shuffling arrays
 import re  # Library for regular expressions
-import time  # Library for time-related functions
 import json  # Library for handling JSON data
 from unicodedata import normalize  # Library for Unicode normalization
 import spacy  # Library for natural language processing tasks
 from sentence_transformers import SentenceTransformer  # Library for encoding sentences into embeddings
 import os
+import sys
+from CommonHelpers import llmGateway  # Shared OpenAI gateway (response cache, rate limiting, retries)
 
 # Load the English language model from spaCy for text processing
 nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
@@ -70,7 +70,7 @@ def get_positive_examples(fieldName, className):
 
     # Read the data from the specified Excel file into a DataFrame
     directory = os.path.abspath('./')
-    df = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\Requirement_Template_2.xlsx")
+    df = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "Requirement_Template_2.xlsx"))
 
     # Filter the DataFrame based on the provided field name
     positive_samples = positive_samples[positive_samples['Field Name '] == fieldName]
@@ -105,7 +105,7 @@ def get_negative_examples(fieldName, className):
 
     # Read the data from the specified CSV file into a DataFrame
     directory = os.path.abspath('./')
-    negative_samples = pd.read_csv(directory + "\\Task4_Assigning_Values\\Data\\{}.csv".format(fieldName))
+    negative_samples = pd.read_csv(os.path.join(directory, "Task4_Assigning_Values", "Data", "{}.csv".format(fieldName)))
 
     # Filter the DataFrame based on the 'result' column to get negative samples
     negative_samples = negative_samples[negative_samples['result'] == 'negative']
@@ -227,7 +227,7 @@ def generate_gpt_prompt(fieldName, className):
 
     sheet = " Data & Excerpts"
     directory = os.path.abspath('./')
-    df = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\CompiledReq.xlsx", sheet_name=sheet)
+    df = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "CompiledReq.xlsx"), sheet_name=sheet)
 
     df = df[df['Field Name '] == fieldName]
     df = df[df["Class"].str.contains(className)]
@@ -235,7 +235,7 @@ def generate_gpt_prompt(fieldName, className):
     data_strings = list(set(data_strings))
     data_strings = data_strings[:20]
 
-    df_keywords = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\Keyword Dataset.xlsx")
+    df_keywords = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "Keyword Dataset.xlsx"))
     df_keywords = df_keywords[df_keywords['Field'] == fieldName]
     keywords = df_keywords["Keywords List"].tolist()
 
@@ -295,23 +295,17 @@ def extract_text_from_para(paragraph, fieldName, className):
     with open("./gpt.txt", "a") as f:
         json.dump(para_new + "\n\n\n\n\n\n", f)
 
-    # Set up OpenAI API key for authentication
-    key = ""
+    # Generate GPT-4 completion through the shared gateway, which answers repeated prompts from the cache
+    # and paces the requests according to the API quotas. The OpenAI key is read once per process.
+    directory = os.path.abspath('./')
     try:
-        directory = os.path.abspath('./')
-        key = open(directory + "\\Key.txt").readlines()[0]
-    except:
+        completion = llmGateway.chat_completion(
+            api_key_path=os.path.join(directory, "Key.txt"),
+            model="gpt-4",  # GPT-4 model for completion
+            messages=training_prompt,  # Training prompts and user messages
+        )
+    except OSError:
         print("ERROR: Reading openai Key.")
         sys.exit()
-    
-    openai.api_key = key
-
-    # Generate GPT-3 completion based on the training prompts and paragraph
-    completion = openai.ChatCompletion.create(
-        model="gpt-4",  # GPT-4 model for completion
-        messages=training_prompt,  # Training prompts and user messages
-    )
-
-    time.sleep(1.5)  # Delay to avoid immediate OpenAI request
 
     return completion  # Return the generated GPT-4 completion
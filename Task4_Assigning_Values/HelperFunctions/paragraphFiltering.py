@@ -7,6 +7,7 @@ import re  # Library for regular expressions
 import spacy  # Library for natural language processing tasks
 import pickle  # Library for object serialization
 import os
+from functools import lru_cache  # For reusing the work done on a paragraph across fields and classes
 
 # Load the English language model from spaCy for text processing
 nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
@@ -14,6 +15,10 @@ nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
 # Load the SentenceTransformer model for encoding sentences into embeddings
 model = SentenceTransformer('bert-base-nli-mean-tokens')
 
+# Number of paragraphs whose embeddings and filtering results are kept in memory. The same paragraph is filtered
+# for every field and every class it is extracted for
+paragraph_cache_size = 4096
+
 
 def clean_text(text):
     """
@@ -44,9 +49,10 @@ def clean_text(text):
     return text  # Return the cleaned and processed text
 
 
+@lru_cache(maxsize=paragraph_cache_size)
 def generate_embeddings(text):
     """
-    Generates embeddings for a given text.
+    Generates embeddings for a given text. The embeddings of a text are computed once and reused.
 
     Parameters:
     - text (str): The input text to generate embeddings for.
@@ -61,9 +67,27 @@ def generate_embeddings(text):
 
 
 
+@lru_cache(maxsize=None)
+def load_filtering_model(field):
+    """
+    Loads the pre-trained filtering model of a field, once per field.
+
+    Parameters:
+    - field (str): The field used for filtering.
+
+    Returns:
+    - The model, with a predict_proba method.
+    """
+    directory = os.path.abspath('./')
+    with open(os.path.join(directory, "Task4_Assigning_Values", "FilteringModels", field + '.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+@lru_cache(maxsize=paragraph_cache_size)
 def filter_paragraphs(para, field):
     """
-    Filters a paragraph based on a specified field using a pre-trained model.
+    Filters a paragraph based on a specified field using a pre-trained model. The result of a paragraph and field
+    is computed once and reused.
 
     Parameters:
     - para (str): The input paragraph to be filtered.
@@ -73,12 +97,9 @@ def filter_paragraphs(para, field):
     - result[0][1]: The filtered result based on the specified field.
     """
 
-    # Open the pre-trained model corresponding to the specified field
-    directory = os.path.abspath('./')
-    with open(directory + '\\Task4_Assigning_Values\\FilteringModels\\'+field+'.pkl', 'rb') as f:
-        model = pickle.load(f)  # Load the pre-trained model
-        f.close()  # Close the file stream
-    
+    # The pre-trained model corresponding to the specified field
+    model = load_filtering_model(field)
+
     embeddings = generate_embeddings(para)  # Generate embeddings for the paragraph
     
     # Predict the probability of filtering for the provided embeddings
@@ -1,5 +1,4 @@
 # Import necessary libraries and modules
-from pymongo import MongoClient  # For MongoDB connectivity
 import pandas as pd  # For data manipulation and analysis
 from .HelperFunctions import paragraphFiltering, gptTextExtraction, bertValueAssignment  # Custom helper functions
 import re  # For regular expressions
@@ -7,6 +6,8 @@ from unicodedata import normalize  # For text normalization
 from sklearn.metrics.pairwise import cosine_similarity  # For cosine similarity calculation
 from sentence_transformers import SentenceTransformer  # For encoding sentences into vectors
 import os
+from CommonHelpers import mongoClient  # Shared pooled MongoDB client
+from CommonHelpers import paragraphStore  # For the Task 3 documents referencing their paragraphs
 
 # Load a pre-trained SentenceTransformer model for sentence encoding
 model = SentenceTransformer('bert-base-nli-mean-tokens')
@@ -25,7 +26,7 @@ time_intervals = {
 
 # Loading MongoDB connection string
 directory = os.path.abspath('./')
-with open (directory + "\\mongodbConnectionParameters.txt", "r") as myfile:
+with open (os.path.join(directory, "mongodbConnectionParameters.txt"), "r") as myfile:
     dataString = myfile.read().split('\n')
     os.environ['MONGODB_CONNECTION_STRING'] = dataString[0]
     os.environ['MONGODB_DATABASE'] = dataString[1]
@@ -118,7 +119,7 @@ def get_closest_extracted_string(extractedTexts, fieldName, className):
 
     # Reads data from the specified Excel file and filters it by the given field name
     directory = os.path.abspath('./')
-    actual_df = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\CompiledReq.xlsx")
+    actual_df = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "CompiledReq.xlsx"))
     FIELD_NAME = os.environ.get('MONGODB_CONNECTION_STRING')
     actual_df = actual_df[actual_df[FIELD_NAME] == fieldName]
 
@@ -283,7 +284,7 @@ def assignValues(rfId):
         mongo_database = os.environ.get('MONGODB_DATABASE')
     except:
         print("ERROR: The environment variables for MongoDB connection are not defined.")
-    client = MongoClient(mongo_connection_string)
+    client = mongoClient.get_client(mongo_connection_string)
 
     # Retrieve data from Task2_Demo collection
     collection = client.broadridge["Task2_Demo"]
@@ -293,9 +294,12 @@ def assignValues(rfId):
     paragraphs_collection = client.broadridge["Task3_Extract"]
     paragraphs_document = paragraphs_collection.find_one({"RFID": rfId})
 
+    # Task 3 documents written with the paragraph store reference their paragraphs; put the texts back in place
+    paragraphs_document = paragraphStore.resolve_document(paragraphs_document, client.broadridge)
+
     # Read data from an Excel file and filter based on the provided rfId
     directory = os.path.abspath('./')
-    df = pd.read_excel(directory + "\\Task4_Assigning_Values\\Data\\Requirement_Template.xlsx")
+    df = pd.read_excel(os.path.join(directory, "Task4_Assigning_Values", "Data", "Requirement_Template.xlsx"))
     df.columns = df.iloc[0]
     df = df.drop(df.index[0])
     df = df[df['RFID'] == int(rfId)]